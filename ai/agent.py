@@ -1,6 +1,6 @@
 import os
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 def _fallback_analysis(alert_row, shap_top: Dict[str, Any], raw_context) -> Dict[str, Any]:
     score = float(alert_row.get("anom.score", 0.0))
@@ -40,25 +40,17 @@ def _fallback_analysis(alert_row, shap_top: Dict[str, Any], raw_context) -> Dict
         "markdown": md,
     }
 
-def analyze_alert(alert_row, shap_top: Dict[str, Any], raw_context) -> Dict[str, Any]:
-    """
-    Returns a dict with fields: created_at, risk_level, score, reason, iocs[], actions[], markdown.
-    Tries Gemini if available via GEMINI_API_KEY, otherwise falls back to offline heuristic.
-    """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        return _fallback_analysis(alert_row, shap_top, raw_context)
-
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
+def _gemini_analysis(alert_row, shap_top: Dict[str, Any], raw_context, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Một lời gọi Gemini (blocking); lỗi được ném ra để lớp gọi quyết định fallback."""
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-        # Build compact prompt
-        score = float(alert_row.get("anom.score", 0.0))
-        top_feats = shap_top.get("top_features", []) if shap_top else []
-        ctx_rows = raw_context.head(50).to_dict(orient="records") if hasattr(raw_context, "head") else []
+    # Build compact prompt
+    score = float(alert_row.get("anom.score", 0.0))
+    top_feats = shap_top.get("top_features", []) if shap_top else []
+    ctx_rows = raw_context.head(50).to_dict(orient="records") if hasattr(raw_context, "head") else []
 
-        prompt = f"""
+    prompt = f"""
 You are a SOC analyst. Summarize this anomaly and produce JSON with keys
 [risk_level (LOW/MEDIUM/HIGH), reason, iocs (list of {{type,value}}), actions (list of strings)],
 then provide a short markdown narrative.
@@ -70,27 +62,37 @@ ContextSample: {ctx_rows[:10]}
 Return JSON first, then a markdown section delimited by <<<MD ... MD>>>.
 """
 
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        resp = model.generate_content(prompt)
-        text = resp.text or ""
-        # Very light parsing: find JSON block
-        import json, re
-        m = re.search(r"\{.*\}", text, re.S)
-        data = _fallback_analysis(alert_row, shap_top, raw_context)
-        if m:
-            try:
-                parsed = json.loads(m.group(0))
-                data.update({
-                    "risk_level": parsed.get("risk_level", data["risk_level"]),
-                    "reason": parsed.get("reason", data["reason"]),
-                    "iocs": parsed.get("iocs", data["iocs"]),
-                    "actions": parsed.get("actions", data["actions"]),
-                })
-            except Exception:
-                pass
-        m2 = re.search(r"<<<MD(.*?)MD>>>", text, re.S)
-        if m2:
-            data["markdown"] = m2.group(1).strip()
-        return data
-    except Exception:
-        return _fallback_analysis(alert_row, shap_top, raw_context)
\ No newline at end of file
+    model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+    request_options = {"timeout": timeout} if timeout else None
+    resp = model.generate_content(prompt, request_options=request_options)
+    text = resp.text or ""
+    # Very light parsing: find JSON block
+    import json, re
+    m = re.search(r"\{.*\}", text, re.S)
+    data = _fallback_analysis(alert_row, shap_top, raw_context)
+    if m:
+        try:
+            parsed = json.loads(m.group(0))
+            data.update({
+                "risk_level": parsed.get("risk_level", data["risk_level"]),
+                "reason": parsed.get("reason", data["reason"]),
+                "iocs": parsed.get("iocs", data["iocs"]),
+                "actions": parsed.get("actions", data["actions"]),
+            })
+        except Exception:
+            pass
+    m2 = re.search(r"<<<MD(.*?)MD>>>", text, re.S)
+    if m2:
+        data["markdown"] = m2.group(1).strip()
+    return data
+
+
+def analyze_alert(alert_row, shap_top: Dict[str, Any], raw_context) -> Dict[str, Any]:
+    """
+    Returns a dict with fields: created_at, risk_level, score, reason, iocs[], actions[], markdown.
+    Tries Gemini if available via GEMINI_API_KEY, otherwise falls back to offline heuristic.
+    Goes through ai.service (disk cache, timeout); nhiều alert cùng lúc: ai.service.analyze_alerts.
+    """
+    from ai.service import analyze_alerts
+
+    return analyze_alerts([(alert_row, shap_top, raw_context)])[0]
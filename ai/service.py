@@ -0,0 +1,134 @@
+"""Lớp phân tích AI cho nhiều alert (Tiếng Việt)
+
+- Backend chọn bằng AI_BACKEND: "gemini" (mặc định khi có GEMINI_API_KEY) hoặc "offline"
+  (heuristic ai.agent._fallback_analysis, không gọi mạng; dùng cho test/demo)
+- Gọi song song bằng asyncio: tối đa AI_CONCURRENCY lời gọi cùng lúc, token bucket AI_RATE_PER_MIN
+  (burst = AI_CONCURRENCY), mỗi lời gọi bị cắt sau AI_TIMEOUT_S giây -> fallback heuristic
+- Kết quả LLM được cache trên đĩa (<cache_dir>/ai_analysis/<fingerprint>.json), fingerprint là
+  sha256 của backend + alert row + top features + mẫu ngữ cảnh: alert lặp lại không tốn thêm round-trip
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ai.agent import _fallback_analysis, _gemini_analysis
+from models.utils import get_paths
+
+CONTEXT_SAMPLE_ROWS = 10  # như ContextSample trong prompt
+
+Request = Tuple[Any, Dict[str, Any], Any]  # (alert_row, shap_top, raw_context)
+
+
+def _backend() -> str:
+    default = "gemini" if os.getenv("GEMINI_API_KEY") else "offline"
+    return os.getenv("AI_BACKEND", default).lower()
+
+
+def _cache_dir() -> Path:
+    return Path(get_paths()["cache_dir"]) / "ai_analysis"
+
+
+def analysis_fingerprint(alert_row, shap_top: Optional[Dict[str, Any]], raw_context, backend: str) -> str:
+    row = alert_row.to_dict() if hasattr(alert_row, "to_dict") else dict(alert_row)
+    ctx = raw_context.head(CONTEXT_SAMPLE_ROWS).to_dict(orient="records") if hasattr(raw_context, "head") else []
+    key = {
+        "backend": backend,
+        "model": os.getenv("GEMINI_MODEL", "gemini-1.5-flash") if backend == "gemini" else None,
+        "row": row,
+        "top_features": (shap_top or {}).get("top_features", []),
+        "context": ctx,
+    }
+    blob = json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def _cache_get(fp: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_cache_dir() / f"{fp}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_put(fp: str, data: Dict[str, Any]) -> None:
+    d = _cache_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    tmp = d / f"{fp}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp, d / f"{fp}.json")
+
+
+class TokenBucket:
+    """rate token mỗi giây, tối đa capacity token; acquire() chờ đến khi có token."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _analyze_one(req: Request, backend: str, sem: asyncio.Semaphore, bucket: TokenBucket,
+                       timeout: float, executor: ThreadPoolExecutor) -> Dict[str, Any]:
+    alert_row, shap_top, raw_context = req
+    if backend != "gemini":
+        return _fallback_analysis(alert_row, shap_top, raw_context)
+    fp = analysis_fingerprint(alert_row, shap_top, raw_context, backend)
+    hit = await asyncio.to_thread(_cache_get, fp)
+    if hit is not None:
+        return hit
+    async with sem:
+        await bucket.acquire()
+        try:
+            call = asyncio.get_running_loop().run_in_executor(
+                executor, _gemini_analysis, alert_row, shap_top, raw_context, timeout
+            )
+            data = await asyncio.wait_for(call, timeout)
+        except Exception:
+            # lỗi / quá thời gian: heuristic, không cache để lần sau thử lại LLM
+            return _fallback_analysis(alert_row, shap_top, raw_context)
+    await asyncio.to_thread(_cache_put, fp, data)
+    return data
+
+
+async def analyze_alerts_async(requests: Sequence[Request]) -> List[Dict[str, Any]]:
+    backend = _backend()
+    concurrency = max(1, int(os.getenv("AI_CONCURRENCY", "4")))
+    rate = float(os.getenv("AI_RATE_PER_MIN", "60")) / 60.0
+    timeout = float(os.getenv("AI_TIMEOUT_S", "30"))
+    sem = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, concurrency)
+    # Executor riêng: lời gọi quá hạn không giữ asyncio.run() chờ thread của nó kết thúc
+    executor = ThreadPoolExecutor(max_workers=2 * concurrency)
+    try:
+        return list(await asyncio.gather(
+            *(_analyze_one(r, backend, sem, bucket, timeout, executor) for r in requests)
+        ))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def analyze_alerts(requests: Sequence[Request]) -> List[Dict[str, Any]]:
+    """Phân tích một lô (alert_row, shap_top, raw_context), trả về theo thứ tự đầu vào."""
+    if not requests:
+        return []
+    return asyncio.run(analyze_alerts_async(requests))
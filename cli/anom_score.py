@@ -1,3 +1,5 @@
+from typing import List
+
 import typer
 
 app = typer.Typer(help="Loganom AI demo CLI")
@@ -25,23 +27,197 @@ def cmd_featurize():
     typer.echo("[featurize] Done.")
 
 @app.command("train")
-def cmd_train():
+def cmd_train(candidate: bool = typer.Option(False, "--candidate", help="Register as shadow candidate instead of current")):
     from models.train_if import train_model
-    train_model()
+    train_model(candidate=candidate)
     typer.echo("[train] Done.")
 
 @app.command("score")
-def cmd_score():
+def cmd_score(
+    full: bool = typer.Option(False, "--full", help="Rescore every partition, even unchanged ones"),
+    shadow: bool = typer.Option(False, "--shadow", help="Also score with the candidate model"),
+):
     from models.infer import score_features
-    out = score_features()
+    out = score_features(full=full, shadow=shadow)
     typer.echo(f"[score] Wrote: {out}")
 
+@app.command("rollup")
+def cmd_rollup(full: bool = typer.Option(False, "--full", help="Recompute every partition, even unchanged ones")):
+    from pipeline.rollup import build_rollups
+    stat = build_rollups(full=full)
+    typer.echo(f"[rollup] Done: {stat['buckets']:,} buckets written.")
+
+@app.command("serve")
+def cmd_serve(
+    host: str = typer.Option("127.0.0.1", "--host"),
+    port: int = typer.Option(8765, "--port"),
+    unix_socket: str = typer.Option(None, "--socket", help="Listen on a Unix socket instead of TCP"),
+    max_batch: int = typer.Option(None, "--max-batch", help="Max rows per micro-batch (SERVE_MAX_BATCH)"),
+    max_wait_ms: float = typer.Option(None, "--max-wait-ms", help="Max wait to fill a micro-batch (SERVE_MAX_WAIT_MS)"),
+):
+    from models.serve import serve
+    serve(host, port, unix_socket, max_batch, max_wait_ms)
+
+@app.command("stream")
+def cmd_stream(
+    source: List[str] = typer.Option([], "--source", help="kind=path, kind in ecs|windows_evtx|sysmon|zeek_conn (repeatable; default: raw *.jsonl)"),
+    once: bool = typer.Option(False, "--once", help="Stop when all sources are drained instead of following them"),
+    batch_rows: int = typer.Option(None, help="Max events per micro-batch (default STREAM_BATCH_ROWS=5000)"),
+    batch_ms: float = typer.Option(None, help="Max wait to fill a micro-batch (default STREAM_BATCH_MS=500)"),
+    reset: bool = typer.Option(False, "--reset", help="Ignore the checkpoint and start from the beginning"),
+):
+    from pipeline.stream import run_stream
+    sources = {}
+    for s in source:
+        kind, _, path = s.partition("=")
+        if not path:
+            raise typer.BadParameter(f"Expected kind=path, got {s!r}")
+        sources[path] = kind.strip()
+    stats = run_stream(sources or None, follow=not once, reset=reset, batch_rows=batch_rows, batch_ms=batch_ms)
+    typer.echo(f"[stream] {stats['events']:,} event(s), {stats['alerts']:,} alert(s) in {stats['batches']} batch(es)")
+
+@app.command("models")
+def cmd_models():
+    from models.registry import list_versions
+    versions = list_versions()
+    if not versions:
+        typer.echo("[models] Registry is empty.")
+    for m in versions:
+        training = m.get("training", {})
+        typer.echo(
+            f"{m['version']}  {m.get('role', ''):9s}  rows={training.get('rows', '?')}  "
+            f"fit={training.get('fit_seconds', 0.0):.2f}s  features={len(m.get('feature_cols', []))}"
+        )
+
+@app.command("promote")
+def cmd_promote(version: str = typer.Argument(None, help="Version to make current (default: candidate)")):
+    from models.registry import promote
+    typer.echo(f"[promote] current -> {promote(version)}")
+
+@app.command("bench-forest")
+def cmd_bench_forest(rows: int = typer.Option(10_000_000, help="Number of rows to score")):
+    from models.flat_forest import benchmark
+    res = benchmark(rows=rows)
+    typer.echo(f"[bench-forest] rows={rows}")
+    typer.echo(f"  sklearn: {res['sklearn_seconds']:.2f}s ({res['sklearn_rows_per_sec']:,.0f} rows/s)")
+    typer.echo(f"  flat   : {res['flat_seconds']:.2f}s ({res['flat_rows_per_sec']:,.0f} rows/s)")
+    typer.echo(f"  speedup: {res['speedup']:.2f}x, bit-identical: {bool(res['bit_identical'])}")
+
+@app.command("benchmark")
+def cmd_benchmark(
+    n_estimators: str = typer.Option("50,100,150", help="Comma-separated n_estimators grid"),
+    max_samples: str = typer.Option("128,256,auto", help="Comma-separated max_samples grid"),
+    subset: List[str] = typer.Option([], help="Feature subset as name=col1,col2 (repeatable)"),
+    rows: int = typer.Option(200_000, help="Rows in the fixed benchmark dataset"),
+    top_n: int = typer.Option(100, help="Top alerts used for score stability"),
+):
+    import pandas as pd
+    from models.sweep import run_sweep
+    subsets = {}
+    for s in subset:
+        name, _, cols = s.partition("=")
+        subsets[name.strip()] = [c.strip() for c in cols.split(",") if c.strip()]
+    table = run_sweep(
+        n_estimators=[int(x) for x in n_estimators.split(",") if x.strip()],
+        max_samples=[x.strip() for x in max_samples.split(",") if x.strip()],
+        feature_subsets=subsets or None,
+        rows=rows,
+        top_n=top_n,
+    )
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        typer.echo(table.round(3).to_string(index=False))
+    typer.echo(f"[benchmark] {table.attrs['rows']} rows; results: {table.attrs['path']}")
+
+@app.command("synth")
+def cmd_synth(
+    out: str = typer.Option(None, "--out", help="Output directory (default: raw_data_dir, picked up by demo)"),
+    events: int = typer.Option(1_000_000, help="Number of normal events (attack events come on top)"),
+    hosts: int = typer.Option(200, help="Number of hosts"),
+    users: int = typer.Option(500, help="Number of users"),
+    days: float = typer.Option(7.0, help="Time span in days"),
+    seed: int = typer.Option(42, help="Random seed (same seed and options -> same files)"),
+    attacks: int = typer.Option(None, help="Number of injected attacks (default: max(5, events / 200k))"),
+):
+    from pathlib import Path
+    from models.utils import get_paths
+    from pipeline.synth import generate
+    out = out or get_paths()["raw_data_dir"]
+    res = generate(Path(out), events=events, hosts=hosts, users=users, days=days, seed=seed, attacks=attacks)
+    for source, n in res["per_source"].items():
+        typer.echo(f"  {source:<13} {n:>12,}  {res['files'][source]}")
+    typer.echo(f"[synth] {res['events']:,} events, {res['attacks']} attack(s), {res['bytes'] / 2**20:,.1f} MB in {out}")
+    if res["syslog_year"] is not None:
+        typer.echo(f"[synth] auth.log has no year: ingest with SYSLOG_DEFAULT_YEAR={res['syslog_year']} TZ=UTC")
+
+@app.command("bench-pipeline")
+def cmd_bench_pipeline(
+    events: int = typer.Option(1_000_000, help="Number of synthetic events"),
+    hosts: int = typer.Option(200, help="Number of hosts"),
+    users: int = typer.Option(500, help="Number of users"),
+    days: float = typer.Option(7.0, help="Time span in days"),
+    seed: int = typer.Option(42, help="Random seed"),
+    workdir: str = typer.Option(None, "--workdir", help="Working directory (default: temporary, removed afterwards)"),
+    keep: bool = typer.Option(False, "--keep", help="Keep the temporary working directory"),
+):
+    from pathlib import Path
+    import pandas as pd
+    from pipeline.benchmark import run_pipeline_benchmark
+    table = run_pipeline_benchmark(events=events, hosts=hosts, users=users, days=days, seed=seed,
+                                   workdir=Path(workdir) if workdir else None, keep=keep)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        typer.echo(table.round(3).to_string(index=False))
+    typer.echo(f"[bench-pipeline] {table.attrs['events']:,} events, pipeline {table.attrs['pipeline_seconds']:.1f}s; "
+               f"results: {table.attrs['path']}")
+
+@app.command("bench-imports")
+def cmd_bench_imports(
+    repeats: int = typer.Option(5, help="Fresh interpreters per target (the minimum is reported)"),
+    budget_ms: float = typer.Option(None, "--budget-ms", help="Fail if --help or a UI page import exceeds this"),
+):
+    import pandas as pd
+    from pipeline.benchmark import run_import_benchmark
+    table = run_import_benchmark(repeats=repeats, budget_ms=budget_ms)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.max_colwidth", 80):
+        typer.echo(table.round(1).to_string(index=False))
+    typer.echo(f"[bench-imports] results: {table.attrs['path']}")
+    over = table.loc[table["over_budget"], "target"].tolist()
+    if over:
+        typer.echo(f"[bench-imports] over budget ({budget_ms:.0f} ms): {', '.join(over)}", err=True)
+        raise typer.Exit(code=1)
+
+@app.command("profile")
+def cmd_profile(
+    run: str = typer.Option(None, "--run", help="Run id to summarize (default: latest run)"),
+    stage: str = typer.Option(None, "--stage", help="Run one pipeline stage (e.g. featurize, score) under a profiler"),
+    profiler: str = typer.Option("cprofile", "--profiler", help="cprofile | sample"),
+    top: int = typer.Option(25, help="Functions to show in the profile"),
+):
+    import pandas as pd
+    from pipeline.profiling import profile_call, run_id, summarize
+    if stage:
+        from pipeline.dag import pipeline_stages
+        stages = {s.name: s for s in pipeline_stages()}
+        if stage not in stages:
+            raise typer.BadParameter(f"Unknown stage {stage!r}; choose from {', '.join(stages)}")
+        _, report = profile_call(stages[stage].func, profiler=profiler, top=top)
+        typer.echo(report)
+        run = run_id()
+    table = summarize(run)
+    if table.empty:
+        typer.echo("[profile] No metrics recorded yet.")
+        return
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        typer.echo(table.round(3).to_string(index=False))
+    typer.echo(f"[profile] run {table.attrs['run_id']}")
+
 @app.command("demo")
-def cmd_demo():
-    cmd_ingest()
-    cmd_featurize()
-    cmd_train()
-    cmd_score()
+def cmd_demo(
+    force: List[str] = typer.Option([], "--force", help="Stage to rerun even if up to date (repeatable, e.g. train)"),
+):
+    from pipeline.dag import run_pipeline
+    result = run_pipeline(force=force)
+    ran = [k for k, v in result.items() if v == "ran"]
+    typer.echo(f"[demo] Done: {len(ran)} stage(s) ran, {len(result) - len(ran)} up to date.")
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Giải thích nhanh bằng đường đi trong cây (không cần shap)
+
+Với mỗi dòng, duyệt đồng thời mọi cây của FlatForest theo từng tầng (như khi chấm điểm);
+trong mỗi cây, mọi split trên đường từ gốc tới lá của dòng cộng cho feature của nó
+trọng số 1 / (độ sâu + 1): feature cô lập dòng sớm (gần gốc) và thường xuyên (nhiều split,
+nhiều cây) được điểm cao. Tổng theo đường đi tính sẵn cho từng node (một lần mỗi lần gọi).
+Kết quả chia cho số cây, cùng định dạng {"top_features": [...]} với explain.shap_explain.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from models.flat_forest import FlatForest, _row_view
+
+
+def _as_flat(model) -> FlatForest:
+    return model if isinstance(model, FlatForest) else FlatForest.from_model(model)
+
+
+def rank_features(values: np.ndarray, feature_names: List[str], top_k: int, note: Optional[str] = None) -> List[Dict]:
+    """top_k feature theo |giá trị| của từng dòng -> {"top_features": [...]} (dùng chung với SHAP)."""
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    order = np.argsort(-np.abs(values), axis=1)[:, :top_k]
+    out: List[Dict] = []
+    for row_vals, idx in zip(values, order):
+        item = {"top_features": [{"feature": feature_names[i], "value": float(row_vals[i])} for i in idx]}
+        if note:
+            item["note"] = note
+        out.append(item)
+    return out
+
+
+def _path_credit(flat: FlatForest) -> np.ndarray:
+    """
+    credit[n, f]: tổng 1 / (độ sâu split + 1) của các split trên feature f từ gốc tới node n
+    (node gốc và lá là gốc không có split nào: hàng 0).
+    """
+    n_nodes = len(flat.feature)
+    ids = np.arange(n_nodes, dtype=flat.children.dtype)
+    left, right = flat.children[0::2], flat.children[1::2]
+    is_split = left != ids  # lá tự trỏ về chính nó (xem export_flat_forest)
+    credit = np.zeros((n_nodes, flat.n_features), dtype=np.float64)
+    level = flat.roots
+    for depth in range(flat.n_levels):
+        level = level[is_split[level]]
+        if not len(level):
+            break
+        inc = credit[level]
+        inc[np.arange(len(level)), flat.feature[level]] += 1.0 / (depth + 1.0)
+        credit[left[level]] = inc
+        credit[right[level]] = inc
+        level = np.concatenate([left[level], right[level]])
+    return credit
+
+
+def _attribute_batch(flat: FlatForest, credit: np.ndarray, Xb: np.ndarray) -> np.ndarray:
+    m, k = Xb.shape
+    node = np.repeat(flat.roots[:, None], m, axis=1)
+    row_base = np.arange(m, dtype=np.int32) * np.int32(k)
+    xflat = Xb.ravel()
+    for _ in range(flat.n_levels):  # cùng cách duyệt với FlatForest._depths
+        xv = np.take(xflat, row_base + np.take(flat.feature, node))
+        go_right = xv > np.take(flat.threshold, node)
+        node = np.take(flat.children, 2 * node + go_right)
+    contrib = np.zeros((m, k), dtype=np.float64)
+    for t in range(len(flat.roots)):
+        contrib += credit[node[t]]
+    return contrib / len(flat.roots)
+
+
+def path_attributions(model, X, batch_rows: int = 4096) -> np.ndarray:
+    """Ma trận (n, n_features) điểm đóng góp; X đã scale giống lúc chấm điểm."""
+    flat = _as_flat(model)
+    X = np.ascontiguousarray(X, dtype=np.float32)  # cùng kiểu với FlatForest.score_samples
+    if X.ndim != 2 or X.shape[1] != flat.n_features:
+        raise ValueError(f"Expected {flat.n_features} features, got shape {X.shape}")
+
+    # Dòng trùng nhau cho cùng kết quả: chỉ tính một lần
+    inverse = None
+    if len(X) > batch_rows:
+        probe = _row_view(X[:batch_rows])
+        if len(np.unique(probe)) < 0.5 * len(probe):
+            uniq, inverse = np.unique(_row_view(X), return_index=True, return_inverse=True)[1:]
+            X = X[uniq]
+
+    credit = _path_credit(flat)
+    out = np.empty(X.shape, dtype=np.float64)
+    for start in range(0, len(X), batch_rows):
+        out[start:start + batch_rows] = _attribute_batch(flat, credit, X[start:start + batch_rows])
+    return out[inverse.ravel()] if inverse is not None else out
+
+
+def top_feature_names(model, X, feature_names: List[str], top_k: int = 3) -> List[str]:
+    """
+    Tên top_k feature mỗi dòng, nối bằng dấu phẩy (gọn để lưu thành một cột khi chấm điểm);
+    bỏ feature không nằm trên đường đi của dòng trong cây nào.
+    """
+    contrib = path_attributions(model, X)
+    order = np.argsort(-contrib, axis=1, kind="stable")[:, :top_k]
+    order[np.take_along_axis(contrib, order, axis=1) <= 0] = -1
+    # Ít tổ hợp phân biệt: mã hoá mỗi tổ hợp thành một số nguyên, dựng chuỗi một lần cho mỗi mã
+    base = len(feature_names) + 1
+    codes = np.zeros(len(order), dtype=np.int64)
+    for j in range(order.shape[1]):
+        codes = codes * base + (order[:, j] + 1)
+    uniq, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    labels = np.asarray(
+        [",".join(feature_names[i] for i in order[r] if i >= 0) for r in first], dtype=object
+    )
+    return labels[inverse.ravel()].tolist()
+
+
+def explain_rows_path(rows: pd.DataFrame, top_k: int = 5, payload: Optional[Dict] = None) -> List[Dict]:
+    """Giống explain.shap_explain.explain_rows nhưng dùng path attribution."""
+    from models.infer import _prepare_features
+    from models.model_store import load_model_payload
+
+    payload = payload if payload is not None else load_model_payload()
+    if rows.empty:
+        return []
+    feature_cols = payload["feature_cols"]
+    X = _prepare_features(rows, feature_cols).to_numpy(dtype=np.float64)
+    scaler = payload.get("scaler")
+    Xs = scaler.transform(X) if scaler is not None else X
+    flat = payload.get("flat_forest")
+    model = FlatForest(flat) if flat else payload["model"]
+    out = rank_features(path_attributions(model, Xs), feature_cols, top_k)
+    for item in out:
+        item["method"] = "path_attribution"
+    return out
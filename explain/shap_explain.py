@@ -1,46 +1,129 @@
-from typing import Dict, List
+"""Giải thích SHAP cho các dòng bị chấm điểm cao
+
+- Explainer được cache trong process theo fingerprint model (train lại -> tạo explainer mới)
+- explain_rows: giải thích cả lô alert trong một lời gọi vectorized
+- Background cho KernelExplainer lấy từ mẫu feature lúc train (payload["background"], đã scale);
+  model cũ không có thì rút mẫu nhỏ từ data/features
+- Không có shap (hoặc EXPLAIN_METHOD=path): dùng explain.path_attribution (đóng góp theo đường đi trong cây)
+"""
 
 import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
 import numpy as np
+import pandas as pd
 
+from explain.path_attribution import explain_rows_path, rank_features
 
-def top_shap_for_rows(model, X, feature_names: List[str], top_k: int = 5) -> List[Dict]:
-    # Try to import shap lazily with JIT disabled to avoid llvmlite/numba issues
-    try:
-        os.environ.setdefault("NUMBA_DISABLE_JIT", "1")
-        os.environ.setdefault("SHAP_DISABLE_JIT", "1")
-        import shap  # type: ignore
+BACKGROUND_ROWS = int(os.getenv("SHAP_BACKGROUND_ROWS", "100"))
+
+# fingerprint -> (model, explainer); chỉ giữ explainer của model dùng gần nhất
+_EXPLAINERS: Dict[str, Tuple[object, object]] = {}
+_LOCK = threading.Lock()
+
+
+def _import_shap():
+    # Import shap lazily with JIT disabled to avoid llvmlite/numba issues
+    os.environ.setdefault("NUMBA_DISABLE_JIT", "1")
+    os.environ.setdefault("SHAP_DISABLE_JIT", "1")
+    import shap  # type: ignore
+
+    return shap
+
+
+def _background_from_features(feature_cols: List[str], scaler, n: int, seed: int = 42) -> np.ndarray:
+    """Mẫu feature đã scale cho model cũ chưa lưu background (đọc vài partition, chỉ các cột cần)."""
+    from models.utils import get_paths
+
+    import pyarrow.parquet as pq
+
+    feat_root = Path(get_paths()["features_dir"])
+    sources = [feat_root / "features.parquet"]
+    if not sources[0].exists():
+        sources = sorted(feat_root.glob("dt=*/part.parquet"))
+    rng = np.random.default_rng(seed)
+    sources = [sources[i] for i in sorted(rng.permutation(len(sources))[:16])] if len(sources) > 16 else sources
+    frames = []
+    for p in sources:
+        present = set(pq.read_schema(p).names)
+        df = pd.read_parquet(p, columns=[c for c in feature_cols if c in present])
+        frames.append(pd.DataFrame({c: pd.to_numeric(df[c], errors="coerce") if c in df.columns else 0.0
+                                    for c in feature_cols}))
+    if not frames:
+        raise FileNotFoundError(f"No features under {feat_root} for SHAP background")
+    X = pd.concat(frames, ignore_index=True).fillna(0.0).to_numpy(dtype=np.float64)
+    if len(X) > n:
+        X = X[rng.choice(len(X), n, replace=False)]
+    return scaler.transform(X) if scaler is not None else X
 
+
+def _background(payload: Dict) -> np.ndarray:
+    bg = payload.get("background")
+    if bg is not None and len(bg):
+        return np.asarray(bg)
+    return _background_from_features(payload["feature_cols"], payload.get("scaler"), BACKGROUND_ROWS)
+
+
+def get_explainer(payload: Dict, fingerprint: str):
+    """TreeExplainer (hoặc KernelExplainer trên background) dùng lại cho mọi lời gọi cùng model."""
+    model = payload["model"]
+    with _LOCK:
+        hit = _EXPLAINERS.get(fingerprint)
+        if hit is not None and hit[0] is model:
+            return hit[1]
+        shap = _import_shap()
         try:
             explainer = shap.TreeExplainer(model)
-            shap_values = explainer.shap_values(X)
-            values = shap_values if isinstance(shap_values, np.ndarray) else shap_values.values
         except Exception:
             # KernelExplainer fallback (slower, but works on CPU and avoids tree specifics)
-            explainer = shap.KernelExplainer(model.decision_function, X[: min(50, len(X))])
-            values = explainer.shap_values(X, nsamples=50)
-
-        if isinstance(values, list):
-            values = values[0]
-
-        out: List[Dict] = []
-        for row_vals in values:
-            idx = np.argsort(-np.abs(row_vals))[:top_k]
-            features = [
-                {"feature": feature_names[i], "value": float(row_vals[i])}
-                for i in idx
-            ]
-            out.append({"top_features": features})
-        return out
+            explainer = shap.KernelExplainer(model.decision_function, _background(payload))
+        _EXPLAINERS.clear()
+        _EXPLAINERS[fingerprint] = (model, explainer)
+        return explainer
+
 
+def _shap_values(explainer, X: np.ndarray) -> np.ndarray:
+    shap = _import_shap()
+    if isinstance(explainer, shap.KernelExplainer):
+        values = explainer.shap_values(X, nsamples=50)
+    else:
+        values = explainer.shap_values(X)
+    if isinstance(values, list):
+        values = values[0]
+    return values if isinstance(values, np.ndarray) else values.values
+
+
+def explain_rows(rows: pd.DataFrame, top_k: int = 5, payload: Optional[Dict] = None,
+                 fingerprint: Optional[str] = None, method: Optional[str] = None) -> List[Dict]:
+    """
+    Giải thích tất cả các dòng (vd. top alert) trong một lần gọi explainer.
+    Feature được scale giống lúc chấm điểm; trả về list {"top_features": [...]} theo thứ tự dòng.
+    method: "shap" (mặc định, EXPLAIN_METHOD) hoặc "path" (path attribution, không cần shap).
+    """
+    from models.infer import _prepare_features
+    from models.model_store import load_model_payload, model_fingerprint
+
+    if payload is None:
+        payload = load_model_payload()
+        fingerprint = fingerprint or model_fingerprint()
+    if rows.empty:
+        return []
+    method = method or os.getenv("EXPLAIN_METHOD", "shap")
+    if method == "path":
+        return explain_rows_path(rows, top_k, payload)
+
+    feature_cols = payload["feature_cols"]
+    X = _prepare_features(rows, feature_cols).to_numpy(dtype=np.float64)
+    scaler = payload.get("scaler")
+    Xs = scaler.transform(X) if scaler is not None else X
+    try:
+        explainer = get_explainer(payload, fingerprint or str(id(payload["model"])))
+        return rank_features(_shap_values(explainer, Xs), feature_cols, top_k)
     except Exception:
-        # Final fallback: rank features by absolute value in the row (not true SHAP)
-        out: List[Dict] = []
-        for row in X:
-            idx = np.argsort(-np.abs(row))[:top_k]
-            features = [
-                {"feature": feature_names[i], "value": float(row[i])}
-                for i in idx
-            ]
-            out.append({"top_features": features, "note": "fallback_no_shap"})
+        # shap không dùng được: đóng góp theo đường đi trong cây
+        out = explain_rows_path(rows, top_k, payload)
+        for item in out:
+            item["note"] = "fallback_no_shap"
         return out
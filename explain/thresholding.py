@@ -1,15 +1,39 @@
-from typing import Tuple
+"""Ngưỡng bất thường (Tiếng Việt)
+
+- compute_threshold: ngưỡng trên một Series điểm đã nạp (chế độ features.parquet)
+- ScoreSketch: histogram bin cố định trên [-1, 1] (anom.score = offset_ - score_samples luôn nằm trong khoảng này),
+  lưu thưa, cộng được với nhau -> mỗi partition ghi một sketch khi chấm điểm, ngưỡng toàn cục
+  đọc từ sketch đã gộp (scores/sketch.json) mà không nạp lại điểm
+- Sketch riêng theo host.name / user.name cho ngưỡng thích nghi từng thực thể:
+  server ồn có phân vị cao hơn nên không chiếm hết top-N
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from models.utils import load_models_config
 
+SKETCH_FILENAME = "sketch.json"
+PART_SKETCH_FILENAME = "part.sketch.json"
+ENTITY_COLS = ("host.name", "user.name")
+
+_LO, _HI, _BINS = -1.0, 1.0, 16384
+_WIDTH = (_HI - _LO) / _BINS
 
-def compute_threshold(scores: pd.Series) -> Tuple[float, int]:
-    cfg = load_models_config()
+
+def _threshold_params(cfg: Optional[Dict] = None) -> Tuple[str, float]:
+    cfg = cfg if cfg is not None else load_models_config()
     method = cfg.get("scoring", {}).get("threshold_method", "quantile")
     contamination = cfg.get("isolation_forest", {}).get("contamination", 0.05)
+    return method, float(contamination)
+
+
+def compute_threshold(scores: pd.Series, cfg: Optional[Dict] = None) -> Tuple[float, int]:
+    method, contamination = _threshold_params(cfg)
     if method == "quantile":
         thr = np.quantile(scores, 1.0 - contamination)
         count = int((scores >= thr).sum())
@@ -18,3 +42,229 @@ def compute_threshold(scores: pd.Series) -> Tuple[float, int]:
     thr = float(scores.mean() + scores.std())
     count = int((scores >= thr).sum())
     return thr, count
+
+
+def _bins(scores: np.ndarray) -> np.ndarray:
+    return np.clip(((scores - _LO) / _WIDTH).astype(np.int64), 0, _BINS - 1)
+
+
+class ScoreSketch:
+    """Histogram thưa {bin: count} + count/sum/sumsq/min/max chính xác; merge = cộng."""
+
+    def __init__(self):
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, scores: np.ndarray) -> "ScoreSketch":
+        scores = np.asarray(scores, dtype=np.float64)
+        scores = scores[~np.isnan(scores)]
+        if not len(scores):
+            return self
+        idx, cnt = np.unique(_bins(scores), return_counts=True)
+        self._add_bins(idx, cnt)
+        self.count += len(scores)
+        self.sum += float(scores.sum())
+        self.sumsq += float(np.square(scores).sum())
+        self.min = min(self.min, float(scores.min()))
+        self.max = max(self.max, float(scores.max()))
+        return self
+
+    def _add_bins(self, idx: Iterable[int], cnt: Iterable[int]) -> None:
+        for i, c in zip(idx, cnt):
+            i = int(i)
+            self.bins[i] = self.bins.get(i, 0) + int(c)
+
+    def merge(self, other: "ScoreSketch") -> "ScoreSketch":
+        self._add_bins(other.bins.keys(), other.bins.values())
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> float:
+        """
+        Phân vị xấp xỉ: cận dưới của bin chứa điểm hạng floor(q * (count - 1)), kẹp trong [min, max].
+        np.quantile nội suy giữa hạng floor và hạng kế tiếp nên luôn >= điểm hạng floor: kết quả
+        không bao giờ lớn hơn phân vị thật (ngưỡng không làm rơi alert) và thấp hơn điểm hạng floor
+        tối đa một bin (2/16384).
+        """
+        if self.count == 0:
+            return float("nan")
+        idx = np.fromiter(sorted(self.bins), dtype=np.int64)
+        cnt = np.asarray([self.bins[i] for i in idx], dtype=np.float64)
+        cum = np.cumsum(cnt)
+        # hạng floor (1-based) như np.quantile; hạng lẻ có thể rơi vào bin thưa cao hơn phân vị thật
+        target = np.floor(q * (self.count - 1)) + 1
+        j = min(int(np.searchsorted(cum, target)), len(idx) - 1)
+        value = _LO + idx[j] * _WIDTH
+        return float(min(max(value, self.min), self.max))
+
+    def count_at_least(self, thr: float) -> int:
+        b = int(_bins(np.asarray([thr]))[0])
+        return int(sum(c for i, c in self.bins.items() if i >= b))
+
+    def mean_std(self) -> Tuple[float, float]:
+        if self.count < 2:
+            return (self.sum / self.count if self.count else float("nan")), 0.0
+        mean = self.sum / self.count
+        var = max(self.sumsq - self.count * mean * mean, 0.0) / (self.count - 1)
+        return mean, float(np.sqrt(var))
+
+    def to_dict(self) -> Dict:
+        idx = sorted(self.bins)
+        return {
+            "count": self.count, "sum": self.sum, "sumsq": self.sumsq,
+            "min": self.min, "max": self.max,
+            "idx": idx, "cnt": [self.bins[i] for i in idx],
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "ScoreSketch":
+        sk = cls()
+        sk.bins = dict(zip(d["idx"], d["cnt"]))
+        sk.count, sk.sum, sk.sumsq = int(d["count"]), float(d["sum"]), float(d["sumsq"])
+        sk.min, sk.max = float(d["min"]), float(d["max"])
+        return sk
+
+
+class SketchSet:
+    """Sketch toàn cục + sketch theo từng giá trị của host.name / user.name."""
+
+    def __init__(self):
+        self.global_ = ScoreSketch()
+        self.entities: Dict[str, Dict[str, ScoreSketch]] = {c: {} for c in ENTITY_COLS}
+
+    def add(self, scores: np.ndarray, entities: Optional[Dict[str, np.ndarray]] = None) -> "SketchSet":
+        scores = np.asarray(scores, dtype=np.float64)
+        self.global_.add(scores)
+        valid = ~np.isnan(scores)
+        scores = scores[valid]
+        bins = _bins(scores)
+        for col, keys in (entities or {}).items():
+            if col not in self.entities:
+                continue
+            codes, uniq = pd.factorize(pd.Series(keys, dtype=object)[valid].fillna("unknown").astype(str))
+            n = len(uniq)
+            count = np.bincount(codes, minlength=n)
+            total = np.bincount(codes, weights=scores, minlength=n)
+            total_sq = np.bincount(codes, weights=scores * scores, minlength=n)
+            lo = np.full(n, np.inf)
+            hi = np.full(n, -np.inf)
+            np.minimum.at(lo, codes, scores)
+            np.maximum.at(hi, codes, scores)
+            pairs, pair_cnt = np.unique(codes.astype(np.int64) * _BINS + bins, return_counts=True)
+            per_key = self.entities[col]
+            sketches = []
+            for j, key in enumerate(uniq):
+                sk = per_key.setdefault(key, ScoreSketch())
+                sk.count += int(count[j])
+                sk.sum += float(total[j])
+                sk.sumsq += float(total_sq[j])
+                sk.min = min(sk.min, float(lo[j]))
+                sk.max = max(sk.max, float(hi[j]))
+                sketches.append(sk)
+            for pair, c in zip(pairs.tolist(), pair_cnt.tolist()):
+                sk = sketches[pair // _BINS]
+                b = pair % _BINS
+                sk.bins[b] = sk.bins.get(b, 0) + c
+        return self
+
+    def merge(self, other: "SketchSet") -> "SketchSet":
+        self.global_.merge(other.global_)
+        for col, per_key in other.entities.items():
+            mine = self.entities.setdefault(col, {})
+            for key, sk in per_key.items():
+                mine.setdefault(key, ScoreSketch()).merge(sk)
+        return self
+
+    def to_dict(self) -> Dict:
+        return {
+            "lo": _LO, "hi": _HI, "bins": _BINS,
+            "global": self.global_.to_dict(),
+            "entities": {c: {k: sk.to_dict() for k, sk in m.items()} for c, m in self.entities.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "SketchSet":
+        if (d.get("lo"), d.get("hi"), d.get("bins")) != (_LO, _HI, _BINS):
+            raise ValueError("Sketch was written with different bin settings")
+        ss = cls()
+        ss.global_ = ScoreSketch.from_dict(d["global"])
+        for col, m in d.get("entities", {}).items():
+            ss.entities[col] = {k: ScoreSketch.from_dict(v) for k, v in m.items()}
+        return ss
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "SketchSet":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def merge_partition_sketches(scores_root: Path) -> Optional[SketchSet]:
+    """Gộp scores/dt=*/part.sketch.json thành scores/sketch.json (None nếu chưa có sketch nào)."""
+    merged: Optional[SketchSet] = None
+    for p in sorted(scores_root.glob(f"dt=*/{PART_SKETCH_FILENAME}")):
+        part = SketchSet.load(p)
+        merged = part if merged is None else merged.merge(part)
+    if merged is not None:
+        merged.save(scores_root / SKETCH_FILENAME)
+    return merged
+
+
+def load_sketch(scores_dir: Path) -> Optional[SketchSet]:
+    p = Path(scores_dir) / SKETCH_FILENAME
+    if not p.exists():
+        return None
+    try:
+        return SketchSet.load(p)
+    except (ValueError, KeyError):
+        return None
+
+
+def _sketch_threshold(sk: ScoreSketch, method: str, contamination: float) -> float:
+    if method == "quantile":
+        return sk.quantile(1.0 - contamination)
+    mean, std = sk.mean_std()
+    return mean + std
+
+
+def threshold_from_sketch(sketches: SketchSet, cfg: Optional[Dict] = None) -> Tuple[float, int]:
+    """Như compute_threshold nhưng từ sketch: chi phí không phụ thuộc số dòng đã chấm."""
+    method, contamination = _threshold_params(cfg)
+    thr = _sketch_threshold(sketches.global_, method, contamination)
+    return thr, sketches.global_.count_at_least(thr)
+
+
+def entity_thresholds(sketches: SketchSet, global_thr: float, cfg: Optional[Dict] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Ngưỡng riêng cho thực thể có đủ sự kiện (scoring.entity_min_events) và ngưỡng cao hơn ngưỡng toàn cục;
+    thực thể khác dùng ngưỡng toàn cục. Cột lấy từ scoring.adaptive_thresholds.
+    """
+    cfg = cfg if cfg is not None else load_models_config()
+    method, contamination = _threshold_params(cfg)
+    scoring = cfg.get("scoring", {})
+    cols = scoring.get("adaptive_thresholds", []) or []
+    min_events = int(scoring.get("entity_min_events", 1000))
+    out: Dict[str, Dict[str, float]] = {}
+    for col in cols:
+        per_key = {}
+        for key, sk in sketches.entities.get(col, {}).items():
+            if sk.count < min_events:
+                continue
+            thr = _sketch_threshold(sk, method, contamination)
+            if thr > global_thr:
+                per_key[key] = thr
+        out[col] = per_key
+    return out
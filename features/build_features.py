@@ -6,6 +6,14 @@ from models.utils import get_paths, ensure_dir
 from features.windowing import add_time_window_counts
 from features.entropy import shannon_entropy
 from features.sessionize import sessionize_network
+from pipeline.profiling import file_size, record
+
+# Cờ nhị phân đếm theo cửa sổ trượt (phút) cho từng thực thể; pipeline.stream dùng cùng định nghĩa
+FLAG_COLS = ["login_failed", "conn_suspicious"]
+WINDOWS_MIN = [1, 5, 15]
+WINDOW_ENTITY_COLS = ["host.name", "user.name"]
+ID_COLS = ["@timestamp", "host.name", "user.name", "source.ip", "destination.ip", "session.id"]
+
 
 def _list_sources(ecs_root: Path) -> List[str]:
     if not ecs_root.exists():
@@ -39,6 +47,79 @@ def _read_partition(ecs_root: Path, dt: str, sources: List[str]) -> pd.DataFrame
         return pd.DataFrame()
     return pd.concat(frames, ignore_index=True)
 
+def add_event_flags(ecs: pd.DataFrame) -> pd.DataFrame:
+    """Feature chỉ phụ thuộc từng sự kiện: login_failed, conn_suspicious, entropy lệnh (sửa tại chỗ)."""
+    # Bổ sung cột thiếu
+    for col in [
+        "event.code", "event.outcome", "destination.port",
+        "process.command_line", "host.name", "user.name",
+        "source.ip", "destination.ip"
+    ]:
+        if col not in ecs.columns:
+            ecs[col] = None
+
+    # Cờ sự kiện
+    ecs["login_failed"] = (
+        (ecs["event.code"].astype(str) == "4625") |
+        (ecs["event.outcome"].astype(str).str.lower() == "failure")
+    ).fillna(False).astype(int)
+
+    ecs["conn_suspicious"] = (
+        (pd.to_numeric(ecs["destination.port"], errors="coerce") == 4444) |
+        (ecs["event.outcome"].astype(str) == "S0")
+    ).fillna(False).astype(int)
+
+    # Entropy lệnh
+    ecs["process.command_line_entropy"] = ecs["process.command_line"].astype(str).apply(shannon_entropy)
+    return ecs
+
+
+def featurize_ecs(ecs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bảng ECS (một ngày, hoặc một lô sự kiện từ scoring service) -> bảng feature.
+    Giữ nguyên index gốc của từng dòng; dòng thiếu @timestamp bị loại.
+    Có thể sửa trực tiếp frame đầu vào (không copy để tiết kiệm RAM).
+    """
+    # Chuẩn hoá thời gian
+    if "@timestamp" in ecs.columns:
+        ecs["@timestamp"] = pd.to_datetime(ecs["@timestamp"], utc=True, errors="coerce")
+        ecs = ecs.dropna(subset=["@timestamp"]).sort_values("@timestamp")
+    else:
+        # Không có timestamp thì không tính được feature
+        return pd.DataFrame()
+
+    ecs = add_event_flags(ecs)
+
+    # Sessionize (an toàn với try)
+    try:
+        ecs = sessionize_network(ecs)
+    except Exception:
+        if "session.id" not in ecs.columns:
+            ecs["session.id"] = None
+
+    # Rolling counts theo host và user cho 2 cờ
+    for flag in FLAG_COLS:
+        for entity in WINDOW_ENTITY_COLS:
+            ecs = add_time_window_counts(ecs, [entity], "@timestamp", flag, WINDOWS_MIN)
+
+    # Chọn cột features đúng tên
+    feature_cols = [
+        *FLAG_COLS,
+        "process.command_line_entropy",
+    ]
+    for w in WINDOWS_MIN:
+        for flag in FLAG_COLS:
+            col = f"{flag}_count_{w}m"
+            if col in ecs.columns:
+                feature_cols.append(col)
+
+    # ID columns
+    for c in ID_COLS:
+        if c not in ecs.columns:
+            ecs[c] = None
+
+    return ecs[ID_COLS + feature_cols].copy()
+
 def build_feature_table_large(sample_per_day: int = 100_000) -> Path:
     """
     Xây features theo từng ngày (partition) để tiết kiệm RAM; xuất gộp features.parquet nhỏ.
@@ -52,88 +133,37 @@ def build_feature_table_large(sample_per_day: int = 100_000) -> Path:
     dates = _available_dates(ecs_root, sources)
 
     samples = []
-    for dt in dates:
-        ecs = _read_partition(ecs_root, dt, sources)
-        if ecs.empty:
-            continue
-
-        # Chuẩn hoá thời gian
-        if "@timestamp" in ecs.columns:
-            ecs["@timestamp"] = pd.to_datetime(ecs["@timestamp"], utc=True, errors="coerce")
-            ecs = ecs.dropna(subset=["@timestamp"]).sort_values("@timestamp")
-        else:
-            # Không có timestamp thì bỏ qua ngày này
-            continue
-
-        # Bổ sung cột thiếu
-        for col in [
-            "event.code", "event.outcome", "destination.port",
-            "process.command_line", "host.name", "user.name",
-            "source.ip", "destination.ip"
-        ]:
-            if col not in ecs.columns:
-                ecs[col] = None
-
-        # Cờ sự kiện
-        ecs["login_failed"] = (
-            (ecs["event.code"].astype(str) == "4625") |
-            (ecs["event.outcome"].astype(str).str.lower() == "failure")
-        ).fillna(False).astype(int)
-
-        ecs["conn_suspicious"] = (
-            (pd.to_numeric(ecs["destination.port"], errors="coerce") == 4444) |
-            (ecs["event.outcome"].astype(str) == "S0")
-        ).fillna(False).astype(int)
-
-        # Entropy lệnh
-        ecs["process.command_line_entropy"] = ecs["process.command_line"].astype(str).apply(shannon_entropy)
-
-        # Sessionize (an toàn với try)
-        try:
-            ecs = sessionize_network(ecs)
-        except Exception:
-            if "session.id" not in ecs.columns:
-                ecs["session.id"] = None
-
-        # Rolling counts theo host và user cho 2 cờ
-        for flag in ["login_failed", "conn_suspicious"]:
-            ecs = add_time_window_counts(ecs, ["host.name"], "@timestamp", flag, [1, 5, 15])
-            ecs = add_time_window_counts(ecs, ["user.name"], "@timestamp", flag, [1, 5, 15])
-
-        # Chọn cột features đúng tên
-        feature_cols = [
-            "login_failed",
-            "conn_suspicious",
-            "process.command_line_entropy",
-        ]
-        for w in [1, 5, 15]:
-            for flag in ["login_failed", "conn_suspicious"]:
-                col = f"{flag}_count_{w}m"
-                if col in ecs.columns:
-                    feature_cols.append(col)
-
-        # ID columns
-        id_cols = ["@timestamp", "host.name", "user.name", "source.ip", "destination.ip", "session.id"]
-        for c in id_cols:
-            if c not in ecs.columns:
-                ecs[c] = None
-
-        feat = ecs[id_cols + feature_cols].copy()
-
-        # Ghi per-partition
-        out_dir = feat_root / f"dt={dt}"
-        ensure_dir(out_dir)
-        out_path = out_dir / "part.parquet"
-        try:
-            out_path.unlink(missing_ok=True)
-        except Exception:
-            pass
-        feat.to_parquet(out_path, index=False)
-
-        # Lấy mẫu để ghép ra features.parquet
-        if sample_per_day > 0 and len(feat) > 0:
-            k = min(sample_per_day, len(feat))
-            samples.append(feat.sample(k, random_state=42))
+    with record("featurize") as total:
+        for dt in dates:
+            with record("featurize.partition", partition=f"dt={dt}") as m:
+                ecs = _read_partition(ecs_root, dt, sources)
+                m.rows_in = len(ecs)
+                m.bytes_read = file_size(*[p for s in sources for p in (ecs_root / s / f"dt={dt}").glob("*.parquet")])
+                if ecs.empty or "@timestamp" not in ecs.columns:
+                    # Không có timestamp thì bỏ qua ngày này
+                    continue
+
+                feat = featurize_ecs(ecs)
+
+                # Ghi per-partition
+                out_dir = feat_root / f"dt={dt}"
+                ensure_dir(out_dir)
+                out_path = out_dir / "part.parquet"
+                try:
+                    out_path.unlink(missing_ok=True)
+                except Exception:
+                    pass
+                feat.to_parquet(out_path, index=False)
+                m.rows_out, m.bytes_written = len(feat), file_size(out_path)
+                total.rows_in += m.rows_in
+                total.rows_out += m.rows_out
+                total.bytes_read += m.bytes_read
+                total.bytes_written += m.bytes_written
+
+                # Lấy mẫu để ghép ra features.parquet
+                if sample_per_day > 0 and len(feat) > 0:
+                    k = min(sample_per_day, len(feat))
+                    samples.append(feat.sample(k, random_state=42))
 
     # Ghi bản gộp nhỏ
     out_all = feat_root / "features.parquet"
@@ -0,0 +1,195 @@
+"""Isolation Forest dạng phẳng (NumPy)
+
+- Gói toàn bộ cây của IsolationForest vào các mảng liền mạch:
+  feature, threshold, left/right (chỉ số node toàn cục), value (độ sâu + hiệu chỉnh path length ở lá)
+- Chấm điểm theo batch, duyệt đồng thời mọi cây theo từng tầng (không gọi 150 estimator riêng lẻ);
+  các dòng feature trùng nhau chỉ được duyệt một lần
+- Kết quả trùng bit với `model.decision_function` (cùng ép float32, cùng thứ tự cộng theo cây)
+"""
+
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class FlatForest:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.children = arrays["children"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.n_levels = int(arrays["n_levels"])
+        self.n_features = int(arrays["n_features"])
+        self.denominator = float(arrays["denominator"])
+        self.offset = float(arrays["offset"])
+
+    @classmethod
+    def from_model(cls, model) -> "FlatForest":
+        return cls(export_flat_forest(model))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return self.arrays
+
+    def _depths(self, Xb: np.ndarray) -> np.ndarray:
+        m = Xb.shape[0]
+        # node[t, i]: node hiện tại của dòng i trong cây t; lá tự trỏ về chính nó
+        node = np.repeat(self.roots[:, None], m, axis=1)
+        row_base = np.arange(m, dtype=np.int32) * np.int32(Xb.shape[1])
+        xflat = Xb.ravel()
+        for _ in range(self.n_levels):
+            xv = np.take(xflat, row_base + np.take(self.feature, node))
+            go_right = xv > np.take(self.threshold, node)
+            node = np.take(self.children, 2 * node + go_right)
+        vals = np.take(self.value, node)
+        depths = np.zeros(m, dtype=np.float64)
+        for t in range(len(self.roots)):  # cộng tuần tự theo cây như sklearn
+            depths += vals[t]
+        return depths
+
+    def score_samples(self, X, batch_rows: int = 4096) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)  # sklearn ép về float32 trước khi apply
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got shape {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("Input X contains NaN.")
+
+        # Feature log lặp lại rất nhiều: chấm một lần cho mỗi dòng phân biệt (kết quả không đổi)
+        inverse = None
+        if len(X) > batch_rows:
+            probe = _row_view(X[:batch_rows])
+            if len(np.unique(probe)) < 0.5 * len(probe):
+                uniq, inverse = np.unique(_row_view(X), return_index=True, return_inverse=True)[1:]
+                X = X[uniq]
+
+        depths = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], batch_rows):
+            depths[start:start + batch_rows] = self._depths(X[start:start + batch_rows])
+        denominator = self.denominator
+        scores = 2 ** (
+            -np.divide(depths, denominator, out=np.ones_like(depths), where=denominator != 0)
+        )
+        out = -scores
+        return out[inverse.ravel()] if inverse is not None else out
+
+    def decision_function(self, X, batch_rows: int = 4096) -> np.ndarray:
+        return self.score_samples(X, batch_rows) - self.offset
+
+
+def _row_view(X: np.ndarray) -> np.ndarray:
+    """Xem mỗi dòng như một giá trị bytes để np.unique theo dòng."""
+    return X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel()
+
+
+def export_flat_forest(model) -> Dict[str, np.ndarray]:
+    """Đóng gói các cây của IsolationForest đã fit thành dict các mảng NumPy."""
+    from sklearn.ensemble._iforest import _average_path_length
+
+    subsample = model._max_features != model.n_features_in_
+    path_lengths = getattr(model, "_decision_path_lengths", None)
+    avg_lengths = getattr(model, "_average_path_length_per_tree", None)
+
+    feature, threshold, children, value, roots = [], [], [], [], []
+    base = 0
+    n_levels = 0
+    for t_idx, (est, feats) in enumerate(zip(model.estimators_, model.estimators_features_)):
+        tree = est.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        self_idx = np.arange(n, dtype=np.int64)
+
+        f = tree.feature.astype(np.int64)
+        if subsample:
+            f[~is_leaf] = np.asarray(feats, dtype=np.int64)[f[~is_leaf]]
+        f[is_leaf] = 0
+        thr = tree.threshold.astype(np.float64)
+        thr[is_leaf] = np.inf  # lá: luôn "rẽ trái" về chính nó
+
+        depths = path_lengths[t_idx] if path_lengths is not None else tree.compute_node_depths()
+        avg = avg_lengths[t_idx] if avg_lengths is not None else _average_path_length(tree.n_node_samples)
+
+        left = np.where(is_leaf, self_idx, tree.children_left) + base
+        right = np.where(is_leaf, self_idx, tree.children_right) + base
+        feature.append(f)
+        threshold.append(thr)
+        children.append(np.stack([left, right], axis=1).ravel())  # [2*i] trái, [2*i+1] phải
+        value.append(depths + avg - 1.0)
+        roots.append(base)
+        n_levels = max(n_levels, int(tree.max_depth))
+        base += n
+
+    denominator = len(model.estimators_) * _average_path_length([model._max_samples])
+    return {
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold),
+        "children": np.concatenate(children).astype(np.int32),
+        "value": np.concatenate(value).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "n_levels": np.int64(n_levels),
+        "n_features": np.int64(model.n_features_in_),
+        "denominator": np.float64(np.asarray(denominator).ravel()[0]),
+        "offset": np.float64(model.offset_),
+    }
+
+
+def benchmark(rows: int = 10_000_000, chunk_rows: int = 1_000_000, seed: int = 42) -> Dict[str, float]:
+    """
+    So sánh sklearn decision_function với FlatForest trên `rows` dòng
+    (lấy mẫu có hoàn lại từ features.parquet đã scale, sinh theo từng chunk).
+    """
+    from pathlib import Path
+
+    import pandas as pd
+
+    from models.model_store import load_model_payload
+    from models.utils import get_paths
+
+    paths = get_paths()
+    payload = load_model_payload()
+    model, scaler, feature_cols = payload["model"], payload.get("scaler"), payload["feature_cols"]
+    flat_arrays: Optional[Dict] = payload.get("flat_forest")
+    flat = FlatForest(flat_arrays) if flat_arrays else FlatForest.from_model(model)
+
+    feat_root = Path(paths["features_dir"])
+    sources = [feat_root / "features.parquet"]
+    if not sources[0].exists():
+        sources = sorted(feat_root.glob("dt=*/part.parquet"))
+    frames, n_base = [], 0
+    for p in sources:
+        frames.append(pd.read_parquet(p, columns=feature_cols))
+        n_base += len(frames[-1])
+        if n_base >= 200_000:
+            break
+    base = pd.concat(frames, ignore_index=True)
+    base = base.apply(pd.to_numeric, errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+    if scaler is not None:
+        base = scaler.transform(base)
+    rng = np.random.default_rng(seed)
+
+    t_sklearn = t_flat = 0.0
+    identical = True
+    done = 0
+    while done < rows:
+        n = min(chunk_rows, rows - done)
+        X = base[rng.integers(0, len(base), n)]
+        t0 = time.perf_counter()
+        ref = -model.decision_function(X)
+        t_sklearn += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        got = -flat.decision_function(X)
+        t_flat += time.perf_counter() - t0
+        identical = identical and bool(np.array_equal(ref, got))
+        done += n
+
+    result = {
+        "rows": float(rows),
+        "sklearn_seconds": t_sklearn,
+        "flat_seconds": t_flat,
+        "sklearn_rows_per_sec": rows / t_sklearn if t_sklearn else 0.0,
+        "flat_rows_per_sec": rows / t_flat if t_flat else 0.0,
+        "speedup": t_sklearn / t_flat if t_flat else 0.0,
+        "bit_identical": float(identical),
+    }
+    return result
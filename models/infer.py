@@ -1,38 +1,269 @@
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 
+import numpy as np
 import pandas as pd
-import joblib
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-from models.utils import get_paths
+from explain.thresholding import (
+    ENTITY_COLS, PART_SKETCH_FILENAME, SKETCH_FILENAME, SketchSet, merge_partition_sketches,
+)
+from models.flat_forest import FlatForest
+from models.model_store import load_model_payload, model_path
+from models.registry import CANDIDATE, resolve_model_path
+from models.utils import get_paths, load_models_config, sha256_file, write_json
+from pipeline.profiling import file_size, record
 
 
-def _load_model() -> Tuple[object, object, List[str]]:
-    paths = get_paths()
-    mp = Path(paths["models_dir"]) / "isolation_forest.joblib"
-    if not mp.exists():
-        raise FileNotFoundError(f"Model not found: {mp}. Run 'python -m cli.anom_score train' first.")
-    payload: Dict = joblib.load(mp)
-    return payload["model"], payload.get("scaler"), payload["feature_cols"]
+SCORE_COL = "anom.score"
+SHADOW_COL = "anom.shadow_score"
+EXPLAIN_COL = "anom.top_features"
+SHADOW_REPORT = "shadow_report.json"
+TOPK_FILENAME = "scores_topk.parquet"
+FINGERPRINT_FILENAME = "part.fingerprint.json"
+_SAMPLE_KEY = "_sample_key"
+
+# Model đã nạp trong mỗi worker process (nạp một lần qua initializer);
+# _WORKER_SHADOW là model ứng viên khi chạy shadow scoring
+_WORKER_MODEL: Optional[Tuple[object, object, List[str]]] = None
+_WORKER_SHADOW: Optional[Tuple[object, object, List[str]]] = None
+
+
+def _load_model(path: Optional[str] = None) -> Tuple[object, object, List[str]]:
+    payload = load_model_payload(path)
+    return _scorer(payload), payload.get("scaler"), payload["feature_cols"]
+
+
+def _scorer(payload: Dict):
+    """Mặc định chấm bằng FlatForest (trùng bit với sklearn); INFER_ENGINE=sklearn để dùng model gốc."""
+    model = payload["model"]
+    if os.getenv("INFER_ENGINE", "flat") == "sklearn":
+        return model
+    flat = payload.get("flat_forest")
+    return FlatForest(flat) if flat else FlatForest.from_model(model)
 
 
 def _prepare_features(df: pd.DataFrame, feature_cols: List[str]) -> pd.DataFrame:
-    out = df.copy()
-    for c in feature_cols:
-        if c not in out.columns:
-            out[c] = 0.0
-    X = out[feature_cols].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    # Chỉ dựng các cột feature, không copy toàn bộ frame
+    X = pd.DataFrame(
+        {c: pd.to_numeric(df[c], errors="coerce") if c in df.columns else 0.0 for c in feature_cols},
+        index=df.index,
+    )
+    return X.fillna(0.0)
+
+
+def batch_matrix(batch: pa.RecordBatch, feature_cols: List[str]) -> np.ndarray:
+    """RecordBatch -> ma trận float64 (n, k); thiếu cột/NaN -> 0.0."""
+    X = np.zeros((batch.num_rows, len(feature_cols)), dtype=np.float64)
+    names = batch.schema.names
+    for j, c in enumerate(feature_cols):
+        if c not in names:
+            continue
+        col = batch.column(names.index(c))
+        if pa.types.is_integer(col.type) or pa.types.is_floating(col.type) or pa.types.is_boolean(col.type):
+            X[:, j] = col.cast(pa.float64()).to_numpy(zero_copy_only=False)
+        elif not pa.types.is_null(col.type):
+            X[:, j] = pd.to_numeric(col.to_pandas(), errors="coerce").to_numpy(dtype=np.float64)
+    X[np.isnan(X)] = 0.0
     return X
 
 
-def score_features() -> Path:
+def _score_matrix(model, scaler, X: np.ndarray) -> np.ndarray:
+    if scaler is not None:
+        X = scaler.transform(X)
+    return -model.decision_function(X)
+
+
+def explain_enabled() -> bool:
+    """SCORE_EXPLAIN=1: ghi thêm cột anom.top_features (top 3 feature theo path attribution) cho mọi dòng."""
+    return os.getenv("SCORE_EXPLAIN", "0").lower() in ("1", "true", "yes")
+
+
+def _explain_matrix(model, scaler, X: np.ndarray, feature_cols: List[str]) -> pa.Array:
+    from explain.path_attribution import top_feature_names
+
+    if scaler is not None:
+        X = scaler.transform(X)
+    return pa.array(top_feature_names(model, X, feature_cols), type=pa.string())
+
+
+def _init_worker(shadow_path: Optional[str] = None) -> None:
+    global _WORKER_MODEL, _WORKER_SHADOW
+    _WORKER_MODEL = _load_model()
+    _WORKER_SHADOW = _load_model(shadow_path) if shadow_path else None
+
+
+def _feature_fingerprint(parts: List[str]) -> Dict[str, str]:
+    out = {}
+    for p in parts:
+        st = os.stat(p)
+        out[Path(p).name] = f"{st.st_size}:{st.st_mtime_ns}"
+    return out
+
+
+def _fingerprint_path(out_path: Path) -> Path:
+    return out_path.with_name(FINGERPRINT_FILENAME)
+
+
+def _is_fresh(out_path: Path, fingerprint: Dict) -> bool:
+    """Partition đã chấm với đúng model và đúng file feature hiện tại (và đã có sketch)."""
+    fp_path = _fingerprint_path(out_path)
+    if not out_path.exists() or not fp_path.exists():
+        return False
+    if not out_path.with_name(PART_SKETCH_FILENAME).exists():
+        return False
+    try:
+        with open(fp_path, "r", encoding="utf-8") as f:
+            return json.load(f) == fingerprint
+    except Exception:
+        return False
+
+
+def _shadow_stats(main: List[np.ndarray], shadow: List[np.ndarray]) -> Dict:
+    a, b = np.concatenate(main), np.concatenate(shadow)
+    rho = pd.Series(a).corr(pd.Series(b), method="spearman") if len(a) > 1 else float("nan")
+    return {
+        "spearman": float(rho) if pd.notna(rho) else None,
+        "mean_abs_diff": float(np.mean(np.abs(a - b))),
+        "max_current": float(a.max()),
+        "max_candidate": float(b.max()),
+    }
+
+
+def _output_schema(parts: List[str], feature_cols: List[str], explain: bool, shadow: bool) -> pa.Schema:
+    """
+    Schema cố định của part.parquet: các cột của file feature (feature -> float64, cột null -> string,
+    dictionary -> kiểu giá trị) + anom.score [+ anom.top_features] [+ anom.shadow_score].
+    """
+    schema = pa.unify_schemas([pq.read_schema(p).remove_metadata() for p in parts], promote_options="permissive")
+    fields = []
+    for f in schema:
+        if f.name in feature_cols:
+            f = f.with_type(pa.float64())
+        elif pa.types.is_null(f.type):
+            f = f.with_type(pa.string())
+        elif pa.types.is_dictionary(f.type):
+            f = f.with_type(f.type.value_type)
+        fields.append(f)
+    fields.append(pa.field(SCORE_COL, pa.float64()))
+    if explain:
+        fields.append(pa.field(EXPLAIN_COL, pa.string()))
+    if shadow:
+        fields.append(pa.field(SHADOW_COL, pa.float64()))
+    return pa.schema(fields)
+
+
+def _conform(batch: pa.RecordBatch, schema: pa.Schema) -> List[pa.Array]:
+    # cột của batch theo thứ tự và kiểu của schema; cột không có trong batch -> null
+    names = batch.schema.names
+    return [batch.column(names.index(f.name)).cast(f.type) if f.name in names else pa.nulls(batch.num_rows, f.type)
+            for f in schema]
+
+
+def _score_partition(parts: List[str], out_path: str, batch_rows: int, fingerprint: Dict,
+                     shadow: bool = False) -> Dict:
+    """
+    Stream từng record batch của partition: feature -> scaler -> decision_function,
+    rồi nối cột anom.score vào chính batch Arrow (không qua pandas, không copy frame)
+    và ghi thẳng ra Parquet tạm, cuối cùng os.replace sang part.parquet.
+    shadow=True: cùng lượt đọc đó chấm thêm bằng model ứng viên -> cột anom.shadow_score.
+    fingerprint["explain"] (SCORE_EXPLAIN=1): thêm cột anom.top_features theo path attribution.
+    Ghi kèm part.sketch.json (histogram điểm toàn cục + theo host/user, xem explain.thresholding)
+    và part.fingerprint.json (model + file feature) để lần sau bỏ qua nếu không đổi.
+    """
+    with record("score.partition", partition=Path(out_path).parent.name) as m:
+        stat = _score_partition_impl(parts, out_path, batch_rows, fingerprint, shadow)
+        m.rows_in = m.rows_out = stat["rows"]
+        m.bytes_read = file_size(*parts)
+        m.bytes_written = file_size(out_path) if stat["rows"] else 0
+    return stat
+
+
+def _score_partition_impl(parts: List[str], out_path: str, batch_rows: int, fingerprint: Dict,
+                          shadow: bool = False) -> Dict:
+    model, scaler, feature_cols = _WORKER_MODEL or _load_model()
+    explain = bool(fingerprint.get("explain"))
+    if shadow and _WORKER_SHADOW is None:
+        raise RuntimeError("Shadow scoring requested but no candidate model was loaded")
+    main_scores: List[np.ndarray] = []
+    shadow_scores: List[np.ndarray] = []
+    sketch = SketchSet()
+    t0 = time.perf_counter()
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+
+    schema = _output_schema(parts, feature_cols, explain, shadow)
+    base = pa.schema(list(schema)[:len(schema) - 1 - explain - shadow])  # cột của file feature
+    rows = 0
+    writer: Optional[pq.ParquetWriter] = None
+    done = False
+    try:
+        for p in parts:
+            for batch in pq.ParquetFile(p).iter_batches(batch_size=batch_rows):
+                if batch.num_rows == 0:
+                    continue
+                X = batch_matrix(batch, feature_cols)
+                scores = _score_matrix(model, scaler, X)
+                columns = _conform(batch, base)
+                columns.append(pa.array(scores, type=pa.float64()))
+                names = batch.schema.names
+                sketch.add(scores, {
+                    c: batch.column(names.index(c)).to_numpy(zero_copy_only=False)
+                    for c in ENTITY_COLS if c in names
+                })
+                if explain:
+                    columns.append(_explain_matrix(model, scaler, X, feature_cols))
+                if shadow:
+                    s_model, s_scaler, s_cols = _WORKER_SHADOW
+                    s_scores = _score_matrix(s_model, s_scaler, batch_matrix(batch, s_cols))
+                    columns.append(pa.array(s_scores, type=pa.float64()))
+                    main_scores.append(scores)
+                    shadow_scores.append(s_scores)
+                if writer is None:
+                    writer = pq.ParquetWriter(str(tmp), schema)
+                writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+                rows += batch.num_rows
+        done = True
+    finally:
+        if writer is not None:
+            writer.close()
+        if not (done and rows):
+            tmp.unlink(missing_ok=True)
+
+    if rows:
+        os.replace(tmp, out)
+        sketch.save(out.with_name(PART_SKETCH_FILENAME))
+        write_json(_fingerprint_path(out), fingerprint)
+    secs = time.perf_counter() - t0
+    stat = {"partition": out.parent.name, "rows": rows, "seconds": secs}
+    if shadow and rows:
+        stat["shadow"] = _shadow_stats(main_scores, shadow_scores)
+    return stat
+
+
+def _score_workers(n_tasks: int) -> int:
+    workers = int(os.getenv("SCORE_WORKERS", "0")) or (os.cpu_count() or 1)
+    return max(1, min(workers, n_tasks))
+
+
+def _report(stat: Dict) -> None:
+    rate = stat["rows"] / stat["seconds"] if stat["seconds"] > 0 else 0.0
+    print(f"[score] {stat['partition']}: {stat['rows']} rows in {stat['seconds']:.2f}s ({rate:,.0f} rows/s)")
+
+
+def score_features(full: bool = False, shadow: bool = False) -> Path:
     """Nếu có features theo partition dt=* thì chấm theo partition, ngược lại chấm features.parquet."""
     paths = get_paths()
     feat_root = Path(paths["features_dir"])
     dt_dirs = sorted([p for p in feat_root.glob("dt=*") if p.is_dir()])
     if dt_dirs:
-        return score_features_large()
+        return score_features_large(full=full, shadow=shadow)
 
     model, scaler, feature_cols = _load_model()
     feat_path = feat_root / "features.parquet"
@@ -43,61 +274,170 @@ def score_features() -> Path:
         raise RuntimeError("Feature table is empty")
 
     X = _prepare_features(df, feature_cols)
-    X_np = X.values
-    if scaler is not None:
-        X_np = scaler.transform(X_np)
-    scores = -model.decision_function(X_np)
+    df[SCORE_COL] = _score_matrix(model, scaler, X.values)
+    if explain_enabled():
+        df[EXPLAIN_COL] = _explain_matrix(model, scaler, X.values, feature_cols).to_pandas()
 
-    out = df.copy()
-    out["anom.score"] = scores
     out_dir = Path(paths["scores_dir"]); out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / "scores.parquet"
-    out.to_parquet(out_path, index=False)
+    df.to_parquet(out_path, index=False)
+    SketchSet().add(df[SCORE_COL].to_numpy(), {c: df[c].to_numpy() for c in ENTITY_COLS if c in df.columns}).save(
+        out_dir / SKETCH_FILENAME
+    )
+    # scores.parquet là bảng đầy đủ; bỏ chỉ mục top-K cũ của chế độ partition
+    (out_dir / TOPK_FILENAME).unlink(missing_ok=True)
     return out_path
 
 
-def score_features_large() -> Path:
+def score_features_large(full: bool = False, shadow: bool = False) -> Path:
     """
-    Chấm điểm theo từng partition ngày:
+    Chấm điểm theo từng partition ngày, song song trên worker pool
+    (mỗi worker nạp model một lần, SCORE_WORKERS điều chỉnh số worker):
     data/features/dt=*/part.parquet -> data/scores/dt=*/part.parquet
-    Và ghép toàn bộ vào data/scores/scores.parquet cho UI.
+    Chỉ chấm lại partition có model hoặc file feature đổi so với part.fingerprint.json
+    (train lại -> chấm lại toàn bộ); full=True để ép chấm lại hết.
+    shadow=True: chấm song song bằng model CANDIDATE của registry trong cùng lượt đọc feature,
+    ghi cột anom.shadow_score và so sánh từng partition vào scores/shadow_report.json.
+    Sau đó dựng chỉ mục top-K + mẫu cho UI (xem build_score_index).
     """
     paths = get_paths()
     feat_root = Path(paths["features_dir"])
     scores_root = Path(paths["scores_dir"]); scores_root.mkdir(parents=True, exist_ok=True)
-    model, scaler, feature_cols = _load_model()
+    if not model_path().exists():
+        _load_model()  # raise FileNotFoundError rõ ràng trước khi mở pool
+    batch_rows = int(os.getenv("SCORE_BATCH_ROWS", "65536"))
 
+    model_fp = sha256_file(model_path())
+    explain = explain_enabled()
+    shadow_path = str(resolve_model_path(CANDIDATE)) if shadow else None
+    shadow_fp = sha256_file(Path(shadow_path)) if shadow_path else None
+    tasks = []
+    skipped = 0
     for d in sorted([p for p in feat_root.glob("dt=*") if p.is_dir()]):
-        parts = list(d.glob("*.parquet"))
+        parts = sorted(str(p) for p in d.glob("*.parquet"))
         if not parts:
             continue
-        df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+        out_path = scores_root / d.name / "part.parquet"
+        fingerprint = {"model": model_fp, "features": _feature_fingerprint(parts)}
+        if shadow_fp:
+            fingerprint["shadow"] = shadow_fp
+        if explain:
+            fingerprint["explain"] = True
+        if not full and _is_fresh(out_path, fingerprint):
+            skipped += 1
+            continue
+        tasks.append((parts, str(out_path), batch_rows, fingerprint, shadow))
+
+    with record("score", partitions=len(tasks), skipped=skipped) as m:
+        out = _run_score_tasks(tasks, shadow_path, scores_root, skipped)
+        m.rows_in = m.rows_out = out["rows"]
+        m.bytes_read = file_size(*[p for t in tasks for p in t[0]])
+        m.bytes_written = file_size(*[t[1] for t in tasks])
+    return scores_root
+
+
+def _run_score_tasks(tasks: List[Tuple], shadow_path: Optional[str], scores_root: Path, skipped: int) -> Dict:
+    t0 = time.perf_counter()
+    total_rows = 0
+    workers = _score_workers(len(tasks))
+    ex: Optional[ProcessPoolExecutor] = None
+    if workers > 1:
+        ex = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shadow_path,))
+        stats = ex.map(_score_partition, *zip(*tasks))
+    else:
+        if tasks:
+            _init_worker(shadow_path)
+        stats = (_score_partition(*t) for t in tasks)
+    shadow_report = {}
+    try:
+        for stat in stats:
+            _report(stat)
+            total_rows += stat["rows"]
+            if "shadow" in stat:
+                shadow_report[stat["partition"]] = stat["shadow"]
+    finally:
+        if ex is not None:
+            ex.shutdown()
+    secs = time.perf_counter() - t0
+    rate = total_rows / secs if secs > 0 else 0.0
+    print(f"[score] total: {total_rows} rows, {len(tasks)} partitions in {secs:.2f}s "
+          f"({rate:,.0f} rows/s, {workers} worker(s)); {skipped} unchanged partition(s) skipped")
+
+    if shadow_report:
+        write_json(scores_root / SHADOW_REPORT, {
+            "candidate": shadow_path,
+            "partitions": shadow_report,
+            "mean_abs_diff": float(np.mean([v["mean_abs_diff"] for v in shadow_report.values()])),
+        })
+        print(f"[score] shadow comparison: {scores_root / SHADOW_REPORT}")
+
+    if tasks or not (scores_root / TOPK_FILENAME).exists() or not (scores_root / SKETCH_FILENAME).exists():
+        build_score_index(scores_root)
+    return {"rows": total_rows}
+
+
+def _write_parquet_atomic(df: pd.DataFrame, path: Path) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _bounded_merge(kept: Optional[pd.DataFrame], cand: pd.DataFrame, col: str, k: int, largest: bool) -> pd.DataFrame:
+    """Gộp ứng viên vào tập đang giữ rồi cắt lại còn k dòng theo col (argpartition, O(n))."""
+    merged = cand if kept is None else pd.concat([kept, cand], ignore_index=True)
+    if len(merged) <= k:
+        return merged
+    vals = merged[col].to_numpy()
+    idx = np.argpartition(-vals if largest else vals, k - 1)[:k]
+    return merged.iloc[np.sort(idx)]
+
+
+def build_score_index(scores_root: Path) -> Dict[str, Path]:
+    """
+    Một lượt stream qua scores/dt=*/part.parquet (mỗi lần một partition), giữ:
+    - top-K chính xác toàn cục theo anom.score -> scores_topk.parquet (cho select_alerts)
+    - mẫu đều có giới hạn (bottom-k theo khoá ngẫu nhiên) -> scores.parquet (cho UI)
+    và gộp các part.sketch.json -> sketch.json (ngưỡng toàn cục + theo thực thể).
+    Bộ nhớ chỉ phụ thuộc K, kích thước mẫu và một partition, không phụ thuộc độ dài lịch sử.
+    """
+    cfg = load_models_config()
+    top_n = int(cfg.get("scoring", {}).get("top_n", 10))
+    top_k = max(int(os.getenv("SCORES_TOPK", "1000")), top_n)
+    sample_rows = int(os.getenv("SCORES_MERGE_MAX_ROWS", "2000000"))
+    rng = np.random.default_rng(42)
+
+    top: Optional[pd.DataFrame] = None
+    sample: Optional[pd.DataFrame] = None
+    for p in sorted(scores_root.glob("dt=*/part.parquet")):
+        df = pd.read_parquet(p)
         if df.empty:
             continue
+        # Khi đã đủ K chỉ những dòng vượt phần tử nhỏ nhất đang giữ mới cần merge
+        if top is not None and len(top) >= top_k:
+            cand = df[df[SCORE_COL].to_numpy() > top[SCORE_COL].min()]
+        else:
+            cand = df
+        if not cand.empty:
+            top = _bounded_merge(top, cand, SCORE_COL, top_k, largest=True)
+        if sample_rows > 0:
+            keys = rng.random(len(df))
+            if sample is not None and len(sample) >= sample_rows:
+                keep = keys < sample[_SAMPLE_KEY].max()
+            else:
+                keep = np.ones(len(df), dtype=bool)
+            if keep.any():
+                cand = df[keep].assign(**{_SAMPLE_KEY: keys[keep]})
+                sample = _bounded_merge(sample, cand, _SAMPLE_KEY, sample_rows, largest=False)
 
-        X = _prepare_features(df, feature_cols)
-        X_np = X.values
-        if scaler is not None:
-            X_np = scaler.transform(X_np)
-        scores = -model.decision_function(X_np)
-
-        out = df.copy()
-        out["anom.score"] = scores
-        out_dir = scores_root / d.name; out_dir.mkdir(parents=True, exist_ok=True)
-        out_path = out_dir / "part.parquet"
-        try:
-            out_path.unlink(missing_ok=True)
-        except Exception:
-            pass
-        out.to_parquet(out_path, index=False)
-
-    # Gộp toàn bộ partition -> scores.parquet (có thể giới hạn số dòng)
-    all_parts = sorted(scores_root.glob("dt=*/*.parquet"))
-    if all_parts:
-        merged = pd.concat([pd.read_parquet(p) for p in all_parts], ignore_index=True)
-        max_rows = int(os.getenv("SCORES_MERGE_MAX_ROWS", "2000000"))
-        if len(merged) > max_rows:
-            merged = merged.sample(max_rows, random_state=42)
-        merged.to_parquet(scores_root / "scores.parquet", index=False)
-
-    return scores_root
\ No newline at end of file
+    out = {}
+    if merge_partition_sketches(scores_root) is not None:
+        out["sketch"] = scores_root / SKETCH_FILENAME
+    if top is not None:
+        out["topk"] = scores_root / TOPK_FILENAME
+        top = top.sort_values(SCORE_COL, ascending=False, kind="stable")
+        _write_parquet_atomic(top.reset_index(drop=True), out["topk"])
+    if sample is not None:
+        out["sample"] = scores_root / "scores.parquet"
+        sample = sample.drop(columns=[_SAMPLE_KEY]).sort_values("@timestamp", kind="stable")
+        _write_parquet_atomic(sample.reset_index(drop=True), out["sample"])
+    return out
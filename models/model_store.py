@@ -0,0 +1,80 @@
+"""Nạp model dùng chung cho toàn process
+
+- Cache trong process theo đường dẫn + (mtime_ns, size) của file joblib:
+  lần nạp lặp lại chỉ tốn một lần stat; file đổi (train lại) thì tự nạp lại
+- Mảng NumPy được memory-map (joblib mmap_mode="r"), nên nhiều worker process
+  dùng chung page cache thay vì mỗi process giữ một bản sao
+- Mặc định nạp model "current" của registry (models.registry)
+- joblib chỉ được import khi nạp / ghi model (model_fingerprint chỉ cần stat)
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from models.registry import MODEL_FILENAME, resolve_model_path
+
+
+_CACHE: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+_LOCK = threading.Lock()
+
+
+def model_path() -> Path:
+    """Model "current" trong registry (hoặc file joblib cũ nếu chưa có registry)."""
+    return resolve_model_path()
+
+
+def _stamp(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def model_fingerprint(path: Optional[Union[str, Path]] = None) -> str:
+    """Định danh rẻ của file model hiện tại (đổi khi file được ghi lại)."""
+    p = Path(path) if path else model_path()
+    mtime_ns, size = _stamp(p)
+    return f"{p.name}:{mtime_ns}:{size}"
+
+
+def load_model_payload(path: Optional[Union[str, Path]] = None, mmap: bool = True) -> Dict:
+    """
+    Trả về payload {"model", "scaler", "feature_cols", "meta", ...} từ cache nếu file chưa đổi.
+    Payload được chia sẻ giữa các lời gọi: không sửa tại chỗ.
+    """
+    p = Path(path) if path else model_path()
+    if not p.exists():
+        raise FileNotFoundError(f"Model not found: {p}. Run 'python -m cli.anom_score train' first.")
+    key = str(p.resolve())
+    stamp = _stamp(p)
+    with _LOCK:
+        hit = _CACHE.get(key)
+        if hit is not None and hit[0] == stamp:
+            return hit[1]
+        import joblib
+
+        payload = joblib.load(p, mmap_mode="r" if mmap else None)
+        if not isinstance(payload, dict):  # model cũ lưu trực tiếp estimator
+            payload = {"model": payload}
+        _CACHE[key] = (stamp, payload)
+        return payload
+
+
+def save_model_payload(payload: Dict, path: Optional[Union[str, Path]] = None) -> Path:
+    """
+    Ghi payload không nén (để mmap được) ra file tạm rồi os.replace: process khác đang
+    map file cũ vẫn đọc inode cũ, không bao giờ thấy file ghi dở.
+    """
+    p = Path(path) if path else model_path()
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    import joblib
+
+    joblib.dump(payload, tmp)
+    os.replace(tmp, p)
+    return p
+
+
+def clear_cache() -> None:
+    with _LOCK:
+        _CACHE.clear()
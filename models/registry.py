@@ -0,0 +1,126 @@
+"""Model registry có phiên bản (Tiếng Việt)
+
+Cấu trúc dưới models_dir:
+  registry/<version>/isolation_forest.joblib   artifact bất biến (không bao giờ ghi đè)
+  registry/<version>/meta.json                 feature_cols, số dòng train, thời gian fit, sha256...
+  registry/CURRENT                             con trỏ model đang dùng (ghi tạm + os.replace)
+  registry/CANDIDATE                           con trỏ model ứng viên cho shadow scoring
+
+Chưa có registry thì rơi về file cũ models_dir/isolation_forest.joblib.
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from models.utils import get_paths, sha256_file, write_json
+
+
+MODEL_FILENAME = "isolation_forest.joblib"
+CURRENT = "CURRENT"
+CANDIDATE = "CANDIDATE"
+
+
+def registry_dir() -> Path:
+    return Path(get_paths()["models_dir"]) / "registry"
+
+
+def version_dir(version: str) -> Path:
+    return registry_dir() / version
+
+
+def _read_pointer(name: str) -> Optional[str]:
+    p = registry_dir() / name
+    if not p.exists():
+        return None
+    v = p.read_text(encoding="utf-8").strip()
+    return v or None
+
+
+def _write_pointer(name: str, version: Optional[str]) -> None:
+    p = registry_dir() / name
+    if version is None:
+        p.unlink(missing_ok=True)
+        return
+    if not (version_dir(version) / MODEL_FILENAME).exists():
+        raise FileNotFoundError(f"Model version not found: {version}")
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def current_version() -> Optional[str]:
+    return _read_pointer(CURRENT)
+
+
+def candidate_version() -> Optional[str]:
+    return _read_pointer(CANDIDATE)
+
+
+def set_current(version: str) -> None:
+    _write_pointer(CURRENT, version)
+
+
+def set_candidate(version: Optional[str]) -> None:
+    _write_pointer(CANDIDATE, version)
+
+
+def promote(version: Optional[str] = None) -> str:
+    """Đưa version (mặc định: candidate) thành current; xoá con trỏ candidate nếu trùng."""
+    version = version or candidate_version()
+    if not version:
+        raise RuntimeError("No candidate model to promote")
+    set_current(version)
+    if candidate_version() == version:
+        set_candidate(None)
+    return version
+
+
+def resolve_model_path(role: str = CURRENT) -> Path:
+    """Đường dẫn artifact cho role CURRENT/CANDIDATE; không có registry -> file joblib cũ."""
+    version = _read_pointer(role)
+    if version:
+        return version_dir(version) / MODEL_FILENAME
+    if role == CANDIDATE:
+        raise FileNotFoundError("No candidate model registered. Run 'python -m cli.anom_score train --candidate'.")
+    return Path(get_paths()["models_dir"]) / MODEL_FILENAME
+
+
+def register(payload: Dict, meta: Dict) -> str:
+    """Ghi payload thành một version mới (bất biến) kèm meta.json; trả về version."""
+    from models.model_store import save_model_payload
+
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+    version = f"v{stamp}"
+    vdir = version_dir(version)
+    vdir.mkdir(parents=True, exist_ok=False)
+    model_file = save_model_payload(payload, vdir / MODEL_FILENAME)
+    info = dict(meta)
+    info.update({
+        "version": version,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "feature_cols": list(payload.get("feature_cols", [])),
+        "sha256": sha256_file(model_file),
+        "size": model_file.stat().st_size,
+    })
+    write_json(vdir / "meta.json", info)
+    return version
+
+
+def list_versions() -> List[Dict]:
+    root = registry_dir()
+    if not root.exists():
+        return []
+    cur, cand = current_version(), candidate_version()
+    out = []
+    for d in sorted(p for p in root.iterdir() if p.is_dir()):
+        meta_path = d / "meta.json"
+        if not meta_path.exists():
+            continue
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["role"] = "current" if d.name == cur else "candidate" if d.name == cand else ""
+        out.append(meta)
+    return out
@@ -0,0 +1,298 @@
+"""Scoring service chạy nền (Tiếng Việt)
+
+- Giữ model + scaler nóng trong process (models.infer / model_store), tự nạp lại khi train lại
+- Nhận dòng feature hoặc dòng ECS qua HTTP (TCP hoặc Unix socket)
+- Dòng ECS: số đếm cửa sổ lấy từ trạng thái theo thực thể giữ trong process (pipeline.stream.WindowState),
+  cập nhật theo thứ tự nhận qua mọi request; sự kiện trễ hơn watermark - SERVE_LATENESS_S không còn lịch sử
+- Gộp các request đồng thời thành micro-batch (giới hạn số dòng hoặc thời gian chờ),
+  chấm một lần rồi trả anom.score cho từng request
+- GET /metrics: số request, độ trễ p50/p99, kích thước batch
+
+API:
+  POST /score  {"features": [{"login_failed": 1, ...}, ...]}   hoặc   {"events": [{"@timestamp": ..., ...}]}
+               -> {"scores": [...], "model": "<fingerprint>"}   (dòng ECS thiếu @timestamp -> null)
+  GET  /metrics, GET /health
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from features.build_features import add_event_flags
+from models.infer import SCORE_COL, _load_model, _prepare_features, _score_matrix
+from models.model_store import model_fingerprint
+from pipeline.stream import WindowState
+
+
+class _Metrics:
+    """Thống kê trong bộ nhớ; giữ `window` mẫu gần nhất để tính phân vị."""
+
+    def __init__(self, window: int = 10_000):
+        self._lock = threading.Lock()
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_rows = deque(maxlen=window)
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.started = time.time()
+
+    def observe_request(self, seconds: float, rows: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+            self.latencies_ms.append(seconds * 1000.0)
+
+    def observe_batch(self, rows: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batch_rows.append(rows)
+
+    def observe_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lat = np.asarray(self.latencies_ms, dtype=np.float64)
+            sizes = np.asarray(self.batch_rows, dtype=np.float64)
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "requests": self.requests,
+                "rows": self.rows,
+                "batches": self.batches,
+                "errors": self.errors,
+                "latency_ms_p50": float(np.percentile(lat, 50)) if len(lat) else None,
+                "latency_ms_p99": float(np.percentile(lat, 99)) if len(lat) else None,
+                "batch_rows_mean": float(sizes.mean()) if len(sizes) else None,
+                "batch_rows_max": int(sizes.max()) if len(sizes) else None,
+            }
+
+
+class MicroBatcher:
+    """
+    Một thread chấm điểm duy nhất lấy request từ hàng đợi, gom đến khi đủ `max_rows` dòng
+    hoặc hết `max_wait_ms` kể từ request đầu tiên, rồi chấm cả batch một lần.
+    Model, feature_cols và trạng thái cửa sổ chỉ được dùng trong thread này: cả batch chấm bằng
+    cùng một model và dòng ECS cập nhật số đếm cửa sổ theo đúng thứ tự nhận.
+    """
+
+    def __init__(self, max_rows: int = 4096, max_wait_ms: float = 5.0, metrics: Optional[_Metrics] = None,
+                 lateness_s: Optional[float] = None):
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = metrics or _Metrics()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._loaded = None
+        self.state = WindowState()
+        self.watermark_ns = 0
+        if lateness_s is None:
+            lateness_s = float(os.getenv("SERVE_LATENESS_S", "300"))
+        self.lateness_ns = int(lateness_s * 1e9)
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def model(self):
+        """(model, scaler, feature_cols, fingerprint); nạp lại nếu file model đã đổi."""
+        fp = model_fingerprint()
+        loaded = self._loaded
+        if loaded is None or loaded[3] != fp:
+            loaded = self._loaded = _load_model() + (fp,)
+        return loaded
+
+    def submit(self, kind: str, rows: List[Dict]) -> Future:
+        """kind: "features" hoặc "events"; future trả (điểm theo từng dòng, None nếu không tính được, fingerprint)."""
+        fut: Future = Future()
+        self._queue.put((kind, rows, fut))
+        return fut
+
+    def _run(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            rows = len(items[0][1])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                rows += len(items[-1][1])
+            self._score(items)
+
+    def _event_matrix(self, events: List[Dict], feature_cols: List[str]):
+        """Dòng ECS -> (ma trận feature, vị trí các dòng tính được feature); cập nhật trạng thái cửa sổ."""
+        ecs = pd.DataFrame.from_records(events)
+        if ecs.empty or "@timestamp" not in ecs.columns:
+            return np.zeros((0, len(feature_cols))), np.zeros(0, dtype=np.int64)
+        ecs["@timestamp"] = pd.to_datetime(ecs["@timestamp"], utc=True, errors="coerce")
+        ecs = ecs.dropna(subset=["@timestamp"]).sort_values("@timestamp", kind="stable")
+        if ecs.empty:
+            return np.zeros((0, len(feature_cols))), np.zeros(0, dtype=np.int64)
+        positions = ecs.index.to_numpy()
+        # như StreamProcessor.process_batch: cờ từng sự kiện + số đếm cửa sổ từ trạng thái theo thực thể
+        ecs = self.state.add_counts(add_event_flags(ecs.reset_index(drop=True)))
+        self.watermark_ns = max(self.watermark_ns, int(ecs["@timestamp"].iloc[-1].value))
+        self.state.evict(self.watermark_ns - self.lateness_ns)
+        return _prepare_features(ecs, feature_cols).to_numpy(dtype=np.float64), positions
+
+    def _score(self, items: List) -> None:
+        try:
+            model, scaler, feature_cols, fp = self.model()
+        except Exception as e:
+            for _, _, fut in items:
+                fut.set_exception(e)
+            return
+        built = []
+        for kind, rows, fut in items:
+            try:
+                if kind == "features":
+                    X, positions = _feature_matrix(rows, feature_cols), np.arange(len(rows))
+                else:
+                    X, positions = self._event_matrix(rows, feature_cols)
+            except Exception as e:
+                fut.set_exception(e)
+                continue
+            built.append((X, positions, len(rows), fut))
+        try:
+            X = np.concatenate([X for X, _, _, _ in built]) if built else np.zeros((0, len(feature_cols)))
+            scores = _score_matrix(model, scaler, X) if len(X) else np.zeros(0)
+        except Exception as e:
+            for _, _, _, fut in built:
+                fut.set_exception(e)
+            return
+        if len(scores):
+            self.metrics.observe_batch(len(scores))
+        start = 0
+        for X, positions, n, fut in built:
+            out: List[Optional[float]] = [None] * n
+            for pos, s in zip(positions, scores[start:start + len(X)]):
+                out[int(pos)] = float(s)
+            start += len(X)
+            fut.set_result((out, fp if len(X) else None))
+
+
+def _feature_matrix(rows: List[Dict], feature_cols: List[str]) -> np.ndarray:
+    return _prepare_features(pd.DataFrame.from_records(rows), feature_cols).to_numpy(dtype=np.float64)
+
+
+def score_request(batcher: MicroBatcher, body: Dict) -> Dict:
+    """Chấm một request JSON qua micro-batcher; trả {"scores": [...], "model": fp}."""
+    for kind in ("features", "events"):
+        if kind in body:
+            break
+    else:
+        raise ValueError("Request body must contain 'features' or 'events'")
+    if not body[kind]:
+        return {"scores": [], "model": None}
+    scores, fp = batcher.submit(kind, body[kind]).result()
+    return {"scores": scores, "model": fp}
+
+
+def _make_handler(batcher: MicroBatcher):
+    metrics = batcher.metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, code: int, obj: Dict) -> None:
+            data = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, metrics.snapshot())
+            elif self.path == "/health":
+                self._send(200, {"status": "ok", "score_col": SCORE_COL})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send(404, {"error": "not found"})
+                return
+            t0 = time.perf_counter()
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                result = score_request(batcher, body)
+            except ValueError as e:
+                metrics.observe_error()
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                metrics.observe_error()
+                self._send(500, {"error": str(e)})
+                return
+            metrics.observe_request(time.perf_counter() - t0, len(result["scores"]))
+            self._send(200, result)
+
+        def address_string(self):  # Unix socket không có địa chỉ client
+            return str(self.client_address[0]) if self.client_address else "unix"
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+class _TCPServer(ThreadingHTTPServer):
+    request_queue_size = 128  # nhiều client đồng thời (mặc định 5 làm rớt kết nối)
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765, unix_socket: Optional[str] = None,
+                max_rows: Optional[int] = None, max_wait_ms: Optional[float] = None):
+    """Tạo server (chưa chạy). SERVE_MAX_BATCH / SERVE_MAX_WAIT_MS là giá trị mặc định cho micro-batch."""
+    batcher = MicroBatcher(
+        max_rows=max_rows or int(os.getenv("SERVE_MAX_BATCH", "4096")),
+        max_wait_ms=max_wait_ms if max_wait_ms is not None else float(os.getenv("SERVE_MAX_WAIT_MS", "5")),
+    )
+    batcher.model()  # nạp model trước khi nhận request đầu tiên
+    handler = _make_handler(batcher)
+    if unix_socket:
+        sock_path = Path(unix_socket)
+        if sock_path.exists() and sock_path.is_socket():
+            sock_path.unlink()
+        return _UnixHTTPServer(str(sock_path), handler)
+    return _TCPServer((host, port), handler)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, unix_socket: Optional[str] = None,
+          max_rows: Optional[int] = None, max_wait_ms: Optional[float] = None) -> None:
+    server = make_server(host, port, unix_socket, max_rows, max_wait_ms)
+    where = unix_socket if unix_socket else f"http://{host}:{port}"
+    print(f"[serve] listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket:
+            Path(unix_socket).unlink(missing_ok=True)
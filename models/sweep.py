@@ -0,0 +1,177 @@
+"""Benchmark train/score theo lưới siêu tham số (Tiếng Việt)
+
+Trên một tập dữ liệu cố định (features.parquet hoặc mẫu tất định từ các partition dt=*),
+với mỗi tổ hợp n_estimators x max_samples x tập feature, đo:
+- fit_s: thời gian scaler + fit IsolationForest
+- score_rows_per_s: tốc độ chấm (FlatForest) trên toàn bộ tập
+- model_kb: kích thước payload joblib trên đĩa
+- peak_mem_mb: đỉnh bộ nhớ cấp phát (tracemalloc) khi fit + chấm, đo ở một lượt riêng không tính giờ
+- spearman_top / overlap_top: độ ổn định so với cấu hình tham chiếu (models.yaml, đủ feature):
+  tương quan hạng trên hợp top-N của hai cấu hình, và Jaccard của hai tập top-N (tính cả điểm hoà)
+"""
+
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import RobustScaler
+
+from models.flat_forest import FlatForest, export_flat_forest
+from models.train_if import ID_COLS
+from models.utils import get_paths, load_models_config, ensure_dir
+
+
+def load_fixed_dataset(max_rows: int = 200_000, seed: int = 42) -> pd.DataFrame:
+    """features.parquet nếu có, ngược lại lấy mẫu đều tất định từ các partition dt=*."""
+    feat_root = Path(get_paths()["features_dir"])
+    sample_path = feat_root / "features.parquet"
+    if sample_path.exists():
+        df = pd.read_parquet(sample_path)
+    else:
+        parts = sorted(feat_root.glob("dt=*/part.parquet"))
+        if not parts:
+            raise FileNotFoundError(f"No features under {feat_root}. Run featurize first.")
+        total = sum(pq.ParquetFile(p).metadata.num_rows for p in parts)
+        frac = min(1.0, max_rows / max(total, 1))
+        frames = []
+        for p in parts:
+            part = pd.read_parquet(p)
+            frames.append(part if frac >= 1.0 else part.sample(frac=frac, random_state=seed))
+        df = pd.concat(frames, ignore_index=True)
+    if len(df) > max_rows:
+        df = df.sample(max_rows, random_state=seed)
+    num_cols = [c for c in df.columns if c not in ID_COLS and pd.api.types.is_numeric_dtype(df[c])]
+    return df[num_cols].fillna(0.0).reset_index(drop=True)
+
+
+def _parse_max_samples(v: Union[str, int, float]):
+    if isinstance(v, str):
+        if v == "auto":
+            return v
+        return float(v) if "." in v else int(v)
+    return v
+
+
+def _top_set(scores: np.ndarray, n: int) -> np.ndarray:
+    """Chỉ số các dòng có điểm >= điểm cao thứ n (giữ cả các dòng hoà điểm)."""
+    cut = np.partition(scores, len(scores) - n)[len(scores) - n]
+    return np.flatnonzero(scores >= cut)
+
+
+def _fit(X: np.ndarray, n_estimators: int, max_samples, iso_cfg: Dict):
+    scaler = RobustScaler()
+    Xs = scaler.fit_transform(X)
+    model = IsolationForest(
+        n_estimators=n_estimators,
+        max_samples=max_samples,
+        contamination=iso_cfg.get("contamination", 0.05),
+        random_state=iso_cfg.get("random_state", 42),
+        n_jobs=iso_cfg.get("n_jobs", -1),
+    )
+    model.fit(Xs)
+    return scaler, model, export_flat_forest(model)
+
+
+def _peak_alloc(X: np.ndarray, n_estimators: int, max_samples, iso_cfg: Dict) -> int:
+    # lượt riêng dưới tracemalloc: tracemalloc làm fit chậm ~3 lần nên không đo cùng lượt tính giờ
+    tracemalloc.start()
+    try:
+        scaler, _, flat = _fit(X, n_estimators, max_samples, iso_cfg)
+        FlatForest(flat).decision_function(scaler.transform(X))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _fit_and_score(X: np.ndarray, n_estimators: int, max_samples, iso_cfg: Dict) -> Dict:
+    t0 = time.perf_counter()
+    scaler, model, flat = _fit(X, n_estimators, max_samples, iso_cfg)
+    fit_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    scores = -FlatForest(flat).decision_function(scaler.transform(X))
+    score_s = time.perf_counter() - t0
+    peak = _peak_alloc(X, n_estimators, max_samples, iso_cfg)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mp = Path(tmp) / "model.joblib"
+        joblib.dump({"model": model, "scaler": scaler, "flat_forest": flat}, mp)
+        size = mp.stat().st_size
+
+    return {
+        "scores": scores,
+        "fit_s": fit_s,
+        "score_rows_per_s": len(X) / score_s if score_s > 0 else 0.0,
+        "model_kb": size / 1024.0,
+        "peak_mem_mb": peak / (1024.0 * 1024.0),
+    }
+
+
+def run_sweep(
+    n_estimators: Sequence[int] = (50, 100, 150),
+    max_samples: Sequence[Union[str, int, float]] = (128, 256, "auto"),
+    feature_subsets: Optional[Dict[str, List[str]]] = None,
+    rows: int = 200_000,
+    top_n: int = 100,
+) -> pd.DataFrame:
+    """Chạy lưới cấu hình, trả về bảng kết quả và ghi CSV vào logs_dir/benchmarks/."""
+    cfg = load_models_config()
+    iso_cfg = cfg.get("isolation_forest", {})
+    data = load_fixed_dataset(rows)
+    all_cols = list(data.columns)
+    subsets = dict(feature_subsets or {})
+    subsets.setdefault("all", all_cols)
+
+    # Cấu hình tham chiếu: đúng models.yaml, đủ feature
+    ref = _fit_and_score(
+        data[all_cols].to_numpy(dtype=np.float64),
+        int(iso_cfg.get("n_estimators", 150)),
+        _parse_max_samples(iso_cfg.get("max_samples", "auto")),
+        iso_cfg,
+    )
+    top_n = min(top_n, len(data))
+    ref_top = _top_set(ref["scores"], top_n)
+
+    records = []
+    for subset_name, cols in subsets.items():
+        missing = [c for c in cols if c not in data.columns]
+        if missing:
+            raise ValueError(f"Unknown feature(s) in subset '{subset_name}': {missing}")
+        X = data[cols].to_numpy(dtype=np.float64)
+        for n_est in n_estimators:
+            for ms in max_samples:
+                res = _fit_and_score(X, int(n_est), _parse_max_samples(ms), iso_cfg)
+                top = _top_set(res["scores"], top_n)
+                union = np.union1d(ref_top, top)
+                spearman = pd.Series(ref["scores"][union]).corr(
+                    pd.Series(res["scores"][union]), method="spearman"
+                )
+                records.append({
+                    "features": subset_name,
+                    "n_features": len(cols),
+                    "n_estimators": int(n_est),
+                    "max_samples": str(ms),
+                    "fit_s": res["fit_s"],
+                    "score_rows_per_s": res["score_rows_per_s"],
+                    "model_kb": res["model_kb"],
+                    "peak_mem_mb": res["peak_mem_mb"],
+                    "spearman_top": float(spearman) if pd.notna(spearman) else float("nan"),
+                    "overlap_top": len(np.intersect1d(ref_top, top)) / float(len(union)),
+                })
+
+    table = pd.DataFrame.from_records(records)
+    out_dir = Path(get_paths()["logs_dir"]) / "benchmarks"
+    ensure_dir(out_dir)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    table.to_csv(out_dir / f"sweep_{stamp}.csv", index=False)
+    table.attrs["rows"] = len(data)
+    table.attrs["path"] = str(out_dir / f"sweep_{stamp}.csv")
+    return table
@@ -1,25 +1,94 @@
 """Huấn luyện Isolation Forest (Tiếng Việt)
 
-- Đọc bảng đặc trưng `data/features/features.parquet`
+- Có partition `data/features/dt=*`: train streaming trên toàn bộ lịch sử (train_model_large)
+- Ngược lại đọc bảng đặc trưng mẫu `data/features/features.parquet` (train_model_sample)
 - Chọn cột số (loại bỏ các cột định danh)
 - Chuẩn hóa bằng RobustScaler, sau đó train IsolationForest
-- Lưu payload `data/models/isolation_forest.joblib` gồm: model, scaler, feature_cols, meta
+- Lưu payload `isolation_forest.joblib` gồm: model, scaler, feature_cols, meta,
+  flat_forest (các cây đóng gói thành mảng NumPy cho models.flat_forest)
+  thành một version mới trong registry (models.registry), rồi trỏ CURRENT (hoặc CANDIDATE) vào đó
 """
 
+import os
+import time
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-import joblib
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
 from sklearn.ensemble import IsolationForest
+from sklearn.ensemble._iforest import _average_path_length
 from sklearn.preprocessing import RobustScaler
+from sklearn.utils import check_random_state
 
-from models.utils import get_paths, load_models_config, ensure_dir
+from models.flat_forest import export_flat_forest
+from models.infer import batch_matrix
+from models.registry import MODEL_FILENAME, register, set_candidate, set_current, version_dir
+from models.utils import get_paths, load_models_config
+from pipeline.profiling import file_size, record
 
 
-MODEL_FILENAME = "isolation_forest.joblib"
+ID_COLS = {"@timestamp", "host.name", "user.name", "source.ip", "destination.ip", "session.id"}
 
 
-def train_model() -> Path:
+def train_model(candidate: bool = False) -> Path:
+    """
+    Có partition dt=* thì train streaming trên toàn bộ lịch sử, ngược lại train trên features.parquet.
+    candidate=True: chỉ đăng ký làm ứng viên (shadow scoring), không đổi model đang dùng.
+    """
+    feat_root = Path(get_paths()["features_dir"])
+    parts = sorted(feat_root.glob("dt=*/*.parquet"))
+    with record("train", mode="streaming" if parts else "sample") as m:
+        if parts:
+            m.bytes_read = file_size(*parts)
+            out, m.rows_in = train_model_large(candidate=candidate)
+        else:
+            m.bytes_read = file_size(feat_root / "features.parquet")
+            out = train_model_sample(candidate=candidate)
+        m.bytes_written = file_size(out)
+    return out
+
+
+def _new_forest(iso_cfg: Dict, max_samples=None) -> IsolationForest:
+    return IsolationForest(
+        n_estimators=iso_cfg.get("n_estimators", 150),
+        max_samples=max_samples if max_samples is not None else iso_cfg.get("max_samples", "auto"),
+        contamination=iso_cfg.get("contamination", 0.05),
+        random_state=iso_cfg.get("random_state", 42),
+        n_jobs=iso_cfg.get("n_jobs", -1),
+    )
+
+
+def _background(X_scaled: np.ndarray, seed: int = 42) -> np.ndarray:
+    """Mẫu nhỏ feature đã scale lưu kèm model làm background cho SHAP (explain.shap_explain)."""
+    n = min(int(os.getenv("SHAP_BACKGROUND_ROWS", "100")), len(X_scaled))
+    idx = np.sort(np.random.default_rng(seed).choice(len(X_scaled), n, replace=False))
+    return np.ascontiguousarray(X_scaled[idx], dtype=np.float64)
+
+
+def _save(model: IsolationForest, scaler, feature_cols: List[str], meta: Dict, candidate: bool = False,
+          background: Optional[np.ndarray] = None) -> Path:
+    payload = {
+        "model": model,
+        "feature_cols": feature_cols,
+        "scaler": scaler,
+        "flat_forest": export_flat_forest(model),
+        "background": background,
+        "meta": meta,
+    }
+    version = register(payload, meta)
+    if candidate:
+        set_candidate(version)
+    else:
+        set_current(version)
+    print(f"[train] registered {version} as {'candidate' if candidate else 'current'}")
+    return version_dir(version) / MODEL_FILENAME
+
+
+def train_model_sample(candidate: bool = False) -> Path:
     paths = get_paths()
     cfg = load_models_config()
 
@@ -29,40 +98,167 @@ def train_model() -> Path:
         raise RuntimeError("Feature table is empty; run featurize first")
 
     # Select feature columns (anything numeric not in identity)
-    id_cols = {"@timestamp", "host.name", "user.name", "source.ip", "destination.ip", "session.id"}
-    feature_cols = [c for c in df.columns if c not in id_cols and pd.api.types.is_numeric_dtype(df[c])]
+    feature_cols = [c for c in df.columns if c not in ID_COLS and pd.api.types.is_numeric_dtype(df[c])]
 
     X = df[feature_cols].fillna(0.0)
+    t0 = time.perf_counter()
 
     # Robust scaling
     scaler = RobustScaler()
     X_scaled = scaler.fit_transform(X)
 
     iso_cfg = cfg.get("isolation_forest", {})
-    model = IsolationForest(
-        n_estimators=iso_cfg.get("n_estimators", 150),
-        max_samples=iso_cfg.get("max_samples", "auto"),
-        contamination=iso_cfg.get("contamination", 0.05),
-        random_state=iso_cfg.get("random_state", 42),
-        n_jobs=iso_cfg.get("n_jobs", -1),
-    )
-
+    model = _new_forest(iso_cfg)
     model.fit(X_scaled)
 
-    out_dir = Path(paths["models_dir"]).resolve()
-    ensure_dir(out_dir)
-    model_path = out_dir / MODEL_FILENAME
-    payload = {
-        "model": model,
-        "feature_cols": feature_cols,
-        "scaler": scaler,
-        "meta": {
-            "algorithm": "IsolationForest",
-            "params": iso_cfg,
+    return _save(model, scaler, feature_cols, {
+        "algorithm": "IsolationForest",
+        "params": iso_cfg,
+        "training": {
+            "mode": "sample",
+            "rows": len(df),
+            "fit_seconds": time.perf_counter() - t0,
         },
-    }
-    joblib.dump(payload, model_path)
-    return model_path
+    }, candidate=candidate, background=_background(np.asarray(X_scaled)))
+
+
+class _BottomK:
+    """
+    Reservoir bottom-k: mỗi dòng nhận khoá U(0,1), giữ k khoá nhỏ nhất -> mẫu đều không hoàn lại.
+    Khi đã đầy chỉ dòng có khoá < tau (khoá lớn nhất đang giữ) mới vào được: số dòng đó ~ Binomial(n, tau)
+    nên chỉ cần rút c vị trí và c khoá U(0, tau) thay vì sinh n khoá cho mỗi batch.
+    """
+
+    def __init__(self, k: int, n_features: int):
+        self.k = k
+        self.keys = np.empty(0, dtype=np.float64)
+        self.rows = np.empty((0, n_features), dtype=np.float64)
+
+    def offer(self, X: np.ndarray, rng: np.random.Generator) -> None:
+        n = len(X)
+        if len(self.keys) < self.k:
+            idx = np.arange(n)
+            keys = rng.random(n)
+        else:
+            tau = float(self.keys.max())
+            c = int(rng.binomial(n, tau))
+            if c == 0:
+                return
+            idx = rng.choice(n, c, replace=False)
+            keys = rng.random(c) * tau
+        keys = np.concatenate([self.keys, keys])
+        rows = np.concatenate([self.rows, X[idx]])
+        if len(keys) > self.k:
+            keep = np.argpartition(keys, self.k - 1)[: self.k]
+            keys, rows = keys[keep], rows[keep]
+        self.keys, self.rows = keys, rows
+
+
+def _resolve_max_samples(max_samples, n_rows: int) -> int:
+    # Cùng quy tắc với IsolationForest.fit
+    if isinstance(max_samples, str):  # "auto"
+        return min(256, n_rows)
+    if isinstance(max_samples, float):
+        return max(1, int(max_samples * n_rows))
+    return min(int(max_samples), n_rows)
+
+
+def _stream_feature_cols(parts: List[Path]) -> List[str]:
+    schema = pq.read_schema(parts[0])
+    numeric = (pa.types.is_integer, pa.types.is_floating, pa.types.is_boolean)
+    return [f.name for f in schema if f.name not in ID_COLS and any(t(f.type) for t in numeric)]
+
+
+def train_model_large(batch_rows: Optional[int] = None, candidate: bool = False) -> Tuple[Path, int]:
+    """
+    Train streaming trên toàn bộ data/features/dt=*/part.parquet, một lượt đọc tuần tự; trả (model, số dòng):
+    - mỗi cây có reservoir riêng max_samples dòng, rút đều trên toàn lịch sử
+    - thêm một reservoir SCALER_SAMPLE_ROWS dòng để fit RobustScaler và tính offset_ (contamination)
+    - các cây được fit song song (threads), lưu cùng định dạng payload isolation_forest.joblib
+    Bộ nhớ ~ n_estimators * max_samples dòng, không phụ thuộc số partition.
+    """
+    paths = get_paths()
+    cfg = load_models_config()
+    iso_cfg = cfg.get("isolation_forest", {})
+    batch_rows = batch_rows or int(os.getenv("TRAIN_BATCH_ROWS", "65536"))
+
+    parts = sorted(Path(paths["features_dir"]).glob("dt=*/*.parquet"))
+    if not parts:
+        raise RuntimeError("No feature partitions found; run featurize first")
+    feature_cols = _stream_feature_cols(parts)
+    n_rows = sum(pq.ParquetFile(p).metadata.num_rows for p in parts)
+    if n_rows == 0:
+        raise RuntimeError("Feature partitions are empty; run featurize first")
+
+    t0 = time.perf_counter()
+    n_trees = int(iso_cfg.get("n_estimators", 150))
+    k = _resolve_max_samples(iso_cfg.get("max_samples", "auto"), n_rows)
+    rng = np.random.default_rng(iso_cfg.get("random_state", 42))
+    trees = [_BottomK(k, len(feature_cols)) for _ in range(n_trees)]
+    global_sample = _BottomK(min(int(os.getenv("SCALER_SAMPLE_ROWS", "100000")), n_rows), len(feature_cols))
+
+    for p in parts:
+        for batch in pq.ParquetFile(p).iter_batches(batch_size=batch_rows):
+            if batch.num_rows == 0:
+                continue
+            X = batch_matrix(batch, feature_cols)
+            global_sample.offer(X, rng)
+            for r in trees:
+                r.offer(X, rng)
+    t_read = time.perf_counter() - t0
+
+    scaler = RobustScaler()
+    scaler.fit(global_sample.rows)
+    samples = [scaler.transform(r.rows) for r in trees]
+
+    # Thuộc tính của forest lấy từ một lần fit một cây; n_trees cây được dựng với seed như
+    # BaseBagging._fit (cùng random_state -> cùng cây như khi fit cả forest) và chỉ fit một lần trên mẫu riêng
+    model = _new_forest(iso_cfg, max_samples=k).set_params(n_estimators=1)
+    model.fit(samples[0])
+    model.set_params(n_estimators=n_trees)
+    seeds = check_random_state(model.random_state).randint(np.iinfo(np.int32).max, size=n_trees)
+    estimators = [model._make_estimator(append=False, random_state=seed) for seed in seeds]
+
+    def _fit_tree(est, X):
+        y = np.random.default_rng(est.random_state).uniform(size=len(X))
+        est.fit(X.astype(np.float32), y, check_input=False)
+        return est
+
+    model.estimators_ = Parallel(n_jobs=iso_cfg.get("n_jobs", -1), prefer="threads")(
+        delayed(_fit_tree)(est, X) for est, X in zip(estimators, samples)
+    )
+    model.estimators_features_ = model.estimators_features_[:1] * n_trees
+    model._seeds = seeds
+    model._average_path_length_per_tree, model._decision_path_lengths = zip(
+        *[
+            (_average_path_length(est.tree_.n_node_samples), est.tree_.compute_node_depths())
+            for est in model.estimators_
+        ]
+    )
+    ref = scaler.transform(global_sample.rows)
+    contamination = model.contamination
+    if contamination == "auto":
+        model.offset_ = -0.5
+    else:
+        model.offset_ = np.percentile(model.score_samples(ref), 100.0 * contamination)
+    t_fit = time.perf_counter() - t0 - t_read
+    print(f"[train] streamed {n_rows} rows from {len(parts)} partitions in {t_read:.2f}s; "
+          f"fit {n_trees} trees x {k} samples in {t_fit:.2f}s")
+
+    out = _save(model, scaler, feature_cols, {
+        "algorithm": "IsolationForest",
+        "params": iso_cfg,
+        "training": {
+            "mode": "streaming",
+            "rows": n_rows,
+            "partitions": len(parts),
+            "max_samples": k,
+            "scaler_sample_rows": len(global_sample.rows),
+            "read_seconds": t_read,
+            "fit_seconds": t_fit,
+        },
+    }, candidate=candidate, background=_background(ref))
+    return out, n_rows
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import os
 import json
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import yaml
 
@@ -19,6 +20,8 @@ except Exception:
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 CONFIG_DIR = PROJECT_ROOT / "config"
+ENV_PREFIX = "LOGANOM_"
+WORKDIR_ENV = "LOGANOM_WORKDIR"
 
 
 def load_yaml(path: Path) -> Dict[str, Any]:
@@ -26,17 +29,69 @@ def load_yaml(path: Path) -> Dict[str, Any]:
         return yaml.safe_load(f)
 
 
+class Settings:
+    """
+    paths.yaml + models.yaml, parse một lần cho mỗi phiên bản file (mtime) và bộ override từ env.
+    Path tương đối được resolve dưới LOGANOM_WORKDIR (nếu có, vd. benchmark không đụng data/)
+    hoặc PROJECT_ROOT; LOGANOM_<KEY> (vd. LOGANOM_SCORES_DIR) thay hẳn một path.
+    """
+
+    def __init__(self, raw_paths: Dict[str, str], models: Dict[str, Any], workdir: str,
+                 overrides: Tuple[Optional[str], ...]):
+        base = Path(workdir or PROJECT_ROOT)
+        self.paths: Dict[str, str] = {}
+        for (key, rel), env in zip(raw_paths.items(), overrides):
+            self.paths[key] = str((base / (env or rel)).resolve())
+        self.models = models
+
+
+_CONFIG_FILES = (str(CONFIG_DIR / "paths.yaml"), str(CONFIG_DIR / "models.yaml"))
+
+
+def _config_stamp() -> Tuple[int, ...]:
+    stamps = []
+    for path in _CONFIG_FILES:
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(0)
+    return tuple(stamps)
+
+
+@lru_cache(maxsize=4)
+def _raw_config(stamp: Tuple[int, ...]) -> Tuple[Dict[str, str], Dict[str, Any], Tuple[str, ...]]:
+    raw_paths = load_yaml(CONFIG_DIR / "paths.yaml") or {}
+    env_keys = tuple(ENV_PREFIX + key.upper() for key in raw_paths)
+    return raw_paths, load_yaml(CONFIG_DIR / "models.yaml") or {}, env_keys
+
+
+@lru_cache(maxsize=16)
+def _settings(stamp: Tuple[int, ...], workdir: str, overrides: Tuple[Optional[str], ...]) -> Settings:
+    raw_paths, models, _ = _raw_config(stamp)
+    return Settings(raw_paths, models, workdir, overrides)
+
+
+def settings() -> Settings:
+    """Settings dùng chung; đổi env hoặc sửa file config -> tự nạp lại (chỉ tốn hai lần stat mỗi lời gọi)."""
+    stamp = _config_stamp()
+    env_keys = _raw_config(stamp)[2]
+    env = os.environ
+    return _settings(stamp, env.get(WORKDIR_ENV, ""), tuple(env.get(k) for k in env_keys))
+
+
+def reload_settings() -> None:
+    _raw_config.cache_clear()
+    _settings.cache_clear()
+
+
 def get_paths() -> Dict[str, str]:
-    cfg = load_yaml(CONFIG_DIR / "paths.yaml")
-    # Convert to absolute paths under project root
-    resolved = {}
-    for key, rel in cfg.items():
-        resolved[key] = str((PROJECT_ROOT / rel).resolve())
-    return resolved
+    # Bản sao: caller có thể sửa dict trả về mà không ảnh hưởng cache
+    return dict(settings().paths)
 
 
 def load_models_config() -> Dict[str, Any]:
-    return load_yaml(CONFIG_DIR / "models.yaml")
+    """Config models.yaml đã parse, dùng chung giữa các lời gọi: không sửa tại chỗ."""
+    return settings().models
 
 
 def ensure_dir(path: Path) -> None:
@@ -47,12 +102,12 @@ def list_parquet_files(base_dir: Path) -> List[Path]:
     return list(base_dir.rglob("*.parquet"))
 
 
-def sha256_file(path: Path) -> str:
+def sha256_file(path: Path, chunk_size: int = 1 << 20) -> str:
     import hashlib
 
     h = hashlib.sha256()
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
+        for chunk in iter(lambda: f.read(chunk_size), b""):
             h.update(chunk)
     return h.hexdigest()
 
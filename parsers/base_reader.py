@@ -5,6 +5,7 @@ from typing import Dict, Iterable, List
 import pandas as pd
 
 from models.utils import ensure_dir
+from pipeline.profiling import file_size, record
 import os
 import pyarrow as pa
 import pyarrow.parquet as pq
@@ -29,18 +30,28 @@ def to_utc_datetime(series: Iterable) -> pd.Series:
     return pd.to_datetime(series, utc=True, errors="coerce")
 
 
+def _row_group_rows() -> int:
+    # Row group nhỏ + sắp theo @timestamp -> thống kê min/max chặt, tra cứu theo thời gian
+    # (pipeline.context) chỉ đọc vài row group thay vì cả file
+    return int(os.getenv("ECS_ROW_GROUP_ROWS", "65536"))
+
+
 def write_partitioned_parquet(df: pd.DataFrame, base_out: Path, source_name: str) -> None:
     if df.empty:
         return
     df = df.copy()
     df["@timestamp"] = pd.to_datetime(df["@timestamp"], utc=True, errors="coerce")
+    df = df.sort_values("@timestamp", kind="stable")
     df["dt"] = df["@timestamp"].dt.strftime("%Y-%m-%d")
     for dt_value, part in df.groupby("dt"):
-        out_dir = base_out / source_name / f"dt={dt_value}"
-        ensure_dir(out_dir)
-        out_path = out_dir / "part.parquet"
-        part.drop(columns=["dt"], inplace=True)
-        part.to_parquet(out_path, index=False)
+        with record("ingest.write", source=source_name, partition=f"dt={dt_value}") as m:
+            out_dir = base_out / source_name / f"dt={dt_value}"
+            ensure_dir(out_dir)
+            out_path = out_dir / "part.parquet"
+            part.drop(columns=["dt"], inplace=True)
+            part.to_parquet(out_path, index=False, row_group_size=_row_group_rows())
+            m.rows_in = m.rows_out = len(part)
+            m.bytes_written = file_size(out_path)
 
 class ParquetBatchWriter:
     """Append-optimized writer: ghi theo partition 'dt' cho dataset lớn."""
@@ -54,11 +65,17 @@ class ParquetBatchWriter:
             return
         if "dt" not in df.columns:
             raise ValueError("DataFrame must contain 'dt' partition column")
-        table = pa.Table.from_pandas(df, preserve_index=False)
-        pq.write_to_dataset(
-            table,
-            root_path=str(self.root),
-            partition_cols=["dt"],
-            compression=self.compression,
-            existing_data_behavior="overwrite_or_ignore",
-        )
\ No newline at end of file
+        if "@timestamp" in df.columns:
+            df = df.sort_values("@timestamp", kind="stable")
+        with record("ingest.write", source=self.root.name) as m:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pq.write_to_dataset(
+                table,
+                root_path=str(self.root),
+                partition_cols=["dt"],
+                compression=self.compression,
+                existing_data_behavior="overwrite_or_ignore",
+                # pyarrow ghi đè max_rows_per_group bằng row_group_size: phải truyền row_group_size
+                row_group_size=_row_group_rows(),
+            )
+            m.rows_in = m.rows_out = table.num_rows
\ No newline at end of file
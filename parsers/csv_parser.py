@@ -3,8 +3,9 @@ from __future__ import annotations
 import os
 import re
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from parsers.base_reader import ParquetBatchWriter
+from pipeline.profiling import file_size, record
 import pandas as pd
 from models.utils import get_paths
 
@@ -23,12 +24,20 @@ def _pick_first(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
     return None
 
 def parse_csv_file(csv_path: Path, out_subdir: str = "custom_csv") -> None:
+    with record("ingest", source=out_subdir, file=str(csv_path)) as met:
+        met.bytes_read = file_size(csv_path)
+        met.rows_in, met.rows_out = _parse_csv_file(csv_path, out_subdir)
+
+def _parse_csv_file(csv_path: Path, out_subdir: str) -> Tuple[int, int]:
+    """Ghi các chunk của csv_path ra dataset out_subdir; trả về (số dòng đọc, số dòng ghi)."""
+    rows_in = rows_out = 0
     paths = get_paths()
     out_root = Path(paths["ecs_parquet_dir"])
     writer = ParquetBatchWriter(out_root, out_subdir)
     CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", "200000"))
 
     for df in pd.read_csv(csv_path, chunksize=CHUNK_ROWS, low_memory=False):
+        rows_in += len(df)
         if df.empty:
             continue
         df = _normalize_columns(df)
@@ -74,8 +83,10 @@ def parse_csv_file(csv_path: Path, out_subdir: str = "custom_csv") -> None:
             "network.transport","network.bytes","dt"
         ]
         cols = [c for c in keep_cols if c in df.columns]
+        rows_out += len(df)
         writer.write(df[cols])
-        
+    return rows_in, rows_out
+
 def parse_custom_csv_dir(in_dir: Path, recursive: bool = True) -> None:
     files = list(in_dir.rglob("*.csv")) if recursive else list(in_dir.glob("*.csv"))
     for p in files:
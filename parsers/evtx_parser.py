@@ -6,6 +6,7 @@ import pandas as pd
 from models.utils import get_paths, load_yaml
 from parsers.base_reader import read_jsonl, write_partitioned_parquet
 from parsers.ecs_mapper import map_record
+from pipeline.profiling import file_size, record
 
 
 def parse_evtx() -> Path:
@@ -16,13 +17,16 @@ def parse_evtx() -> Path:
     mapping = load_yaml(Path(__file__).resolve().parents[1] / "config" / "ecs_mapping.yaml")
     cfg = mapping["windows_evtx"]
 
-    records: List[Dict] = read_jsonl(raw)
-    ecs_rows = [map_record(rec, cfg) for rec in records]
-    df = pd.DataFrame(ecs_rows)
-    df["event.module"] = "windows"
-    df["event.dataset"] = "security"
-    df = df.dropna(subset=["@timestamp"])  # ensure ts present
-    write_partitioned_parquet(df, Path(paths["ecs_parquet_dir"]), "windows_evtx")
+    with record("ingest", source="windows_evtx") as m:
+        records: List[Dict] = read_jsonl(raw)
+        m.bytes_read, m.rows_in = file_size(raw), len(records)
+        ecs_rows = [map_record(rec, cfg) for rec in records]
+        df = pd.DataFrame(ecs_rows)
+        df["event.module"] = "windows"
+        df["event.dataset"] = "security"
+        df = df.dropna(subset=["@timestamp"])  # ensure ts present
+        m.rows_out = len(df)
+        write_partitioned_parquet(df, Path(paths["ecs_parquet_dir"]), "windows_evtx")
     return ecs_parquet_dir
 
 
@@ -10,6 +10,7 @@ import pandas as pd
 from dateutil import tz
 from models.utils import get_paths
 from parsers.base_reader import write_partitioned_parquet
+from pipeline.profiling import file_size, record
 
 # Traditional syslog auth format (e.g., "Jan 15 10:31:00 host sshd[pid]: msg")
 SYSLOG_RE = re.compile(
@@ -54,11 +55,19 @@ def parse_auth_logs(root: Path = Path("sample_data")) -> Path:
     - Windows CBS/CSI có năm đầy đủ -> giữ nguyên
     Ghi ra data/ecs_parquet/syslog_auth/dt=YYYY-MM-DD/
     """
+    stats = {"rows_in": 0, "rows_out": 0, "bytes_read": 0}
+    with record("ingest", source="syslog_auth") as met:
+        out_root = _parse_auth_logs(root, stats)
+        met.rows_in, met.rows_out, met.bytes_read = stats["rows_in"], stats["rows_out"], stats["bytes_read"]
+    return out_root
+
+def _parse_auth_logs(root: Path, stats: Dict[str, int]) -> Path:
     paths = get_paths()
     out_root = Path(paths["ecs_parquet_dir"]).resolve()
     log_files = list(root.rglob("*.log"))
     if not log_files:
         return out_root
+    stats["bytes_read"] = file_size(*log_files)
 
     CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", "200000"))
     buf: List[Dict] = []
@@ -67,6 +76,7 @@ def parse_auth_logs(root: Path = Path("sample_data")) -> Path:
         nonlocal buf
         if not buf:
             return
+        stats["rows_in"] += len(buf)
         df = pd.DataFrame(buf); buf = []
         df = df.dropna(subset=["@timestamp"])
         df["@timestamp"] = pd.to_datetime(df["@timestamp"], utc=True, errors="coerce")
@@ -79,6 +89,7 @@ def parse_auth_logs(root: Path = Path("sample_data")) -> Path:
             "host.name","user.name","process.name","source.ip","message","log.file.path","dt"
         ]
         cols = [c for c in keep_cols if c in df.columns]
+        stats["rows_out"] += len(df)
         # ghi partition theo dt dưới dataset 'syslog_auth'
         try:
             write_partitioned_parquet(df[cols], out_root, "syslog_auth")
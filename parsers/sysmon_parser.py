@@ -6,6 +6,7 @@ import pandas as pd
 from models.utils import get_paths, load_yaml
 from parsers.base_reader import read_jsonl, write_partitioned_parquet
 from parsers.ecs_mapper import map_record
+from pipeline.profiling import file_size, record
 
 
 def parse_sysmon() -> Path:
@@ -16,13 +17,16 @@ def parse_sysmon() -> Path:
     mapping = load_yaml(Path(__file__).resolve().parents[1] / "config" / "ecs_mapping.yaml")
     cfg = mapping["sysmon"]
 
-    records: List[Dict] = read_jsonl(raw)
-    ecs_rows = [map_record(rec, cfg) for rec in records]
-    df = pd.DataFrame(ecs_rows)
-    df["event.module"] = "sysmon"
-    df["event.dataset"] = "sysmon"
-    df = df.dropna(subset=["@timestamp"])  # ensure ts present
-    write_partitioned_parquet(df, Path(paths["ecs_parquet_dir"]), "sysmon")
+    with record("ingest", source="sysmon") as m:
+        records: List[Dict] = read_jsonl(raw)
+        m.bytes_read, m.rows_in = file_size(raw), len(records)
+        ecs_rows = [map_record(rec, cfg) for rec in records]
+        df = pd.DataFrame(ecs_rows)
+        df["event.module"] = "sysmon"
+        df["event.dataset"] = "sysmon"
+        df = df.dropna(subset=["@timestamp"])  # ensure ts present
+        m.rows_out = len(df)
+        write_partitioned_parquet(df, Path(paths["ecs_parquet_dir"]), "sysmon")
     return ecs_parquet_dir
 
 
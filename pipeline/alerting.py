@@ -1,17 +1,232 @@
-from typing import Tuple
+"""Chọn alert (Tiếng Việt)
+
+- Ngưỡng toàn cục từ sketch.json (explain.thresholding), không nạp điểm
+- Có scores/dt=*: duyệt thẳng các partition, chỉ đọc row group có max(anom.score) vượt ngưỡng
+  (thống kê Parquet, cache theo mtime), theo thứ tự max giảm dần; dừng khi row group kế tiếp
+  không thể vào top-N (heap giới hạn top_n phần tử)
+- Lọc theo khoảng ngày (cắt bớt partition dt=* và row group theo @timestamp) và theo host.name
+"""
+
+import heapq
+import itertools
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
-from explain.thresholding import compute_threshold
+from explain.thresholding import compute_threshold, entity_thresholds, load_sketch, threshold_from_sketch
+from models.infer import SCORE_COL, TOPK_FILENAME
 from models.utils import load_models_config
 
+DateLike = Union[str, date, datetime, pd.Timestamp]
+
+# đường dẫn file -> ((mtime_ns, size), [(row_group, score_max, ts_min, ts_max)])
+_STATS_CACHE: Dict[str, Tuple[Tuple[int, int], List[Tuple]]] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def _rowgroup_stats(path: Path) -> List[Tuple]:
+    st = path.stat()
+    stamp = (st.st_mtime_ns, st.st_size)
+    key = str(path)
+    with _STATS_LOCK:
+        hit = _STATS_CACHE.get(key)
+        if hit is not None and hit[0] == stamp:
+            return hit[1]
+    md = pq.ParquetFile(path).metadata
+    names = [md.schema.column(i).path for i in range(md.num_columns)]
+    score_i = names.index(SCORE_COL) if SCORE_COL in names else None
+    ts_i = names.index("@timestamp") if "@timestamp" in names else None
+    out = []
+    for g in range(md.num_row_groups):
+        rg = md.row_group(g)
+        if rg.num_rows == 0:
+            continue
+        score_max = ts_min = ts_max = None
+        if score_i is not None:
+            s = rg.column(score_i).statistics
+            if s is not None and s.has_min_max:
+                score_max = float(s.max)
+        if ts_i is not None:
+            s = rg.column(ts_i).statistics
+            if s is not None and s.has_min_max:
+                ts_min, ts_max = pd.Timestamp(s.min), pd.Timestamp(s.max)
+        out.append((g, score_max, ts_min, ts_max))
+    with _STATS_LOCK:
+        _STATS_CACHE[key] = (stamp, out)
+    return out
+
+
+def _utc(v: Optional[DateLike]) -> Optional[pd.Timestamp]:
+    if v is None:
+        return None
+    ts = pd.Timestamp(v)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _overlaps(lo, hi, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> bool:
+    if lo is None or hi is None:
+        return True
+    lo, hi = _utc(lo), _utc(hi)
+    return not ((start is not None and hi < start) or (end is not None and lo > end))
+
+
+def _partition_in_range(dt_dir: Path, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> bool:
+    try:
+        day = pd.Timestamp(dt_dir.name.split("=", 1)[1], tz="UTC")
+    except (IndexError, ValueError):
+        return True
+    return _overlaps(day, day + pd.Timedelta(days=1) - pd.Timedelta(1, "ns"), start, end)
+
+
+def _normalize_end(end: Optional[DateLike]) -> Optional[pd.Timestamp]:
+    """end chỉ có ngày (date hoặc chuỗi không có giờ) -> tính đến hết ngày đó."""
+    ts = _utc(end)
+    if ts is None:
+        return None
+    date_only = (isinstance(end, date) and not isinstance(end, datetime)) or (isinstance(end, str) and ":" not in end)
+    return ts + pd.Timedelta(days=1) - pd.Timedelta(1, "ns") if date_only else ts
 
-def select_alerts(scores_path: str) -> Tuple[pd.DataFrame, float]:
+
+def _select_from_partitions(
+    parts: List[Path],
+    thr: float,
+    top_n: int,
+    start: Optional[pd.Timestamp],
+    end: Optional[pd.Timestamp],
+    hosts: Optional[List[str]],
+    per_entity: Dict[str, Dict[str, float]],
+) -> pd.DataFrame:
+    # Ứng viên (row group) có thể chứa dòng >= ngưỡng, xếp theo max giảm dần
+    cands = []
+    for p in parts:
+        for g, score_max, ts_min, ts_max in _rowgroup_stats(p):
+            if score_max is not None and score_max < thr:
+                continue
+            if not _overlaps(ts_min, ts_max, start, end):
+                continue
+            cands.append((float("inf") if score_max is None else score_max, str(p), g))
+    cands.sort(key=lambda c: c[0], reverse=True)
+
+    heap: List[Tuple[float, int, dict]] = []  # min-heap top_n theo điểm
+    seq = itertools.count()
+    files: Dict[str, pq.ParquetFile] = {}
+    for score_max, path, g in cands:
+        if len(heap) >= top_n and score_max <= heap[0][0]:
+            break  # các row group còn lại đều không vượt được phần tử nhỏ nhất đang giữ
+        pf = files.get(path) or files.setdefault(path, pq.ParquetFile(path))
+        table = pf.read_row_group(g)
+        floor = max(thr, heap[0][0]) if len(heap) >= top_n else thr
+        mask = pc.greater_equal(table[SCORE_COL], floor)
+        if start is not None or end is not None:
+            ts = table["@timestamp"]
+            if start is not None:
+                mask = pc.and_(mask, pc.greater_equal(ts, _ts_scalar(start, ts.type)))
+            if end is not None:
+                mask = pc.and_(mask, pc.less_equal(ts, _ts_scalar(end, ts.type)))
+        if hosts and "host.name" in table.column_names:
+            host = pc.fill_null(table["host.name"].cast(pa.string()), "unknown")  # như sketch theo host
+            mask = pc.and_(mask, pc.is_in(host, value_set=_string_array(hosts)))
+        elif hosts:
+            continue
+        rows = table.filter(pc.fill_null(mask, False))
+        if rows.num_rows == 0:
+            continue
+        df = _apply_entity_thresholds(rows.to_pandas(), per_entity, thr)
+        df = df.nlargest(top_n, SCORE_COL)  # row group chỉ góp tối đa top_n dòng vào heap
+        for rec, score in zip(df.to_dict("records"), df[SCORE_COL].to_numpy()):
+            item = (float(score), next(seq), rec)
+            if len(heap) < top_n:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    if not heap:
+        return pd.DataFrame()
+    ordered = sorted(heap, key=lambda it: (-it[0], it[1]))
+    return pd.DataFrame.from_records([it[2] for it in ordered])
+
+
+def _ts_scalar(ts: pd.Timestamp, typ: pa.DataType) -> pa.Scalar:
+    return pa.scalar(ts.value, type=pa.timestamp("ns", "UTC")).cast(typ)
+
+
+def _string_array(values: Iterable[str]) -> pa.Array:
+    return pa.array([str(v) for v in values], type=pa.string())
+
+
+def _apply_entity_thresholds(df: pd.DataFrame, per_entity: Dict[str, Dict[str, float]], thr: float) -> pd.DataFrame:
+    for col, per_key in per_entity.items():
+        if col not in df.columns or not per_key or df.empty:
+            continue
+        keys = df[col].astype(object).where(df[col].notna(), "unknown").astype(str)
+        df = df[df[SCORE_COL] >= keys.map(per_key).fillna(thr).to_numpy()]
+    return df
+
+
+def select_alerts(
+    scores_path: str,
+    start: Optional[DateLike] = None,
+    end: Optional[DateLike] = None,
+    hosts: Optional[Iterable[str]] = None,
+    top_n: Optional[int] = None,
+) -> Tuple[pd.DataFrame, float]:
+    """
+    Ngưỡng toàn cục đọc từ sketch.json (gộp từ sketch của từng partition, không nạp điểm);
+    chưa có sketch thì ước lượng trên scores.parquet (mẫu đều ở chế độ partition).
+    Có scores/dt=*: top-N lấy thẳng từ partition với cắt tỉa theo thống kê row group;
+    ngược lại từ scores_topk.parquet (top-K chính xác) hoặc scores.parquet.
+    Thực thể ồn (scoring.adaptive_thresholds) phải vượt thêm ngưỡng riêng của mình.
+    start/end (ngày hoặc thời điểm, UTC) và hosts lọc alert.
+    """
     cfg = load_models_config()
-    top_n = cfg.get("scoring", {}).get("top_n", 10)
+    top_n = int(top_n or cfg.get("scoring", {}).get("top_n", 10))
+    start_ts, end_ts = _utc(start), _normalize_end(end)
+    host_list = [str(h) for h in hosts] if hosts else None
+
+    scores_path = Path(scores_path)
+    if scores_path.is_dir():  # score_features_large() trả về thư mục scores
+        scores_path = scores_path / "scores.parquet"
+    scores_root = scores_path.parent
+    topk_path = scores_path.with_name(TOPK_FILENAME)
+    sketches = load_sketch(scores_root)
+    parts = sorted(
+        p for p in scores_root.glob("dt=*/part.parquet") if _partition_in_range(p.parent, start_ts, end_ts)
+    )
+
+    if sketches is not None:
+        thr, _ = threshold_from_sketch(sketches, cfg)
+        per_entity = entity_thresholds(sketches, thr, cfg)
+        if parts or any(scores_root.glob("dt=*")):
+            high = _select_from_partitions(parts, thr, top_n, start_ts, end_ts, host_list, per_entity)
+            return high, thr
+        df = pd.read_parquet(topk_path if topk_path.exists() else scores_path)
+    else:
+        per_entity = {}
+        df = pd.read_parquet(scores_path)
+        thr, _ = compute_threshold(df[SCORE_COL], cfg)
+        if topk_path.exists():
+            df = pd.read_parquet(topk_path)
 
-    df = pd.read_parquet(scores_path)
-    thr, _ = compute_threshold(df["anom.score"]) 
-    high = df[df["anom.score"] >= thr].copy()
-    high = high.sort_values("anom.score", ascending=False).head(top_n)
+    high = df[df[SCORE_COL] >= thr]
+    if start_ts is not None or end_ts is not None:
+        ts = pd.to_datetime(high["@timestamp"], utc=True, errors="coerce")
+        keep = pd.Series(True, index=high.index)
+        if start_ts is not None:
+            keep &= ts >= start_ts
+        if end_ts is not None:
+            keep &= ts <= end_ts
+        high = high[keep]
+    if host_list:
+        if "host.name" in high.columns:
+            high = high[high["host.name"].astype(object).where(high["host.name"].notna(), "unknown").astype(str).isin(host_list)]
+        else:
+            high = high.iloc[0:0]
+    high = _apply_entity_thresholds(high.copy(), per_entity, thr)
+    high = high.sort_values(SCORE_COL, ascending=False).head(top_n)
     return high, thr
@@ -0,0 +1,271 @@
+"""Benchmark đầu-cuối của pipeline trên dữ liệu tổng hợp (Tiếng Việt)
+
+- Sinh dữ liệu bằng pipeline.synth vào một thư mục làm việc riêng (LOGANOM_WORKDIR), không đụng data/
+- Chạy toàn bộ DAG (`demo`) trong process con với PIPELINE_RUN_ID cố định, AI_BACKEND=offline
+- Mỗi stage: wall time (dag_state), rows vào/ra, MB đọc/ghi, CPU, peak RSS (pipeline.profiling), rows/s
+- Kết quả ghi <logs_dir>/benchmarks/pipeline_<thời điểm>.json (logs_dir của repo, không phải workdir);
+  so với lần chạy trước có cùng tham số để hồi quy hiện ra bằng con số (cột vs_prev = s / s trước)
+- run_import_benchmark(): thời gian import (mỗi lần một process mới, lấy min, trừ thời gian khởi động
+  python trống) của `cli.anom_score --help`, các module chính và các import cấp module của từng trang UI;
+  ghi <logs_dir>/benchmarks/imports_<thời điểm>.json, vượt budget thì báo lỗi
+"""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from models.utils import CONFIG_DIR, PROJECT_ROOT, get_paths, load_yaml
+from pipeline.synth import generate
+
+# stage của DAG -> (stage, source) trong metrics của pipeline.profiling
+_METRIC_KEYS = {
+    "ingest:windows_evtx": ("ingest", "windows_evtx"),
+    "ingest:sysmon": ("ingest", "sysmon"),
+    "ingest:zeek_conn": ("ingest", "zeek_conn"),
+    "ingest:syslog_auth": ("ingest", "syslog_auth"),
+    "ingest:custom_csv": ("ingest", "custom_csv"),
+    "featurize": ("featurize", None),
+    "train": ("train", None),
+    "score": ("score", None),
+    "rollup": ("rollup", None),
+    "bundle": ("bundle", None),
+}
+
+# chạy đúng các câu import ở cấp module của file trang (argv[1]), không chạy phần vẽ: import nặng
+# thêm vào trang được đo mà không phải chép lại danh sách import ở đây
+_PAGE_IMPORTS = (
+    "import ast, sys; p = sys.argv[1]; tree = ast.parse(open(p, encoding='utf-8').read()); "
+    "body = [n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))]; "
+    "exec(compile(ast.Module(body, []), p, 'exec'), {'__name__': '__page__', '__file__': p})"
+)
+
+# tên -> (argv sau `python`, là đường nhanh bị giới hạn bởi budget hay chỉ để theo dõi)
+IMPORT_TARGETS = {
+    "cli --help": (["-m", "cli.anom_score", "--help"], True),
+    "ui:overview": (["-c", _PAGE_IMPORTS, "ui/pages/1_Overview.py"], True),
+    "ui:hosts": (["-c", _PAGE_IMPORTS, "ui/pages/2_Hosts.py"], True),
+    "ui:alerts": (["-c", _PAGE_IMPORTS, "ui/pages/3_Alerts.py"], True),
+    "models.utils": (["-c", "import models.utils"], False),
+    "pipeline.profiling": (["-c", "import pipeline.profiling"], False),
+    "pipeline.dag": (["-c", "import pipeline.dag"], False),
+    "pipeline.bundle": (["-c", "import pipeline.bundle"], False),
+    "pipeline.stream": (["-c", "import pipeline.stream"], False),
+    "models.infer": (["-c", "import models.infer"], False),
+    "explain.shap_explain": (["-c", "import explain.shap_explain"], False),
+}
+
+
+def _workdir_path(workdir: Path, key: str) -> Path:
+    # như get_paths() của process con (LOGANOM_WORKDIR=workdir)
+    return workdir / load_yaml(CONFIG_DIR / "paths.yaml")[key]
+
+
+def _stage_table(workdir: Path, rid: str, gen: Dict, gen_s: float) -> pd.DataFrame:
+    with open(_workdir_path(workdir, "cache_dir") / "dag_state.json", "r", encoding="utf-8") as f:
+        state = json.load(f)
+    metrics_path = _workdir_path(workdir, "logs_dir") / "metrics" / f"{rid}.jsonl"
+    metrics = pd.read_json(metrics_path, lines=True) if metrics_path.exists() else pd.DataFrame()
+
+    rows = [{"stage": "generate", "seconds": gen_s, "rows_in": 0, "rows_out": gen["events"],
+             "mb_read": 0.0, "mb_written": gen["bytes"] / 2**20, "cpu_s": None, "peak_rss_mb": None}]
+    for name, (stage, source) in _METRIC_KEYS.items():
+        rec = state.get(name, {})
+        sel = metrics[metrics["stage"] == stage] if not metrics.empty else metrics
+        if source is not None and not sel.empty:
+            sel = sel[sel.get("source") == source] if "source" in sel.columns else sel.iloc[0:0]
+        rows.append({
+            "stage": name,
+            "seconds": rec.get("seconds"),
+            "rows_in": int(sel["rows_in"].sum()) if not sel.empty else 0,
+            "rows_out": int(sel["rows_out"].sum()) if not sel.empty else 0,
+            "mb_read": float(sel["bytes_read"].sum()) / 2**20 if not sel.empty else 0.0,
+            "mb_written": float(sel["bytes_written"].sum()) / 2**20 if not sel.empty else 0.0,
+            "cpu_s": float(sel["cpu_s"].sum()) if not sel.empty else None,
+            "peak_rss_mb": float(sel["peak_rss"].max()) / 2**20 if not sel.empty else None,
+        })
+    table = pd.DataFrame(rows)
+    secs = pd.to_numeric(table["seconds"], errors="coerce")
+    rows_n = table["rows_in"].where(table["rows_in"] > 0, table["rows_out"])
+    table["rows_per_s"] = (rows_n / secs.where(secs > 0)).fillna(0.0)
+    return table
+
+
+def _previous(out_dir: Path, params: Dict) -> Optional[Dict]:
+    for p in sorted(out_dir.glob("pipeline_*.json"), reverse=True):
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                prev = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if prev.get("params") == params:
+            return prev
+    return None
+
+
+def run_pipeline_benchmark(
+    events: int = 1_000_000,
+    hosts: int = 200,
+    users: int = 500,
+    days: float = 7.0,
+    seed: int = 42,
+    workdir: Optional[Path] = None,
+    keep: bool = False,
+) -> pd.DataFrame:
+    """
+    Sinh dữ liệu rồi chạy cả pipeline; trả về bảng một dòng mỗi stage (attrs: path, run_id, workdir).
+    workdir: thư mục làm việc (mặc định thư mục tạm, bị xoá sau khi chạy trừ khi keep=True).
+    """
+    out_dir = Path(get_paths()["logs_dir"]) / "benchmarks"  # của repo: đọc trước khi đổi workdir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = workdir is None
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="loganom-bench-")).resolve()
+    sample_dir = workdir / "sample_data"
+    rid = f"bench-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    params = {"events": events, "hosts": hosts, "users": users, "days": days, "seed": seed}
+    try:
+        print(f"[bench] generating {events:,} events into {sample_dir}")
+        t0 = time.perf_counter()
+        gen = generate(sample_dir, events=events, hosts=hosts, users=users, days=days, seed=seed)
+        gen_s = time.perf_counter() - t0
+
+        env = dict(os.environ)
+        env.update({
+            "LOGANOM_WORKDIR": str(workdir),
+            "SAMPLE_DATA_DIR": str(sample_dir),
+            "SYSLOG_DEFAULT_YEAR": str(gen["syslog_year"]),
+            "TZ": "UTC",
+            "PIPELINE_RUN_ID": rid,
+            "PIPELINE_METRICS": "1",
+            "AI_BACKEND": "offline",
+        })
+        print(f"[bench] running pipeline (run {rid})")
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "cli.anom_score", "demo"], cwd=str(PROJECT_ROOT), env=env,
+                       check=True)
+        total_s = time.perf_counter() - t0
+
+        table = _stage_table(workdir, rid, gen, gen_s)
+        prev = _previous(out_dir, params)
+        if prev:
+            before = {r["stage"]: r.get("seconds") for r in prev["stages"]}
+            table["vs_prev"] = [
+                (s / before[n]) if before.get(n) and s is not None and pd.notna(s) else None
+                for n, s in zip(table["stage"], table["seconds"])
+            ]
+    finally:
+        if tmp and not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "run_id": rid,
+        "params": params,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "pipeline_seconds": round(total_s, 3),
+        "events_written": gen["events"],
+        "per_source": gen["per_source"],
+        "attacks": gen["attacks"],
+        "system": {"python": platform.python_version(), "platform": platform.platform(),
+                   "cpus": os.cpu_count()},
+        "previous": prev["run_id"] if prev else None,
+        "stages": json.loads(table.to_json(orient="records")),
+    }
+    path = out_dir / f"pipeline_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    table.attrs.update({"path": str(path), "run_id": rid, "workdir": str(workdir),
+                        "pipeline_seconds": total_s, "events": gen["events"]})
+    return table
+
+
+def _time_argv(argv: List[str], repeats: int) -> Optional[float]:
+    """Min wall time (giây) của `python <argv>` qua repeats lần; None nếu lệnh lỗi (thiếu module...)."""
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, *argv], cwd=str(PROJECT_ROOT), stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+        dt = time.perf_counter() - t0
+        if proc.returncode != 0:
+            return None
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def _heaviest_imports(argv: List[str], top: int = 3) -> List[Dict]:
+    # -X importtime: "import time: self [us] | cumulative | imported package" (module con thụt lề);
+    # giữ các package cấp cao nhất ngoài repo (pandas, typer, ...) theo thời gian cumulative
+    proc = subprocess.run([sys.executable, "-X", "importtime", *argv], cwd=str(PROJECT_ROOT),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    local = {p.name for p in PROJECT_ROOT.iterdir() if p.is_dir()}
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # dòng tiêu đề hoặc không phải của importtime
+        name = parts[2].strip()
+        if "." in name or name in local:
+            continue
+        rows.append({"module": name, "ms": int(parts[1]) / 1000.0})
+    return sorted(rows, key=lambda r: r["ms"], reverse=True)[:top]
+
+
+def run_import_benchmark(repeats: int = 5, budget_ms: Optional[float] = None) -> pd.DataFrame:
+    """
+    Một dòng mỗi target trong IMPORT_TARGETS: ms (đã trừ khởi động python trống), vs_prev, heaviest.
+    budget_ms: giới hạn cho các đường nhanh (--help, trang UI); cột over_budget đánh dấu target vượt.
+    Target không chạy được (thiếu streamlit...) có status "unavailable" và không tính vào budget.
+    """
+    out_dir = Path(get_paths()["logs_dir"]) / "benchmarks"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base = _time_argv(["-c", "pass"], repeats) or 0.0
+    print(f"[bench-imports] python startup {base * 1000:.1f} ms, {repeats} repeat(s) per target")
+
+    prev = None
+    for p in sorted(out_dir.glob("imports_*.json"), reverse=True):
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                prev = {r["target"]: r.get("ms") for r in json.load(f)["targets"]}
+            break
+        except (OSError, ValueError, KeyError):
+            continue
+
+    rows = []
+    for name, (argv, fast) in IMPORT_TARGETS.items():
+        t = _time_argv(argv, repeats)
+        ms = None if t is None else max(0.0, (t - base) * 1000.0)
+        rows.append({
+            "target": name,
+            "status": "ok" if ms is not None else "unavailable",
+            "ms": ms,
+            "fast_path": fast,
+            "over_budget": bool(fast and budget_ms is not None and ms is not None and ms > budget_ms),
+            "vs_prev": (ms / prev[name]) if prev and prev.get(name) and ms is not None else None,
+            "heaviest": ", ".join(f"{h['module']} {h['ms']:.0f}ms" for h in _heaviest_imports(argv))
+            if ms is not None else "",
+        })
+    table = pd.DataFrame(rows)
+
+    result = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "repeats": repeats,
+        "startup_ms": round(base * 1000.0, 3),
+        "budget_ms": budget_ms,
+        "system": {"python": platform.python_version(), "platform": platform.platform(),
+                   "cpus": os.cpu_count()},
+        "targets": json.loads(table.to_json(orient="records")),
+    }
+    path = out_dir / f"imports_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    table.attrs.update({"path": str(path), "startup_ms": base * 1000.0})
+    return table
@@ -1,178 +1,287 @@
-import io
+"""Forensic bundle (Tiếng Việt)
+
+- Mỗi artifact được ghi thẳng vào entry của file zip, vừa ghi vừa băm (không qua thư mục tạm)
+- Ngữ cảnh ECS ghi dạng JSON Lines theo lô (to_dict + json.dumps từng bản ghi, không iterrows)
+- Top alert được gom thành incident (pipeline.incidents), mỗi incident một bundle incident_{i}.zip;
+  bundle cho một alert riêng lẻ (trang Alerts, tạo theo yêu cầu) vẫn là alert_{i}.zip
+- incidents.json trong bundles_dir: khoá alert (pipeline.incidents.alert_key) -> incident_{i}.zip, để UI tìm
+  bundle của alert đang chọn; chỉ khi mọi bundle đã ghi xong mới xoá incident_*.zip cũ không còn dùng
+- Các bundle được đóng gói song song (BUNDLE_WORKERS luồng), dùng chung model đã nạp,
+  danh sách file lake và cache row group của pipeline.context
+- explainer, model store (joblib) và lớp AI chỉ được import khi thật sự đóng gói bundle
+"""
+
+import hashlib
 import json
-from datetime import timedelta
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable, List, Optional
 import zipfile
 
-import joblib
+import numpy as np
 import pandas as pd
 
-from explain.shap_explain import top_shap_for_rows
-from models.utils import get_paths, write_json, sha256_file
+from models.utils import get_paths, write_json
 
-from ai.agent import analyze_alert
 from pipeline.coc import build_coc
+from pipeline.context import context_files, load_context
+from pipeline.hash_cache import file_records
+from pipeline.incidents import alert_key, group_incidents, incident_members, summarize_incidents
+from pipeline.profiling import file_size, record
 
+JSONL_BATCH_ROWS = 10_000
+INCIDENT_INDEX = "incidents.json"
 
-def _load_model_payload():
-    paths = get_paths()
-    model_path = Path(paths["models_dir"]) / "isolation_forest.joblib"
-    return joblib.load(model_path)
+
+class _HashingZip:
+    """Ghi entry vào zip và ghi lại sha256/size của từng entry (cho manifest và COC)."""
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self.zf = zf
+        self.records: Dict[str, Dict] = {}
+
+    def write_chunks(self, name: str, chunks: Iterable[bytes]) -> None:
+        h = hashlib.sha256()
+        size = 0
+        with self.zf.open(name, "w", force_zip64=True) as f:
+            for chunk in chunks:
+                h.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        self.records[name] = {"sha256": h.hexdigest(), "size": size}
+
+    def write_text(self, name: str, text: str) -> None:
+        self.write_chunks(name, [text.encode("utf-8")])
+
+    def write_json(self, name: str, obj) -> None:
+        self.write_text(name, json.dumps(obj, indent=2, default=str))
+
+
+def _is_null(v) -> bool:
+    return v is None or v is pd.NaT or v is pd.NA or (isinstance(v, float) and v != v)
+
+
+def _jsonl_chunks(df: pd.DataFrame, batch_rows: int = JSONL_BATCH_ROWS) -> Iterable[bytes]:
+    """JSON Lines, mỗi dòng bỏ các trường null (như row.dropna().to_dict() trước đây)."""
+    if df.empty:
+        return
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].astype(str).where(df[col].notna(), None)
+    for start in range(0, len(df), batch_rows):
+        # to_dict trả về số Python (float giữ đủ độ chính xác khi json.dumps)
+        records = df.iloc[start:start + batch_rows].to_dict(orient="records")
+        text = "".join(
+            json.dumps({k: v for k, v in r.items() if not _is_null(v)}, default=str) + "\n" for r in records
+        )
+        yield text.encode("utf-8")
 
 
-def build_bundle_for_alert(alert_row: pd.Series, idx: int, threshold: float) -> Path:
+def _lake_files(ecs_dir: Path) -> List[Dict]:
+    out = []
+    for p in sorted(q.resolve() for q in ecs_dir.rglob("*.parquet")):
+        st = p.stat()
+        out.append({"path": str(p), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return out
+
+
+def _context_range(rows: pd.DataFrame):
+    ts = pd.to_datetime(rows["@timestamp"], utc=True)
+    return ts.min() - pd.Timedelta(minutes=5), ts.max() + pd.Timedelta(minutes=5)
+
+
+def _lead_index(rows: pd.DataFrame) -> int:
+    return int(np.argmax(rows["anom.score"].to_numpy(dtype=np.float64)))
+
+
+def _write_bundle(bundle_path: Path, rows: pd.DataFrame, shap_tops: List[Dict], threshold: float,
+                  payload: Dict, lake_files: Optional[List[Dict]], incident: Optional[Dict] = None,
+                  ai_analysis: Optional[Dict] = None) -> Path:
+    """
+    Ghi bundle cho một alert (rows một dòng) hoặc một incident (nhiều dòng cùng thực thể):
+    ngữ cảnh là hợp các cửa sổ ±5m, phân tích AI chạy trên alert điểm cao nhất.
+    incident: nội dung incident.json; khi có, features/shap_explanation là danh sách theo alert.
+    ai_analysis: kết quả đã phân tích sẵn theo lô (ai.service.analyze_alerts), None -> phân tích tại chỗ.
+    """
     paths = get_paths()
     ecs_dir = Path(paths["ecs_parquet_dir"])
     features_path = Path(paths["features_dir"]) / "features.parquet"
     scores_path = Path(paths["scores_dir"]) / "scores.parquet"
+    single = incident is None
 
-    # Load ECS union for context
-    ecs_parts = list(ecs_dir.rglob("*.parquet"))
-    ecs_df = pd.concat([pd.read_parquet(p) for p in ecs_parts], ignore_index=True)
-    ecs_df["@timestamp"] = pd.to_datetime(ecs_df["@timestamp"], utc=True, errors="coerce")
+    # Context window ±5m: chỉ đọc các partition / row group giao cửa sổ
+    window = _context_range(rows)
+    raw_slice = load_context(*window)
+    # Chỉ băm các file giao cửa sổ; phần còn lại của lake ghi theo tham chiếu
+    ctx_parts = [p.resolve() for p in context_files(*window)]
 
-    # Context window ±5m
-    t0 = pd.to_datetime(alert_row["@timestamp"], utc=True)
-    mask = (ecs_df["@timestamp"] >= t0 - timedelta(minutes=5)) & (ecs_df["@timestamp"] <= t0 + timedelta(minutes=5))
-    raw_slice = ecs_df.loc[mask].copy()
-
-    # Features for the single alert row
-    feat_row = alert_row.to_dict()
-
-    # SHAP: compute on the single row against model
-    payload = _load_model_payload()
-    model = payload["model"]
-    feature_cols = payload["feature_cols"]
-    X = alert_row[feature_cols].fillna(0.0).to_frame().T
-    shap_top = top_shap_for_rows(model, X.values, feature_cols, top_k=5)[0]
+    lead_i = _lead_index(rows)
+    lead = rows.iloc[lead_i]
 
     # Model meta
     model_meta = {
         "algorithm": payload.get("meta", {}).get("algorithm", "IsolationForest"),
         "params": payload.get("meta", {}).get("params", {}),
         "score_threshold": float(threshold),
-        "alert_score": float(alert_row["anom.score"]),
+        "alert_score": float(lead["anom.score"]),
     }
+    if not single:
+        model_meta["alert_scores"] = [float(v) for v in rows["anom.score"]]
+
+    tmp_path = bundle_path.with_name(bundle_path.name + ".tmp")
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        out = _HashingZip(zf)
+
+        # 1) Raw logs context
+        out.write_chunks("raw_logs.jsonl", _jsonl_chunks(raw_slice))
+
+        # 2) Feature row(s), 3) SHAP explanation(s), 4) Model meta
+        if single:
+            out.write_json("features.json", lead.to_dict())
+            out.write_json("shap_explanation.json", shap_tops[0])
+        else:
+            out.write_json("incident.json", incident)
+            out.write_json("features.json", [r.to_dict() for _, r in rows.iterrows()])
+            out.write_json("shap_explanation.json", shap_tops)
+        out.write_json("model_meta.json", model_meta)
 
-    bundles_dir = Path(paths["bundles_dir"]).resolve()
-    bundles_dir.mkdir(parents=True, exist_ok=True)
-    bundle_path = bundles_dir / f"alert_{idx}.zip"
-
-    # Prepare files in a temp dir then write into zip
-    tmp_dir = bundles_dir / f"tmp_alert_{idx}"
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-
-    # 1) Raw logs context
-    raw_logs_path = tmp_dir / "raw_logs.jsonl"
-    with open(raw_logs_path, "w", encoding="utf-8") as f:
-        for _, row in raw_slice.iterrows():
-            json.dump(row.dropna().to_dict(), f, default=str)
-            f.write("\n")
-
-    # 2) Feature row (JSON)
-    features_path_json = tmp_dir / "features.json"
-    write_json(features_path_json, feat_row)
-
-    # 3) SHAP explanation
-    shap_path = tmp_dir / "shap_explanation.json"
-    write_json(shap_path, shap_top)
-
-    # 4) Model meta
-    model_meta_path = tmp_dir / "model_meta.json"
-    write_json(model_meta_path, model_meta)
-
-    # 5) AI agent analysis (JSON + Markdown)
-    ai_analysis = analyze_alert(alert_row, shap_top, raw_slice)
-    ai_json_path = tmp_dir / "ai_analysis.json"
-    write_json(ai_json_path, ai_analysis)
-    ai_md_path = tmp_dir / "ai_analysis.md"
-    with open(ai_md_path, "w", encoding="utf-8") as f:
-        f.write(ai_analysis.get("markdown", ""))
-
-    # 6) Evidence manifest (list parquet sources with hashes)
-    evidence_manifest = [
-        {"path": str(p.resolve()), "sha256": sha256_file(p), "size": p.stat().st_size}
-        for p in ecs_parts
-    ]
-    evidence_manifest_path = tmp_dir / "evidence_manifest.json"
-    write_json(evidence_manifest_path, evidence_manifest)
-
-    # 7) Chain-of-custody (COC)
-    coc = build_coc(
-        tmp_dir,
-        input_files=[scores_path, features_path, *ecs_parts],
-        extra_outputs=[
-            raw_logs_path,
-            features_path_json,
-            shap_path,
-            model_meta_path,
-            ai_json_path,
-            ai_md_path,
-            evidence_manifest_path,
-        ],
-    )
-    coc_path = tmp_dir / "coc.json"
-    write_json(coc_path, coc)
-
-    # 8) Bundle manifest (hash every file inside the bundle)
-    manifest = {"files": {}}
-    for p in [
-        raw_logs_path,
-        features_path_json,
-        shap_path,
-        model_meta_path,
-        ai_json_path,
-        ai_md_path,
-        evidence_manifest_path,
-        coc_path,
-    ]:
-        manifest["files"][p.name] = {
-            "sha256": sha256_file(p),
-            "size": p.stat().st_size,
-        }
-    manifest_path = tmp_dir / "manifest.json"
-    write_json(manifest_path, manifest)
-
-    # Write zip
-    with zipfile.ZipFile(bundle_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for p in [
-            raw_logs_path,
-            features_path_json,
-            shap_path,
-            model_meta_path,
-            ai_json_path,
-            ai_md_path,
-            evidence_manifest_path,
-            coc_path,
-            manifest_path,
-        ]:
-            zf.write(p, arcname=p.name)
-
-    # Cleanup temp files
-    for p in [
-        raw_logs_path,
-        features_path_json,
-        shap_path,
-        model_meta_path,
-        ai_json_path,
-        ai_md_path,
-        evidence_manifest_path,
-        coc_path,
-        manifest_path,
-    ]:
-        try:
-            p.unlink(missing_ok=True)
-        except Exception:
-            pass
-    try:
-        tmp_dir.rmdir()
-    except Exception:
-        pass
+        # 5) AI agent analysis (JSON + Markdown)
+        if ai_analysis is None:
+            from ai.agent import analyze_alert
 
+            ai_analysis = analyze_alert(lead, shap_tops[lead_i], raw_slice)
+        out.write_json("ai_analysis.json", ai_analysis)
+        out.write_text("ai_analysis.md", ai_analysis.get("markdown", ""))
+
+        # 6) Evidence manifest: file giao cửa sổ kèm hash (cache), các file khác chỉ path/size/mtime
+        ctx_set = {str(p) for p in ctx_parts}
+        lake_files = lake_files if lake_files is not None else _lake_files(ecs_dir)
+        out.write_json("evidence_manifest.json", {
+            "window": {"start": window[0].isoformat(), "end": window[1].isoformat()},
+            "context_files": file_records(ctx_parts),
+            "referenced_files": [f for f in lake_files if f["path"] not in ctx_set],
+        })
+
+        # 7) Chain-of-custody (COC)
+        coc = build_coc(
+            bundle_path,
+            input_files=[scores_path, features_path, *ctx_parts],
+            extra_outputs=[],
+            output_records=[{"path": f"{bundle_path.name}:{name}", **rec} for name, rec in out.records.items()],
+        )
+        out.write_json("coc.json", coc)
+
+        # 8) Bundle manifest (hash every file inside the bundle)
+        out.write_json("manifest.json", {"files": dict(out.records)})
+
+    os.replace(tmp_path, bundle_path)
     return bundle_path
 
 
-def build_bundles_for_top_alerts(top_alerts: pd.DataFrame, threshold: float) -> None:
-    for i, (_, row) in enumerate(top_alerts.iterrows(), start=1):
-        build_bundle_for_alert(row, i, threshold)
\ No newline at end of file
+def _write_bundle_profiled(bundle_path: Path, rows: pd.DataFrame, *args, **kwargs) -> Path:
+    with record("bundle.write", bundle=bundle_path.name) as m:
+        out = _write_bundle(bundle_path, rows, *args, **kwargs)
+        m.rows_in, m.bytes_written = len(rows), file_size(out)
+    return out
+
+
+def _bundles_dir() -> Path:
+    d = Path(get_paths()["bundles_dir"]).resolve()
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def build_bundle_for_alert(alert_row: pd.Series, idx: int, threshold: float,
+                           shap_top: Optional[Dict] = None, payload: Optional[Dict] = None,
+                           lake_files: Optional[List[Dict]] = None) -> Path:
+    """payload / lake_files: truyền sẵn khi đóng gói nhiều alert để không nạp lại cho từng bundle."""
+    from explain.shap_explain import explain_rows
+    from models.model_store import load_model_payload
+
+    # SHAP: dùng kết quả đã tính theo lô nếu có, ngược lại giải thích riêng dòng này
+    payload = payload if payload is not None else load_model_payload()
+    if shap_top is None:
+        shap_top = explain_rows(alert_row.to_frame().T, top_k=5)[0]
+    return _write_bundle_profiled(_bundles_dir() / f"alert_{idx}.zip", alert_row.to_frame().T, [shap_top],
+                                  threshold, payload, lake_files)
+
+
+def build_bundle_for_incident(members: pd.DataFrame, idx: int, threshold: float,
+                              shap_tops: Optional[List[Dict]] = None, payload: Optional[Dict] = None,
+                              lake_files: Optional[List[Dict]] = None,
+                              ai_analysis: Optional[Dict] = None) -> Path:
+    """Một bundle incident_{idx}.zip cho mọi alert của incident (members sắp theo thời gian)."""
+    from explain.shap_explain import explain_rows
+    from models.model_store import load_model_payload
+
+    payload = payload if payload is not None else load_model_payload()
+    if shap_tops is None:
+        shap_tops = explain_rows(members, top_k=5)
+    summary = summarize_incidents(members).iloc[0]
+    incident = {
+        "incident_id": idx,
+        "entity": summary["entity"],
+        "start": summary["start"].isoformat(),
+        "end": summary["end"].isoformat(),
+        "n_alerts": int(summary["n_alerts"]),
+        "max_score": float(summary["max_score"]),
+    }
+    return _write_bundle_profiled(_bundles_dir() / f"incident_{idx}.zip", members, list(shap_tops),
+                                  threshold, payload, lake_files, incident=incident, ai_analysis=ai_analysis)
+
+
+def build_bundles_for_top_alerts(top_alerts: pd.DataFrame, threshold: float) -> List[Path]:
+    """Gom top alert thành incident rồi tạo một bundle cho mỗi incident."""
+    if top_alerts.empty:
+        return []
+    with record("bundle") as m:
+        out = _build_incident_bundles(top_alerts, threshold)
+        m.rows_in, m.rows_out, m.bytes_written = len(top_alerts), len(out), file_size(*out)
+    return out
+
+
+def _build_incident_bundles(top_alerts: pd.DataFrame, threshold: float) -> List[Path]:
+    from ai.service import analyze_alerts
+    from explain.shap_explain import explain_rows
+    from models.model_store import load_model_payload
+
+    # Giải thích toàn bộ top alert trong một lần gọi explainer
+    top_alerts = group_incidents(top_alerts.reset_index(drop=True))
+    explanations = explain_rows(top_alerts, top_k=5)
+    payload = load_model_payload()
+    lake_files = _lake_files(Path(get_paths()["ecs_parquet_dir"]))
+    groups = incident_members(top_alerts)
+    print(f"[bundle] {len(top_alerts)} alert(s) -> {len(groups)} incident(s)")
+    shap_groups = [[explanations[j] for j in members.index] for members in groups]
+
+    # Phân tích AI của mọi incident chạy đồng thời (giới hạn và cache trong ai.service),
+    # không xếp hàng sau từng bundle
+    requests = []
+    for members, shap_tops in zip(groups, shap_groups):
+        lead_i = _lead_index(members)
+        requests.append((members.iloc[lead_i], shap_tops[lead_i], load_context(*_context_range(members))))
+    analyses = analyze_alerts(requests)
+
+    def _one(i: int) -> Path:
+        return build_bundle_for_incident(groups[i], i + 1, threshold, shap_tops=shap_groups[i],
+                                         payload=payload, lake_files=lake_files, ai_analysis=analyses[i])
+
+    bundles_dir = _bundles_dir()
+    (bundles_dir / INCIDENT_INDEX).unlink(missing_ok=True)  # chỉ số cũ trỏ theo số thứ tự incident cũ
+    workers = max(1, min(int(os.getenv("BUNDLE_WORKERS", "4")), len(groups)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        out = list(ex.map(_one, range(len(groups))))
+
+    # mọi bundle đã ghi xong: bỏ incident_*.zip của lần chạy trước không còn số thứ tự tương ứng;
+    # alert_*.zip do trang Alerts tạo theo yêu cầu được giữ nguyên
+    keep = {p.name for p in out}
+    for old in bundles_dir.glob("incident_*.zip"):
+        if old.name not in keep:
+            old.unlink(missing_ok=True)
+    index = {alert_key(r): p.name for members, p in zip(groups, out) for _, r in members.iterrows()}
+    tmp = bundles_dir / (INCIDENT_INDEX + ".tmp")
+    write_json(tmp, {"alerts": index})
+    os.replace(tmp, bundles_dir / INCIDENT_INDEX)
+    return out
@@ -2,11 +2,14 @@ import os
 import platform
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from models.utils import sha256_file  # uses existing helper
+from pipeline.hash_cache import file_records
 
-def build_coc(output_dir: Path, input_files: List[Path], extra_outputs: List[Path]) -> Dict:
+def build_coc(output_dir: Path, input_files: List[Path], extra_outputs: List[Path],
+              output_records: Optional[List[Dict]] = None) -> Dict:
+    """output_records: {"path", "sha256", "size"} đã băm sẵn (vd. entry ghi thẳng vào zip)."""
     created_at = datetime.utcnow().isoformat() + "Z"
     def _rec(paths: List[Path]):
         out = []
@@ -29,6 +32,7 @@ def build_coc(output_dir: Path, input_files: List[Path], extra_outputs: List[Pat
             "app_env": os.getenv("APP_ENV", "development"),
             "tz": os.getenv("TZ", "UTC"),
         },
-        "inputs": _rec(input_files),
-        "outputs": _rec(extra_outputs),
+        # Input (lake, model...) ít thay đổi: băm qua cache bền vững
+        "inputs": file_records(input_files),
+        "outputs": _rec(extra_outputs) + list(output_records or []),
     }
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Tra cứu ngữ cảnh ECS theo thời gian (Tiếng Việt)
+
+- Chỉ mở các partition <source>/dt=YYYY-MM-DD giao với cửa sổ (không rglob toàn bộ lake)
+- Trong mỗi file chỉ đọc row group có min/max @timestamp giao cửa sổ
+  (ingest ghi dữ liệu đã sắp theo @timestamp nên row group rất hẹp), chỉ các cột cần
+- Cache LRU các row group vừa đọc (CONTEXT_CACHE_MB), khoá theo file + mtime:
+  các alert gần nhau và các lần rerun của UI không đọc lại đĩa
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from models.utils import get_paths
+
+TS_COL = "@timestamp"
+
+# (path, mtime_ns, size) -> [(row_group, ts_min, ts_max)]
+_META: Dict[Tuple[str, int, int], List[Tuple[int, Optional[pd.Timestamp], Optional[pd.Timestamp]]]] = {}
+# (path, mtime_ns, size, row_group, columns) -> pa.Table; LRU theo tổng số byte
+_ROW_GROUPS: "OrderedDict[Tuple, pa.Table]" = OrderedDict()
+_CACHE_BYTES = 0
+_LOCK = threading.Lock()
+
+
+def _cache_limit() -> int:
+    return int(float(os.getenv("CONTEXT_CACHE_MB", "256")) * 1024 * 1024)
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def context_files(start, end, sources: Optional[Sequence[str]] = None) -> List[Path]:
+    """Các file Parquet của những partition dt= giao [start, end] (mọi source, hoặc chỉ `sources`)."""
+    root = Path(get_paths()["ecs_parquet_dir"])
+    if not root.exists():
+        return []
+    start, end = _utc(start), _utc(end)
+    days = pd.date_range(start.normalize(), end.normalize(), freq="D")
+    srcs = list(sources) if sources else sorted(p.name for p in root.iterdir() if p.is_dir())
+    files: List[Path] = []
+    for src in srcs:
+        for day in days:
+            d = root / src / f"dt={day.strftime('%Y-%m-%d')}"
+            if d.is_dir():
+                files.extend(sorted(d.glob("*.parquet")))
+    return files
+
+
+def _file_key(path: Path) -> Tuple[str, int, int]:
+    st = path.stat()
+    return str(path), st.st_mtime_ns, st.st_size
+
+
+def _row_groups(key: Tuple[str, int, int]):
+    with _LOCK:
+        hit = _META.get(key)
+    if hit is not None:
+        return hit
+    md = pq.ParquetFile(key[0]).metadata
+    names = [md.schema.column(i).path for i in range(md.num_columns)]
+    ts_i = names.index(TS_COL) if TS_COL in names else None
+    out = []
+    for g in range(md.num_row_groups):
+        lo = hi = None
+        if ts_i is not None:
+            s = md.row_group(g).column(ts_i).statistics
+            if s is not None and s.has_min_max:
+                lo, hi = _utc(s.min), _utc(s.max)
+        out.append((g, lo, hi))
+    with _LOCK:
+        _META[key] = out
+    return out
+
+
+def _read_row_group(key: Tuple[str, int, int], g: int, columns: Optional[Tuple[str, ...]]) -> pa.Table:
+    global _CACHE_BYTES
+    ckey = key + (g, columns)
+    with _LOCK:
+        hit = _ROW_GROUPS.get(ckey)
+        if hit is not None:
+            _ROW_GROUPS.move_to_end(ckey)
+            return hit
+    pf = pq.ParquetFile(key[0])
+    cols = None
+    if columns is not None:
+        present = set(pf.schema_arrow.names)
+        cols = [c for c in columns if c in present]
+    table = pf.read_row_group(g, columns=cols)
+    with _LOCK:
+        _ROW_GROUPS[ckey] = table
+        _CACHE_BYTES += table.nbytes
+        limit = _cache_limit()
+        while _CACHE_BYTES > limit and len(_ROW_GROUPS) > 1:
+            _, old = _ROW_GROUPS.popitem(last=False)
+            _CACHE_BYTES -= old.nbytes
+    return table
+
+
+def _ts_scalar(ts: pd.Timestamp, typ: pa.DataType) -> pa.Scalar:
+    return pa.scalar(ts.value, type=pa.timestamp("ns", "UTC")).cast(typ)
+
+
+def load_context(
+    start,
+    end,
+    columns: Optional[Sequence[str]] = None,
+    sources: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+) -> pd.DataFrame:
+    """Sự kiện ECS có @timestamp trong [start, end], sắp theo thời gian; columns=None -> mọi cột."""
+    start, end = _utc(start), _utc(end)
+    cols = None if columns is None else tuple(dict.fromkeys([TS_COL, *columns]))
+    tables = []
+    for path in context_files(start, end, sources):
+        key = _file_key(path)
+        for g, lo, hi in _row_groups(key):
+            if lo is not None and (hi < start or lo > end):
+                continue
+            table = _read_row_group(key, g, cols)
+            if TS_COL not in table.column_names or table.num_rows == 0:
+                continue
+            ts = table[TS_COL]
+            if not pa.types.is_timestamp(ts.type):
+                ts = pc.cast(ts, pa.timestamp("ns", "UTC"))
+            mask = pc.and_(pc.greater_equal(ts, _ts_scalar(start, ts.type)), pc.less_equal(ts, _ts_scalar(end, ts.type)))
+            part = table.filter(pc.fill_null(mask, False))
+            if part.num_rows:
+                tables.append(part.to_pandas())
+    if not tables:
+        return pd.DataFrame(columns=list(cols) if cols else [TS_COL])
+    df = pd.concat(tables, ignore_index=True)
+    df[TS_COL] = pd.to_datetime(df[TS_COL], utc=True, errors="coerce")
+    df = df.sort_values(TS_COL, kind="stable").reset_index(drop=True)
+    return df.head(limit) if limit else df
+
+
+def context_window(
+    t0,
+    minutes: float = 5,
+    columns: Optional[Sequence[str]] = None,
+    sources: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+) -> pd.DataFrame:
+    """Ngữ cảnh ±minutes quanh thời điểm t0 (như bundle và trang Alerts dùng)."""
+    t0 = _utc(t0)
+    w = timedelta(minutes=minutes)
+    return load_context(t0 - w, t0 + w, columns=columns, sources=sources, limit=limit)
+
+
+def clear_cache() -> None:
+    global _CACHE_BYTES
+    with _LOCK:
+        _META.clear()
+        _ROW_GROUPS.clear()
+        _CACHE_BYTES = 0
@@ -0,0 +1,335 @@
+"""Orchestrator dạng DAG cho pipeline (Tiếng Việt)
+
+- Mỗi stage khai báo input / output (file), stage phụ thuộc và phần config ảnh hưởng tới kết quả
+- Bỏ qua stage khi lần chạy thành công trước có cùng hash config, output còn đủ và
+  (output mới hơn mọi input, hoặc danh sách input (path, size, mtime) không đổi)
+- Trạng thái lưu ở <cache_dir>/dag_state.json: chạy lại sau lỗi sẽ bỏ qua các stage đã xong
+  và tiếp tục từ stage lỗi
+- Stage độc lập (ingest từng nguồn) chạy đồng thời trên DAG_WORKERS luồng
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from models.utils import CONFIG_DIR, get_paths, load_models_config
+
+STATE_FILENAME = "dag_state.json"
+
+_STATE_LOCK = threading.Lock()
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        inputs: Callable[[], List[Path]],
+        outputs: Callable[[], List[Path]],
+        deps: Iterable[str] = (),
+        config: Optional[Callable[[], Dict]] = None,
+        optional: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+        self.deps = list(deps)
+        self.config = config or (lambda: {})
+        # stage optional lỗi không chặn các stage phía sau (như ingest_all bỏ qua nguồn lỗi);
+        # trạng thái vẫn là failed nên lần chạy sau thử lại
+        self.optional = optional
+
+    def config_hash(self) -> str:
+        blob = json.dumps({"stage": self.name, "config": self.config()}, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _state_path() -> Path:
+    return Path(get_paths()["cache_dir"]) / STATE_FILENAME
+
+
+def load_state() -> Dict[str, Dict]:
+    try:
+        with open(_state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state: Dict[str, Dict]) -> None:
+    path = _state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _signature(files: List[Path]) -> str:
+    h = hashlib.sha256()
+    for p in sorted(str(f) for f in files):
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        h.update(f"{p}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _mtimes(files: List[Path]) -> List[int]:
+    out = []
+    for p in files:
+        try:
+            out.append(os.stat(p).st_mtime_ns)
+        except OSError:
+            pass
+    return out
+
+
+def _up_to_date(stage: Stage, record: Optional[Dict], inputs: List[Path], outputs: List[Path]) -> bool:
+    if not record or record.get("status") != "ok" or record.get("config_hash") != stage.config_hash():
+        return False
+    if record.get("outputs_sig") != _signature(outputs):  # output bị xoá / sửa ngoài pipeline
+        return False
+    out_m, in_m = _mtimes(outputs), _mtimes(inputs)
+    if out_m and in_m and max(in_m) <= min(out_m):
+        return True
+    # stage cập nhật tăng dần (vd. score bỏ qua partition không đổi) không ghi lại mọi output
+    return record.get("inputs_sig") == _signature(inputs)
+
+
+def run_dag(stages: List[Stage], force: Iterable[str] = (), workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    Chạy các stage theo thứ tự phụ thuộc; trả về {stage: "ran" | "skipped" | "failed" | "blocked"}.
+    force: tên stage luôn chạy lại. Stage lỗi làm các stage phía sau bị chặn; ném RuntimeError ở cuối.
+    Stage optional (ingest từng nguồn) lỗi chỉ được ghi lại, các stage phía sau vẫn chạy.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Stage {s.name} depends on unknown stage(s): {missing}")
+    force = set(force)
+    workers = workers or int(os.getenv("DAG_WORKERS", "4"))
+    state = load_state()
+    result: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    def _run(stage: Stage) -> str:
+        inputs, outputs = stage.inputs(), stage.outputs()
+        with _STATE_LOCK:
+            record = state.get(stage.name)
+        if stage.name not in force and _up_to_date(stage, record, inputs, outputs):
+            print(f"[dag] {stage.name}: up to date, skipped")
+            return "skipped"
+        t0 = time.perf_counter()
+        print(f"[dag] {stage.name}: running")
+        try:
+            stage.func()
+        except Exception as e:
+            with _STATE_LOCK:
+                state[stage.name] = {"status": "failed", "error": repr(e),
+                                     "finished_at": datetime.utcnow().isoformat() + "Z"}
+                _save_state(state)
+            raise
+        elapsed = time.perf_counter() - t0
+        with _STATE_LOCK:
+            state[stage.name] = {
+                "status": "ok",
+                "config_hash": stage.config_hash(),
+                "inputs_sig": _signature(stage.inputs()),
+                "outputs_sig": _signature(stage.outputs()),
+                "seconds": round(elapsed, 3),
+                "finished_at": datetime.utcnow().isoformat() + "Z",
+            }
+            _save_state(state)
+        print(f"[dag] {stage.name}: done in {elapsed:.2f}s")
+        return "ran"
+
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        while pending or running:
+            for s in list(pending):
+                if any(result.get(d) == "blocked" or (result.get(d) == "failed" and not by_name[d].optional)
+                       for d in s.deps):
+                    result[s.name] = "blocked"
+                    pending.remove(s)
+                elif all(result.get(d) in ("ran", "skipped") or (result.get(d) == "failed" and by_name[d].optional)
+                         for d in s.deps):
+                    running[ex.submit(_run, s)] = s
+                    pending.remove(s)
+            if not running:
+                if pending:  # còn stage nhưng không stage nào sẵn sàng: chu trình phụ thuộc
+                    raise ValueError(f"Dependency cycle among: {[s.name for s in pending]}")
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                s = running.pop(fut)
+                try:
+                    result[s.name] = fut.result()
+                except Exception as e:
+                    result[s.name] = "failed"
+                    if s.optional:
+                        print(f"[dag] {s.name}: failed (optional, continuing): {e}")
+                        continue
+                    errors[s.name] = repr(e)
+                    print(f"[dag] {s.name}: failed: {e}")
+
+    if errors:
+        raise RuntimeError(f"Pipeline failed at {sorted(errors)}; rerun to resume. Errors: {errors}")
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Pipeline demo: ingest (theo nguồn) -> featurize -> train -> score -> rollup, bundle
+
+
+def _files(root: Path, pattern: str) -> List[Path]:
+    return sorted(root.glob(pattern)) if root.exists() else []
+
+
+def _sample_root() -> Path:
+    return Path(os.getenv("SAMPLE_DATA_DIR", "sample_data"))
+
+
+def _ingest_jsonl(source: str, filename: str, func_path: str) -> Stage:
+    def _inputs():
+        p = Path(get_paths()["raw_data_dir"]) / filename
+        return [p] if p.exists() else []
+
+    def _run():
+        if not _inputs():
+            print(f"[ingest] {filename} not found, skip {source}")
+            return
+        module, _, name = func_path.rpartition(".")
+        getattr(importlib.import_module(module), name)()
+
+    return Stage(
+        f"ingest:{source}", _run, _inputs,
+        lambda: _files(Path(get_paths()["ecs_parquet_dir"]) / source, "dt=*/*.parquet"),
+        config=lambda: {"mapping": _signature([CONFIG_DIR / "ecs_mapping.yaml"])},
+        optional=True,
+    )
+
+
+def _ingest_syslog() -> None:
+    from parsers.log_parser import parse_auth_logs
+
+    parse_auth_logs(_sample_root())
+
+
+def _ingest_csv() -> None:
+    from pipeline.ingest import _ingest_csv_recursive
+
+    _ingest_csv_recursive(_sample_root())
+
+
+def _featurize() -> None:
+    from features.build_features import build_feature_table
+
+    build_feature_table()
+
+
+def _train() -> None:
+    from models.train_if import train_model
+
+    train_model()
+
+
+def _score_config() -> Dict:
+    from models.infer import explain_enabled
+
+    return {"explain": explain_enabled()}
+
+
+def _score() -> None:
+    from models.infer import score_features
+
+    score_features()
+
+
+def _rollup() -> None:
+    from pipeline.rollup import build_rollups
+
+    build_rollups()
+
+
+def _bundle() -> None:
+    from pipeline.alerting import select_alerts
+    from pipeline.bundle import build_bundles_for_top_alerts
+
+    top, thr = select_alerts(get_paths()["scores_dir"])
+    build_bundles_for_top_alerts(top, thr)
+
+
+def _ecs_files() -> List[Path]:
+    return _files(Path(get_paths()["ecs_parquet_dir"]), "*/dt=*/*.parquet")
+
+
+def _feature_files() -> List[Path]:
+    root = Path(get_paths()["features_dir"])
+    return _files(root, "dt=*/part.parquet") + _files(root, "features.parquet")
+
+
+def _model_files() -> List[Path]:
+    from models.model_store import model_path
+
+    p = model_path()
+    return [p] if p.exists() else []
+
+
+def _score_files() -> List[Path]:
+    root = Path(get_paths()["scores_dir"])
+    return _files(root, "dt=*/part.parquet") + _files(root, "scores.parquet") + _files(root, "sketch.json")
+
+
+def _rollup_files() -> List[Path]:
+    root = Path(get_paths()["scores_dir"])
+    return _files(root, "dt=*/part.rollup.parquet") + _files(root, "rollup_*.parquet")
+
+
+def _section(*keys: str) -> Callable[[], Dict]:
+    return lambda: {k: load_models_config().get(k) for k in keys}
+
+
+def pipeline_stages() -> List[Stage]:
+    paths = get_paths()
+    ingest = [
+        _ingest_jsonl("windows_evtx", "windows_evtx.jsonl", "parsers.evtx_parser.parse_evtx"),
+        _ingest_jsonl("sysmon", "sysmon.jsonl", "parsers.sysmon_parser.parse_sysmon"),
+        _ingest_jsonl("zeek_conn", "zeek_conn.jsonl", "parsers.zeek_parser.parse_zeek_conn"),
+        Stage("ingest:syslog_auth", _ingest_syslog,
+              lambda: _files(_sample_root(), "**/*.log"),
+              lambda: _files(Path(paths["ecs_parquet_dir"]) / "syslog_auth", "dt=*/*.parquet"),
+              config=lambda: {"year": os.getenv("SYSLOG_DEFAULT_YEAR"), "tz": os.getenv("TZ", "UTC")},
+              optional=True),
+        Stage("ingest:custom_csv", _ingest_csv,
+              lambda: _files(_sample_root(), "**/*.csv"),
+              lambda: _files(Path(paths["ecs_parquet_dir"]) / "custom_csv", "dt=*/*.parquet"),
+              optional=True),
+    ]
+    names = [s.name for s in ingest]
+    return ingest + [
+        Stage("featurize", _featurize, _ecs_files, _feature_files, deps=names),
+        Stage("train", _train, _feature_files, _model_files, deps=["featurize"],
+              config=_section("isolation_forest", "scaling")),
+        Stage("score", _score, lambda: _feature_files() + _model_files(), _score_files, deps=["train"],
+              config=_score_config),
+        Stage("rollup", _rollup, _score_files, _rollup_files, deps=["score"]),
+        Stage("bundle", _bundle, _score_files,
+              lambda: _files(Path(paths["bundles_dir"]), "incident_*.zip"), deps=["score"],
+              config=_section("scoring", "incidents")),
+    ]
+
+
+def run_pipeline(force: Iterable[str] = (), workers: Optional[int] = None) -> Dict[str, str]:
+    return run_dag(pipeline_stages(), force=force, workers=workers)
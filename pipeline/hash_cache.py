@@ -0,0 +1,103 @@
+"""Cache sha256 của file (Tiếng Việt)
+
+- Khoá theo (path, size, mtime_ns, inode): file không đổi thì không đọc lại để băm
+- Lưu bền vững ở <cache_dir>/file_hashes.json (ghi tmp rồi os.replace), dùng chung giữa các lần chạy
+- File chưa có trong cache được băm song song (HASH_WORKERS luồng, hashlib nhả GIL), bộ đệm 1 MiB
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models.utils import get_paths, sha256_file
+
+CACHE_FILENAME = "file_hashes.json"
+
+_CACHE: Optional[Dict[str, Dict]] = None
+_LOCK = threading.Lock()
+
+
+def _cache_path() -> Path:
+    return Path(get_paths()["cache_dir"]) / CACHE_FILENAME
+
+
+def _workers() -> int:
+    return max(1, int(os.getenv("HASH_WORKERS", str(min(8, os.cpu_count() or 1)))))
+
+
+def _load() -> Dict[str, Dict]:
+    global _CACHE
+    if _CACHE is None:
+        try:
+            with open(_cache_path(), "r", encoding="utf-8") as f:
+                _CACHE = json.load(f)
+        except (OSError, ValueError):
+            _CACHE = {}
+    return _CACHE
+
+
+def _save(cache: Dict[str, Dict]) -> None:
+    path = _cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _stamp(path: Path) -> Tuple[int, int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def hash_files(paths: Iterable[Path]) -> Dict[str, Dict]:
+    """{đường dẫn tuyệt đối: {"sha256", "size"}} cho các file tồn tại; chỉ băm file mới hoặc đã đổi."""
+    stamps = {}
+    for p in paths:
+        p = Path(p).resolve()
+        if p.is_file():
+            stamps[str(p)] = _stamp(p)
+
+    out: Dict[str, Dict] = {}
+    misses: List[str] = []
+    with _LOCK:
+        cache = _load()
+        for key, (size, mtime_ns, ino) in stamps.items():
+            hit = cache.get(key)
+            if hit and (hit["size"], hit["mtime_ns"], hit["inode"]) == (size, mtime_ns, ino):
+                out[key] = {"sha256": hit["sha256"], "size": size}
+            else:
+                misses.append(key)
+    if not misses:
+        return out
+
+    with ThreadPoolExecutor(max_workers=min(_workers(), len(misses))) as ex:
+        digests = list(ex.map(lambda k: sha256_file(Path(k)), misses))
+    with _LOCK:
+        cache = _load()
+        for key, digest in zip(misses, digests):
+            size, mtime_ns, ino = stamps[key]
+            # file bị ghi lại trong lúc băm: trả kết quả nhưng không lưu vào cache
+            try:
+                unchanged = _stamp(Path(key)) == stamps[key]
+            except OSError:
+                unchanged = False
+            if unchanged:
+                cache[key] = {"size": size, "mtime_ns": mtime_ns, "inode": ino, "sha256": digest}
+            out[key] = {"sha256": digest, "size": size}
+        _save(cache)
+    return out
+
+
+def file_records(paths: Iterable[Path]) -> List[Dict]:
+    """Danh sách {"path", "sha256", "size"} theo thứ tự đầu vào (bỏ file không tồn tại)."""
+    paths = [Path(p).resolve() for p in paths]
+    hashes = hash_files(paths)
+    return [{"path": str(p), **hashes[str(p)]} for p in paths if str(p) in hashes]
+
+
+def sha256_cached(path: Path) -> str:
+    return hash_files([path])[str(Path(path).resolve())]["sha256"]
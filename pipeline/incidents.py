@@ -0,0 +1,117 @@
+"""Gom alert thành incident (Tiếng Việt)
+
+- Mỗi alert là khoảng [t - gap, t + gap] (gap = incidents.gap_minutes, mặc định bằng cửa sổ ngữ cảnh ±5 phút)
+- Theo từng thực thể (incidents.entity_cols, null -> "unknown"): sắp theo thời gian, gộp các khoảng chồng nhau
+  (interval merge: bắt đầu incident mới khi start > max(end) của các alert trước đó)
+- Một incident = một bundle: ngữ cảnh ECS, giải thích và phân tích AI chỉ làm một lần cho cả nhóm
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.infer import SCORE_COL
+from models.utils import load_models_config
+
+INCIDENT_COL = "incident.id"
+
+
+def _incident_params(cfg: Optional[Dict] = None):
+    cfg = cfg if cfg is not None else load_models_config()
+    inc = cfg.get("incidents", {}) or {}
+    return list(inc.get("entity_cols", ["host.name"]) or []), float(inc.get("gap_minutes", 5))
+
+
+def _entity_keys(alerts: pd.DataFrame, entity_cols: Sequence[str]) -> pd.Series:
+    if not entity_cols:
+        return pd.Series("", index=alerts.index)
+    parts = []
+    for col in entity_cols:
+        s = alerts[col] if col in alerts.columns else pd.Series(None, index=alerts.index, dtype=object)
+        parts.append(s.astype(object).where(s.notna(), "unknown").astype(str))
+    key = parts[0]
+    for s in parts[1:]:
+        key = key + "|" + s
+    return key
+
+
+def group_incidents(
+    alerts: pd.DataFrame,
+    entity_cols: Optional[Sequence[str]] = None,
+    gap_minutes: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Thêm cột incident.id (0, 1, ... theo điểm cao nhất của incident giảm dần) vào bản sao của alerts;
+    thứ tự dòng giữ nguyên.
+    """
+    cfg_cols, cfg_gap = _incident_params()
+    entity_cols = list(entity_cols) if entity_cols is not None else cfg_cols
+    gap = pd.Timedelta(minutes=cfg_gap if gap_minutes is None else gap_minutes)
+    out = alerts.copy()
+    if out.empty:
+        out[INCIDENT_COL] = pd.Series(dtype=np.int64)
+        return out
+
+    ts = pd.to_datetime(out["@timestamp"], utc=True, errors="coerce")
+    frame = pd.DataFrame({"key": _entity_keys(out, entity_cols).to_numpy(), "ts": ts.to_numpy(),
+                          "pos": np.arange(len(out))})
+    frame = frame.sort_values(["key", "ts"], kind="stable").reset_index(drop=True)
+    start = frame["ts"] - gap
+    end = frame["ts"] + gap
+    # max(end) của các alert trước trong cùng thực thể
+    prev_end = end.groupby(frame["key"]).cummax().groupby(frame["key"]).shift(1)
+    new = prev_end.isna() | (start > prev_end) | frame["ts"].isna()
+    group = new.cumsum().to_numpy() - 1
+
+    # Đánh số lại theo điểm cao nhất của incident (incident 0 là nghiêm trọng nhất)
+    scores = out[SCORE_COL].to_numpy(dtype=np.float64)[frame["pos"].to_numpy()]
+    best = pd.Series(scores).groupby(group).max()
+    rank = pd.Series(np.arange(len(best)), index=best.sort_values(ascending=False, kind="stable").index)
+    ids = np.empty(len(out), dtype=np.int64)
+    ids[frame["pos"].to_numpy()] = rank.loc[group].to_numpy()
+    out[INCIDENT_COL] = ids
+    return out
+
+
+def summarize_incidents(alerts: pd.DataFrame, entity_cols: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Một dòng mỗi incident: thực thể, thời gian đầu/cuối, số alert, điểm cao nhất."""
+    if INCIDENT_COL not in alerts.columns:
+        alerts = group_incidents(alerts, entity_cols=entity_cols)
+    if alerts.empty:
+        return pd.DataFrame(columns=[INCIDENT_COL, "entity", "start", "end", "n_alerts", "max_score"])
+    entity_cols = list(entity_cols) if entity_cols is not None else _incident_params()[0]
+    ts = pd.to_datetime(alerts["@timestamp"], utc=True, errors="coerce")
+    df = pd.DataFrame({
+        INCIDENT_COL: alerts[INCIDENT_COL].to_numpy(),
+        "entity": _entity_keys(alerts, entity_cols).to_numpy(),
+        "ts": ts.to_numpy(),
+        SCORE_COL: alerts[SCORE_COL].to_numpy(),
+    })
+    g = df.groupby(INCIDENT_COL, sort=True)
+    return pd.DataFrame({
+        "entity": g["entity"].first(),
+        "start": g["ts"].min(),
+        "end": g["ts"].max(),
+        "n_alerts": g.size(),
+        "max_score": g[SCORE_COL].max(),
+    }).reset_index()
+
+
+def alert_key(alert: pd.Series) -> str:
+    """Khoá của một alert: thời điểm UTC | host | user (null -> "unknown", như lớp dữ liệu của UI)."""
+    ts = pd.to_datetime(alert.get("@timestamp"), utc=True, errors="coerce")
+    parts = [ts.isoformat() if pd.notna(ts) else "unknown"]
+    for col in ("host.name", "user.name"):
+        v = alert.get(col)
+        parts.append("unknown" if v is None or pd.isna(v) else str(v))
+    return "|".join(parts)
+
+
+def incident_members(alerts: pd.DataFrame) -> List[pd.DataFrame]:
+    """Các nhóm alert theo incident.id tăng dần, trong mỗi nhóm sắp theo thời gian."""
+    if alerts.empty:
+        return []
+    ts = pd.to_datetime(alerts["@timestamp"], utc=True, errors="coerce")
+    ordered = alerts.assign(_ts=ts).sort_values([INCIDENT_COL, "_ts"], kind="stable").drop(columns="_ts")
+    return [grp for _, grp in ordered.groupby(INCIDENT_COL, sort=True)]
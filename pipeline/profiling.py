@@ -0,0 +1,250 @@
+"""Đo đạc pipeline (Tiếng Việt)
+
+- record(stage, **labels): context manager đo wall time, CPU time (của cả process), peak RSS
+  trong lúc chạy; code gọi điền rows_in / rows_out / bytes_read / bytes_written
+- Mỗi record ghi một dòng JSON vào <logs_dir>/metrics/<run_id>.jsonl; run_id lấy từ PIPELINE_RUN_ID
+  (tự sinh lần đầu và đặt vào env để worker process con ghi cùng file); PIPELINE_METRICS=0 để tắt
+- summarize(): gộp theo stage cho lệnh `profile`; profile_call(): chạy một hàm dưới cProfile
+  hoặc sampling profiler (lấy mẫu stack của thread đang chạy, không cần thư viện ngoài)
+- pandas / cProfile chỉ được import trong summarize / profile_call: record() không kéo theo chúng
+"""
+
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from models.utils import get_paths
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+_WRITE_LOCK = threading.Lock()
+_ACTIVE: List["StageMetrics"] = []
+_ACTIVE_LOCK = threading.Lock()
+_SAMPLER_PID: Optional[int] = None
+_SAMPLE_INTERVAL_S = 0.02
+
+
+def enabled() -> bool:
+    return os.getenv("PIPELINE_METRICS", "1") != "0"
+
+
+def run_id() -> str:
+    rid = os.environ.get("PIPELINE_RUN_ID")
+    if not rid:
+        rid = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        os.environ["PIPELINE_RUN_ID"] = rid
+    return rid
+
+
+def metrics_dir() -> Path:
+    return Path(get_paths()["logs_dir"]) / "metrics"
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+
+
+def _sampler() -> None:
+    while True:
+        time.sleep(_SAMPLE_INTERVAL_S)
+        with _ACTIVE_LOCK:
+            if not _ACTIVE:
+                continue
+            rss = rss_bytes()
+            for m in _ACTIVE:
+                if rss > m.peak_rss:
+                    m.peak_rss = rss
+
+
+def _ensure_sampler() -> None:
+    global _SAMPLER_PID
+    if _SAMPLER_PID != os.getpid():  # thread không đi theo fork: mỗi process một sampler
+        _SAMPLER_PID = os.getpid()
+        threading.Thread(target=_sampler, name="rss-sampler", daemon=True).start()
+
+
+def file_size(*paths) -> int:
+    total = 0
+    for p in paths:
+        try:
+            total += os.stat(p).st_size
+        except OSError:
+            pass
+    return total
+
+
+class StageMetrics:
+    def __init__(self, stage: str, labels: Dict[str, Any]):
+        self.stage = stage
+        self.labels = labels
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss = rss_bytes()
+        # run_id cố định ngay khi vào record(): process con fork bên trong record (pool của score) kế thừa env
+        self.run_id = run_id()
+
+    def to_dict(self, wall: float, cpu: float, status: str) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "ts": datetime.utcnow().isoformat() + "Z",
+            "pid": os.getpid(),
+            "stage": self.stage,
+            **{k: v for k, v in self.labels.items() if v is not None},
+            "status": status,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "rows_in": int(self.rows_in),
+            "rows_out": int(self.rows_out),
+            "bytes_read": int(self.bytes_read),
+            "bytes_written": int(self.bytes_written),
+            "peak_rss": int(self.peak_rss),
+        }
+
+
+def _write(rec: Dict[str, Any]) -> None:
+    d = metrics_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(rec, default=str) + "\n"
+    with _WRITE_LOCK, open(d / f"{rec['run_id']}.jsonl", "a", encoding="utf-8") as f:
+        f.write(line)  # một lần write cho mỗi dòng: các process cùng ghi không đan xen
+
+
+@contextmanager
+def record(stage: str, **labels) -> Iterator[StageMetrics]:
+    m = StageMetrics(stage, labels)
+    if not enabled():
+        yield m
+        return
+    _ensure_sampler()
+    with _ACTIVE_LOCK:
+        _ACTIVE.append(m)
+    t0, c0 = time.perf_counter(), time.process_time()
+    status = "ok"
+    try:
+        yield m
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+        with _ACTIVE_LOCK:
+            _ACTIVE.remove(m)
+        m.peak_rss = max(m.peak_rss, rss_bytes())
+        try:
+            _write(m.to_dict(wall, cpu, status))
+        except OSError:
+            pass  # không để việc ghi metrics làm hỏng pipeline
+
+
+def load_run(rid: Optional[str] = None) -> "pd.DataFrame":
+    """Các record của run rid (mặc định: file metrics mới nhất)."""
+    import pandas as pd
+
+    d = metrics_dir()
+    if rid is None:
+        files = sorted(d.glob("*.jsonl"), key=lambda p: p.stat().st_mtime) if d.exists() else []
+        if not files:
+            return pd.DataFrame()
+        path = files[-1]
+    else:
+        path = d / f"{rid}.jsonl"
+        if not path.exists():
+            return pd.DataFrame()
+    return pd.read_json(path, lines=True)
+
+
+def summarize(rid: Optional[str] = None) -> "pd.DataFrame":
+    """Một dòng mỗi stage: số record, tổng wall/CPU, rows, MB đọc/ghi, peak RSS lớn nhất, rows/s."""
+    import pandas as pd
+
+    df = load_run(rid)
+    if df.empty:
+        return df
+    g = df.groupby("stage", sort=False)
+    out = pd.DataFrame({
+        "records": g.size(),
+        "wall_s": g["wall_s"].sum(),
+        "cpu_s": g["cpu_s"].sum(),
+        "rows_in": g["rows_in"].sum(),
+        "rows_out": g["rows_out"].sum(),
+        "mb_read": g["bytes_read"].sum() / 2**20,
+        "mb_written": g["bytes_written"].sum() / 2**20,
+        "peak_rss_mb": g["peak_rss"].max() / 2**20,
+        "errors": g["status"].apply(lambda s: int((s != "ok").sum())),
+    })
+    out["rows_per_s"] = (out["rows_in"] / out["wall_s"].where(out["wall_s"] > 0)).fillna(0.0)
+    out.attrs["run_id"] = str(df["run_id"].iloc[0])
+    return out.reset_index()
+
+
+def _sample_stacks(thread_id: int, stop: threading.Event, interval: float,
+                   self_counts: Counter, cum_counts: Counter) -> None:
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            continue
+        seen = set()
+        top = True
+        while frame is not None:
+            code = frame.f_code
+            key = f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+            if top:
+                self_counts[key] += 1
+                top = False
+            if key not in seen:
+                cum_counts[key] += 1
+                seen.add(key)
+            frame = frame.f_back
+
+
+def profile_call(func: Callable[[], Any], profiler: str = "cprofile", top: int = 25,
+                 interval: float = 0.005) -> Tuple[Any, str]:
+    """Chạy func dưới cProfile hoặc sampling profiler; trả về (kết quả, báo cáo dạng text)."""
+    if profiler == "cprofile":
+        import cProfile
+        import pstats
+
+        prof = cProfile.Profile()
+        result = prof.runcall(func)
+        d = metrics_dir()
+        d.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(str(d / f"{run_id()}.prof"))
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+        return result, buf.getvalue()
+    if profiler != "sample":
+        raise ValueError(f"Unknown profiler: {profiler} (use cprofile or sample)")
+
+    self_counts: Counter = Counter()
+    cum_counts: Counter = Counter()
+    stop = threading.Event()
+    t = threading.Thread(target=_sample_stacks, daemon=True,
+                         args=(threading.get_ident(), stop, interval, self_counts, cum_counts))
+    t.start()
+    try:
+        result = func()
+    finally:
+        stop.set()
+        t.join()
+    total = max(1, sum(self_counts.values()))
+    lines = [f"{total} samples every {interval * 1000:.1f} ms (main thread)", "", "self%   cum%  function"]
+    for key, n in self_counts.most_common(top):
+        lines.append(f"{100.0 * n / total:5.1f}  {100.0 * cum_counts[key] / total:5.1f}  {key}")
+    return result, "\n".join(lines)
@@ -0,0 +1,241 @@
+"""Rollup điểm bất thường nhiều độ phân giải cho biểu đồ timeline (Tiếng Việt)
+
+- Sau bước score: mỗi partition scores/dt=*/part.parquet -> part.rollup.parquet gồm các bucket
+  1min / 1h / 1d, toàn cục (host.name = "*") và theo host, với count, max, p95, mean của anom.score;
+  partition là một ngày UTC nên mọi bucket nằm gọn trong partition và chỉ partition đổi mới tính lại
+- Các bucket 1h / 1d được gộp vào scores/rollup_1h.parquet, rollup_1d.parquet (nhỏ, đọc cả file);
+  bucket 1min chỉ đọc từ các partition giao khoảng cần vẽ
+- Chế độ cũ (chỉ có scores.parquet đầy đủ): tính cả ba độ phân giải thẳng vào rollup_<res>.parquet
+- query_rollup(start, end, host, max_points): chọn độ phân giải mịn nhất mà số bucket trong khoảng
+  không vượt max_points; vẫn nhiều hơn thì downsample_peaks giữ điểm cao / thấp nhất của mỗi khoảng
+  (đỉnh không bao giờ bị làm phẳng) -> chi phí vẽ theo số pixel, không theo số dòng
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from models.utils import get_paths
+from pipeline.profiling import file_size, record
+
+SCORE_COL = "anom.score"
+HOST_COL = "host.name"
+GLOBAL_KEY = "*"
+ROLLUP_PART = "part.rollup.parquet"
+# tên -> độ dài bucket (giây), từ mịn đến thô
+RESOLUTIONS = {"1min": 60, "1h": 3600, "1d": 86400}
+MERGED = ["1h", "1d"]
+MAX_POINTS = int(os.getenv("ROLLUP_MAX_POINTS", "1500"))
+P95 = 0.95
+COLUMNS = ["res", HOST_COL, "@timestamp", "count", "max", "p95", "mean"]
+
+
+def merged_path(root: Path, res: str) -> Path:
+    return Path(root) / f"rollup_{res}.parquet"
+
+
+def _group_stats(keys: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+    """count / max / p95 (nội suy tuyến tính như pandas) / mean theo khoá nguyên, một lần sort."""
+    order = np.argsort(values, kind="stable")
+    order = order[np.argsort(keys[order], kind="stable")]
+    k, v = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+    counts = np.diff(np.r_[starts, len(k)])
+    pos = P95 * (counts - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, counts - 1)
+    p95 = v[starts + lo] + (pos - lo) * (v[starts + hi] - v[starts + lo])
+    return {
+        "key": k[starts],
+        "count": counts,
+        "max": v[starts + counts - 1],
+        "p95": p95,
+        "mean": np.add.reduceat(v, starts) / counts,
+    }
+
+
+def aggregate(df: pd.DataFrame, resolutions: Optional[List[str]] = None) -> pd.DataFrame:
+    """Bucket điểm của df (@timestamp, host.name, anom.score) theo từng độ phân giải, toàn cục và theo host."""
+    ts = pd.to_datetime(df["@timestamp"], utc=True, errors="coerce")
+    scores = pd.to_numeric(df[SCORE_COL], errors="coerce").to_numpy(dtype=np.float64)
+    ok = ts.notna().to_numpy() & ~np.isnan(scores)
+    ts_ns = ts.to_numpy(dtype="datetime64[ns]").view(np.int64)[ok]
+    scores = scores[ok]
+    hosts = df[HOST_COL].astype(object).where(df[HOST_COL].notna(), "unknown") if HOST_COL in df.columns \
+        else pd.Series("unknown", index=df.index)
+    codes, names = pd.factorize(hosts.to_numpy()[ok])
+    if not len(ts_ns):
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in COLUMNS})
+
+    frames = []
+    for res in resolutions or list(RESOLUTIONS):
+        step = RESOLUTIONS[res] * 10**9
+        t0 = ts_ns.min() // step * step
+        bucket = (ts_ns - t0) // step
+        n_buckets = int(bucket.max()) + 1
+        for scope_keys, host_of in ((bucket, None), (codes.astype(np.int64) * n_buckets + bucket, names)):
+            st = _group_stats(scope_keys, scores)
+            b = st.pop("key")
+            host = np.full(len(b), GLOBAL_KEY, dtype=object) if host_of is None else host_of[b // n_buckets]
+            frames.append(pd.DataFrame({
+                "res": res,
+                HOST_COL: host,
+                "@timestamp": pd.to_datetime(t0 + (b % n_buckets) * step, utc=True),
+                **st,
+            }))
+    return pd.concat(frames, ignore_index=True)[COLUMNS]
+
+
+def _write_atomic(df: pd.DataFrame, path: Path) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _is_fresh(part: Path, out: Path) -> bool:
+    return out.exists() and out.stat().st_mtime_ns >= part.stat().st_mtime_ns
+
+
+def build_rollups(full: bool = False) -> Dict[str, int]:
+    """
+    Tính rollup cho các partition scores/dt=* mới / đổi (full=True: tất cả) rồi dựng lại
+    rollup_1h / rollup_1d. Không có partition thì tính từ scores.parquet.
+    """
+    root = Path(get_paths()["scores_dir"])
+    parts = sorted(root.glob("dt=*/part.parquet"))
+    stat = {"partitions": 0, "skipped": 0, "rows": 0, "buckets": 0}
+    with record("rollup") as met:
+        if not parts:
+            src = root / "scores.parquet"
+            if not src.exists():
+                raise FileNotFoundError(f"Scores not found under {root}. Run score first.")
+            present = set(pq.read_schema(src).names)
+            df = pd.read_parquet(src, columns=[c for c in ["@timestamp", HOST_COL, SCORE_COL] if c in present])
+            roll = aggregate(df)
+            for res in RESOLUTIONS:
+                _write_atomic(roll[roll["res"] == res].reset_index(drop=True), merged_path(root, res))
+            stat.update(partitions=1, rows=len(df), buckets=len(roll))
+            met.bytes_read = file_size(src)
+        else:
+            for p in parts:
+                out = p.with_name(ROLLUP_PART)
+                if not full and _is_fresh(p, out):
+                    stat["skipped"] += 1
+                    continue
+                present = set(pq.read_schema(p).names)
+                df = pd.read_parquet(p, columns=[c for c in ["@timestamp", HOST_COL, SCORE_COL] if c in present])
+                roll = aggregate(df)
+                _write_atomic(roll, out)
+                stat["partitions"] += 1
+                stat["rows"] += len(df)
+                stat["buckets"] += len(roll)
+                met.bytes_read += file_size(p)
+            if stat["partitions"] or not all(merged_path(root, r).exists() for r in MERGED):
+                frames = [pd.read_parquet(p.with_name(ROLLUP_PART), filters=[("res", "in", MERGED)])
+                          for p in parts if p.with_name(ROLLUP_PART).exists()]
+                merged = pd.concat(frames, ignore_index=True) if frames else aggregate(pd.DataFrame(
+                    {"@timestamp": [], HOST_COL: [], SCORE_COL: []}))
+                for res in MERGED:
+                    sel = merged[merged["res"] == res].sort_values([HOST_COL, "@timestamp"], kind="stable")
+                    _write_atomic(sel.reset_index(drop=True), merged_path(root, res))
+            merged_path(root, "1min").unlink(missing_ok=True)  # của chế độ cũ, không còn đúng
+        met.rows_in = stat["rows"]
+        met.rows_out = stat["buckets"]
+        met.bytes_written = file_size(*[merged_path(root, r) for r in RESOLUTIONS])
+    print(f"[rollup] {stat['partitions']} partition(s), {stat['rows']:,} rows -> {stat['buckets']:,} buckets; "
+          f"{stat['skipped']} unchanged partition(s) skipped")
+    return stat
+
+
+def pick_resolution(start: pd.Timestamp, end: pd.Timestamp, max_points: int = MAX_POINTS) -> str:
+    """Độ phân giải mịn nhất có số bucket trong [start, end] <= max_points (không có thì thô nhất)."""
+    span = max((end - start).total_seconds(), 1.0)
+    for res, secs in RESOLUTIONS.items():
+        if span / secs <= max_points:
+            return res
+    return list(RESOLUTIONS)[-1]
+
+
+def downsample_peaks(df: pd.DataFrame, max_points: int = MAX_POINTS, value: str = "max",
+                     ts_col: str = "@timestamp") -> pd.DataFrame:
+    """
+    Chia trục thời gian thành max_points / 2 khoảng đều, giữ dòng có value lớn nhất và nhỏ nhất
+    của mỗi khoảng (dòng gốc, không lấy trung bình): đỉnh và đáy luôn còn trên biểu đồ.
+    """
+    if len(df) <= max_points:
+        return df
+    t = df[ts_col].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    v = df[value].to_numpy(dtype=np.float64)
+    n_bins = max(1, max_points // 2)
+    # độ rộng khoảng tính trước: (t - t0) * n_bins tràn int64 khi khoảng thời gian dài hơn ~142 ngày
+    width = -(-(int(t.max() - t.min()) + 1) // n_bins)
+    bins = (t - t.min()) // width
+    order = np.lexsort((v, bins))
+    b = bins[order]
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    ends = np.r_[starts[1:], len(b)] - 1
+    keep = np.unique(np.r_[order[starts], order[ends]])
+    return df.iloc[keep]
+
+
+def _read(path: Path, host: str, start: pd.Timestamp, end: pd.Timestamp, res: Optional[str] = None) -> pd.DataFrame:
+    filters = [(HOST_COL, "=", host), ("@timestamp", ">=", start), ("@timestamp", "<=", end)]
+    if res is not None:
+        filters.append(("res", "=", res))
+    return pd.read_parquet(path, filters=filters)
+
+
+def rollup_extent(root: Optional[Path] = None) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """(đầu, cuối) của dữ liệu theo rollup_1d toàn cục; None nếu chưa có rollup."""
+    p = merged_path(Path(root or get_paths()["scores_dir"]), "1d")
+    if not p.exists():
+        return None
+    df = pd.read_parquet(p, columns=[HOST_COL, "@timestamp"], filters=[(HOST_COL, "=", GLOBAL_KEY)])
+    if df.empty:
+        return None
+    ts = pd.to_datetime(df["@timestamp"], utc=True)
+    return ts.min(), ts.max() + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+
+
+def query_rollup(
+    start=None,
+    end=None,
+    host: Optional[str] = None,
+    max_points: int = MAX_POINTS,
+    peaks: bool = True,
+) -> pd.DataFrame:
+    """
+    Chuỗi bucket (@timestamp, count, max, p95, mean) của host (None: toàn cục) trong [start, end]
+    ở độ phân giải hợp với max_points (attrs["resolution"]); peaks=True thì downsample_peaks
+    khi vẫn còn nhiều hơn max_points điểm.
+    """
+    root = Path(get_paths()["scores_dir"])
+    extent = rollup_extent(root)
+    if extent is None:
+        return pd.DataFrame(columns=COLUMNS)
+    start = extent[0] if start is None else pd.Timestamp(start)
+    end = extent[1] if end is None else pd.Timestamp(end)
+    start = start.tz_localize("UTC") if start.tzinfo is None else start.tz_convert("UTC")
+    end = end.tz_localize("UTC") if end.tzinfo is None else end.tz_convert("UTC")
+    key = host if host is not None else GLOBAL_KEY
+    res = pick_resolution(start, end, max_points)
+
+    lo = start.floor(f"{RESOLUTIONS[res]}s")
+    if merged_path(root, res).exists():
+        df = _read(merged_path(root, res), key, lo, end)
+    else:
+        frames = []
+        for day in pd.date_range(start.normalize(), end.normalize(), freq="D"):
+            p = root / f"dt={day.strftime('%Y-%m-%d')}" / ROLLUP_PART
+            if p.exists():
+                frames.append(_read(p, key, lo, end, res))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+    df = df.sort_values("@timestamp", kind="stable").reset_index(drop=True)
+    if peaks:
+        df = downsample_peaks(df, max_points)
+    df.attrs["resolution"] = res
+    return df
@@ -6,27 +6,20 @@ Chạy toàn bộ pipeline demo theo thứ tự:
 3) train: huấn luyện Isolation Forest và lưu model
 4) score: sinh điểm bất thường và lưu Parquet
 5) alert + bundle: chọn top alerts theo threshold và tạo Forensic Bundles
+
+Các bước chạy qua pipeline.dag: stage đã cập nhật được bỏ qua, chạy lại sau lỗi tiếp tục từ stage lỗi.
 """
 
 from pathlib import Path
+from typing import Iterable
 
-from pipeline.ingest import ingest_all
-from features.build_features import build_feature_table
-from models.train_if import train_model
-from models.infer import score_features
-from pipeline.alerting import select_alerts
-from pipeline.bundle import build_bundles_for_top_alerts
+from pipeline.dag import run_pipeline
 from models.utils import get_paths
 
 
-def run_all() -> Path:
-    ingest_all()
-    build_feature_table()
-    train_model()
-    scores_path = score_features()
-    top, thr = select_alerts(str(scores_path))
-    build_bundles_for_top_alerts(top, thr)
-    return Path(get_paths()["bundles_dir"])  
+def run_all(force: Iterable[str] = ()) -> Path:
+    run_pipeline(force=force)
+    return Path(get_paths()["bundles_dir"])
 
 
 if __name__ == "__main__":
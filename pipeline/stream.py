@@ -0,0 +1,369 @@
+"""Chế độ streaming theo micro-batch: ingest -> feature -> score -> alert (Tiếng Việt)
+
+- Nguồn là các file JSON Lines được ghi nối tiếp (raw windows_evtx / sysmon / zeek_conn qua ecs_mapping,
+  hoặc "ecs" là dòng ECS phẳng); mỗi file đọc tiếp từ offset byte, chỉ lấy dòng đã hoàn chỉnh
+- Luồng đọc gom micro-batch (STREAM_BATCH_ROWS dòng hoặc STREAM_BATCH_MS) vào hàng đợi giới hạn
+  STREAM_QUEUE_BATCHES: khi chấm không kịp, luồng đọc bị chặn (backpressure) thay vì dồn RAM
+- Feature dùng chung định nghĩa với features.build_features (add_event_flags, FLAG_COLS, WINDOWS_MIN,
+  WINDOW_ENTITY_COLS); số đếm cửa sổ lấy từ trạng thái theo thực thể (thời điểm các sự kiện có cờ
+  trong 15 phút gần nhất), cập nhật tăng dần, không tính lại lịch sử
+- Chấm bằng model hiện tại (nạp lại khi train lại), ngưỡng toàn cục + theo thực thể từ scores/sketch.json;
+  alert ghi nối tiếp vào <scores_dir>/stream_alerts.jsonl
+- Sau mỗi batch ghi checkpoint nguyên tử (<cache_dir>/stream_checkpoint.json): offset từng file, trạng thái
+  cửa sổ, kích thước file alert. Khởi động lại tiếp tục từ checkpoint và cắt file alert về kích thước đã
+  checkpoint -> không đếm trùng sự kiện, không ghi trùng alert
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from features.build_features import FLAG_COLS, ID_COLS, WINDOW_ENTITY_COLS, WINDOWS_MIN, add_event_flags
+from models.utils import CONFIG_DIR, get_paths, load_models_config, load_yaml
+
+CHECKPOINT_FILENAME = "stream_checkpoint.json"
+ALERTS_FILENAME = "stream_alerts.jsonl"
+# nguồn raw -> (event.module, event.dataset) như parser batch tương ứng
+RAW_SOURCES = {
+    "windows_evtx": ("windows", "security"),
+    "sysmon": ("sysmon", "sysmon"),
+    "zeek_conn": ("zeek", "zeek.conn"),
+}
+SOURCE_KINDS = ("ecs",) + tuple(RAW_SOURCES)
+
+_MAX_WINDOW_NS = max(WINDOWS_MIN) * 60 * 10**9
+
+
+def default_sources() -> Dict[str, str]:
+    """{path: kind} cho các file raw JSONL đang có trong raw_data_dir."""
+    raw = Path(get_paths()["raw_data_dir"])
+    return {str((raw / f"{kind}.jsonl").resolve()): kind for kind in RAW_SOURCES if (raw / f"{kind}.jsonl").exists()}
+
+
+class FileTail:
+    """Đọc các dòng hoàn chỉnh mới của một file từ offset; file bị thay (inode khác) hoặc cắt ngắn -> đọc lại từ đầu."""
+
+    def __init__(self, path: str, kind: str, offset: int = 0, inode: Optional[int] = None):
+        self.path = path
+        self.kind = kind
+        self.offset = offset
+        self.inode = inode
+
+    def position(self) -> Dict:
+        return {"kind": self.kind, "offset": self.offset, "inode": self.inode}
+
+    def read(self, max_lines: int) -> List[bytes]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return []
+        if self.inode != st.st_ino or st.st_size < self.offset:
+            self.inode, self.offset = st.st_ino, 0
+        if st.st_size == self.offset:
+            return []
+        lines: List[bytes] = []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while len(lines) < max_lines:
+                line = f.readline()
+                if not line.endswith(b"\n"):  # dòng đang ghi dở: đọc lại ở lần sau
+                    break
+                self.offset += len(line)
+                if line.strip():
+                    lines.append(line)
+        return lines
+
+
+class WindowState:
+    """
+    Thời điểm (ns, đã sắp) các sự kiện có cờ, theo (cột thực thể, giá trị, cờ), chỉ giữ trong cửa sổ dài nhất.
+    Số đếm của sự kiện t với cửa sổ w = số thời điểm trong (t - w, t], như rolling("{w}min") của batch.
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        self.data: Dict[Tuple[str, str, str], np.ndarray] = {}
+        for item in (data or []):
+            self.data[(item["entity"], item["key"], item["flag"])] = np.asarray(item["ts"], dtype=np.int64)
+
+    def add_counts(self, df: pd.DataFrame) -> pd.DataFrame:
+        """df đã sắp theo @timestamp và có các cột cờ; thêm cột <flag>_count_<w>m và cập nhật trạng thái."""
+        ts = df["@timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        for flag in FLAG_COLS:
+            flags = df[flag].to_numpy()
+            for entity in WINDOW_ENTITY_COLS:
+                # như featurize_ecs: cột của thực thể sau ghi đè cột của thực thể trước; thực thể null -> 0
+                counts = {w: np.zeros(len(df), dtype=np.float64) for w in WINDOWS_MIN}
+                keys = df[entity]
+                for key, idx in keys.groupby(keys, sort=False).indices.items():
+                    k = (entity, str(key), flag)
+                    t = ts[idx]
+                    hits = np.concatenate([self.data.get(k, np.empty(0, dtype=np.int64)), t[flags[idx] == 1]])
+                    hits.sort(kind="stable")
+                    for w in WINDOWS_MIN:
+                        lo = np.searchsorted(hits, t - w * 60 * 10**9, side="right")
+                        counts[w][idx] = np.searchsorted(hits, t, side="right") - lo
+                    if len(hits):
+                        self.data[k] = hits
+                for w in WINDOWS_MIN:
+                    df[f"{flag}_count_{w}m"] = counts[w]
+        return df
+
+    def evict(self, watermark_ns: int) -> None:
+        cutoff = watermark_ns - _MAX_WINDOW_NS
+        for k in list(self.data):
+            hits = self.data[k]
+            hits = hits[hits > cutoff]
+            if len(hits):
+                self.data[k] = hits
+            else:
+                del self.data[k]
+
+    def to_json(self) -> List[Dict]:
+        return [{"entity": e, "key": key, "flag": f, "ts": v.tolist()} for (e, key, f), v in self.data.items()]
+
+
+def _records_to_ecs(lines: List[Tuple[str, bytes]], mappings: Dict[str, Dict]) -> pd.DataFrame:
+    from parsers.ecs_mapper import map_record
+
+    rows = []
+    for kind, line in lines:
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue  # như read_jsonl: bỏ dòng hỏng
+        if kind == "ecs":
+            rows.append(rec)
+            continue
+        row = map_record(rec, mappings[kind])
+        row["event.module"], row["event.dataset"] = RAW_SOURCES[kind]
+        rows.append(row)
+    return pd.DataFrame.from_records(rows)
+
+
+class StreamProcessor:
+    def __init__(
+        self,
+        sources: Dict[str, str],
+        batch_rows: Optional[int] = None,
+        batch_ms: Optional[float] = None,
+        queue_batches: Optional[int] = None,
+        poll_ms: Optional[float] = None,
+        lateness_s: Optional[float] = None,
+        reset: bool = False,
+    ):
+        bad = sorted(set(sources.values()) - set(SOURCE_KINDS))
+        if bad:
+            raise ValueError(f"Unknown source kind(s) {bad}; choose from {', '.join(SOURCE_KINDS)}")
+        paths = get_paths()
+        self.batch_rows = batch_rows or int(os.getenv("STREAM_BATCH_ROWS", "5000"))
+        self.batch_wait = (batch_ms if batch_ms is not None else float(os.getenv("STREAM_BATCH_MS", "500"))) / 1000.0
+        self.poll = (poll_ms if poll_ms is not None else float(os.getenv("STREAM_POLL_MS", "200"))) / 1000.0
+        self.lateness_ns = int((lateness_s if lateness_s is not None else float(os.getenv("STREAM_LATENESS_S", "300"))) * 1e9)
+        self.checkpoint_path = Path(paths["cache_dir"]) / CHECKPOINT_FILENAME
+        self.alerts_path = Path(paths["scores_dir"]) / ALERTS_FILENAME
+        self.scores_dir = Path(paths["scores_dir"])
+        self.mappings = load_yaml(CONFIG_DIR / "ecs_mapping.yaml")
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_batches or int(os.getenv("STREAM_QUEUE_BATCHES", "4")))
+        self._stop = threading.Event()
+        self._model = None
+        self._threshold = None
+
+        ckpt = {} if reset else self._load_checkpoint()
+        positions = ckpt.get("positions", {})
+        self.tails = []
+        for path, kind in sources.items():
+            pos = positions.get(str(path), {})
+            if pos.get("kind") not in (None, kind):
+                pos = {}
+            self.tails.append(FileTail(str(path), kind, int(pos.get("offset", 0)), pos.get("inode")))
+        self.state = WindowState(ckpt.get("state"))
+        self.watermark_ns = int(ckpt.get("watermark_ns", 0))
+        self.stats = dict(ckpt.get("stats", {"events": 0, "alerts": 0, "batches": 0}))
+        # Alert của batch chưa kịp checkpoint trước khi dừng sẽ được ghi lại: cắt bỏ bản cũ
+        self.alerts_path.parent.mkdir(parents=True, exist_ok=True)
+        alerts_size = int(ckpt.get("alerts_size", 0))
+        if reset or not self.alerts_path.exists():
+            self.alerts_path.write_bytes(b"")
+        elif self.alerts_path.stat().st_size > alerts_size:
+            with open(self.alerts_path, "r+b") as f:
+                f.truncate(alerts_size)
+
+    # -- checkpoint ---------------------------------------------------------
+
+    def _load_checkpoint(self) -> Dict:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self, positions: Dict[str, Dict]) -> None:
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "positions": positions,
+                "state": self.state.to_json(),
+                "watermark_ns": self.watermark_ns,
+                "alerts_size": self.alerts_path.stat().st_size,
+                "stats": self.stats,
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    # -- model / ngưỡng (nạp lại khi file đổi) ------------------------------
+
+    def _current_model(self):
+        from models.infer import _load_model
+        from models.model_store import model_fingerprint
+
+        fp = model_fingerprint()
+        if self._model is None or self._model[3] != fp:
+            self._model = _load_model() + (fp,)
+        return self._model
+
+    def _current_threshold(self) -> Tuple[float, Dict[str, Dict[str, float]]]:
+        from explain.thresholding import SKETCH_FILENAME, entity_thresholds, load_sketch, threshold_from_sketch
+
+        p = self.scores_dir / SKETCH_FILENAME
+        try:
+            stamp = p.stat().st_mtime_ns
+        except OSError:
+            raise FileNotFoundError(f"No {p}: run score first to establish the alert threshold")
+        if self._threshold is None or self._threshold[0] != stamp:
+            cfg = load_models_config()
+            sketches = load_sketch(self.scores_dir)
+            if sketches is None:
+                raise FileNotFoundError(f"Unreadable {p}: rerun score")
+            thr, _ = threshold_from_sketch(sketches, cfg)
+            self._threshold = (stamp, thr, entity_thresholds(sketches, thr, cfg))
+        return self._threshold[1], self._threshold[2]
+
+    # -- luồng đọc ------------------------------------------------------------
+
+    def _reader(self, follow: bool) -> None:
+        try:
+            while not self._stop.is_set():
+                lines: List[Tuple[str, bytes]] = []
+                deadline = time.monotonic() + self.batch_wait
+                while len(lines) < self.batch_rows and not self._stop.is_set():
+                    got = 0
+                    for tail in self.tails:
+                        chunk = tail.read(self.batch_rows - len(lines))
+                        lines.extend((tail.kind, line) for line in chunk)
+                        got += len(chunk)
+                        if len(lines) >= self.batch_rows:
+                            break
+                    if got == 0:
+                        if not follow or time.monotonic() >= deadline:
+                            break
+                        time.sleep(min(self.poll, max(0.0, deadline - time.monotonic())))
+                    elif time.monotonic() >= deadline:
+                        break
+                if lines:
+                    positions = {t.path: t.position() for t in self.tails}
+                    self._put((lines, positions, time.time()))
+                elif not follow:
+                    break
+        finally:
+            self._put(None)
+
+    def _put(self, item) -> None:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)  # hàng đợi đầy -> chặn (backpressure)
+                return
+            except queue.Full:
+                continue
+
+    # -- xử lý ----------------------------------------------------------------
+
+    def process_batch(self, lines: List[Tuple[str, bytes]], read_at: float) -> pd.DataFrame:
+        """Một micro-batch -> các dòng alert (đã ghi vào stream_alerts.jsonl)."""
+        from models.infer import SCORE_COL, _prepare_features, _score_matrix
+        from pipeline.alerting import _apply_entity_thresholds
+
+        ecs = _records_to_ecs(lines, self.mappings)
+        if ecs.empty or "@timestamp" not in ecs.columns:
+            return pd.DataFrame()
+        ecs["@timestamp"] = pd.to_datetime(ecs["@timestamp"], utc=True, errors="coerce")
+        ecs = ecs.dropna(subset=["@timestamp"]).sort_values("@timestamp", kind="stable").reset_index(drop=True)
+        if ecs.empty:
+            return pd.DataFrame()
+        ecs = add_event_flags(ecs)
+        ecs = self.state.add_counts(ecs)
+        self.watermark_ns = max(self.watermark_ns, int(ecs["@timestamp"].iloc[-1].value))
+        self.state.evict(self.watermark_ns - self.lateness_ns)
+
+        model, scaler, feature_cols, _ = self._current_model()
+        X = _prepare_features(ecs, feature_cols).to_numpy(dtype=np.float64)
+        ecs[SCORE_COL] = _score_matrix(model, scaler, X)
+        thr, per_entity = self._current_threshold()
+        alerts = ecs[ecs[SCORE_COL] >= thr]
+        alerts = _apply_entity_thresholds(alerts, per_entity, thr)
+        self.stats["events"] += len(ecs)
+        if alerts.empty:
+            return alerts
+
+        cols = [c for c in ID_COLS if c in alerts.columns and c != "session.id"]
+        cols += [c for c in ("event.module", "event.code") if c in alerts.columns]
+        out = alerts[cols + list(feature_cols) + [SCORE_COL]].copy()
+        out["anom.threshold"] = thr
+        out["stream.latency_ms"] = round((time.time() - read_at) * 1000.0, 1)
+        text = out.to_json(orient="records", lines=True, date_format="iso")
+        with open(self.alerts_path, "a", encoding="utf-8") as f:
+            f.write(text if text.endswith("\n") else text + "\n")
+        self.stats["alerts"] += len(out)
+        return out
+
+    def run(self, follow: bool = True, max_batches: Optional[int] = None) -> Dict:
+        """Chạy đến khi hết dữ liệu (follow=False), đủ max_batches hoặc Ctrl-C; trả về thống kê."""
+        from models.infer import SCORE_COL
+
+        self._current_model()
+        self._current_threshold()
+        reader = threading.Thread(target=self._reader, args=(follow,), name="stream-reader", daemon=True)
+        reader.start()
+        done = 0
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                lines, positions, read_at = item
+                t0 = time.perf_counter()
+                alerts = self.process_batch(lines, read_at)
+                self.stats["batches"] += 1
+                self._save_checkpoint(positions)
+                done += 1
+                for _, a in alerts.head(20).iterrows():
+                    print(f"[stream] ALERT {a['@timestamp']} host={a.get('host.name')} user={a.get('user.name')} "
+                          f"score={a[SCORE_COL]:.4f}")
+                print(f"[stream] batch {self.stats['batches']}: {len(lines)} event(s), {len(alerts)} alert(s), "
+                      f"{(time.perf_counter() - t0) * 1000:.0f} ms, queue {self._queue.qsize()}/{self._queue.maxsize}")
+                if max_batches is not None and done >= max_batches:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            reader.join(timeout=5)
+        return dict(self.stats)
+
+
+def run_stream(sources: Optional[Dict[str, str]] = None, follow: bool = True, reset: bool = False,
+               max_batches: Optional[int] = None, **kwargs) -> Dict:
+    sources = sources or default_sources()
+    if not sources:
+        raise FileNotFoundError("No stream sources: pass kind=path or put *.jsonl in raw_data_dir")
+    proc = StreamProcessor(sources, reset=reset, **kwargs)
+    print(f"[stream] {len(sources)} source(s); alerts -> {proc.alerts_path}")
+    return proc.run(follow=follow, max_batches=max_batches)
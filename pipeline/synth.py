@@ -0,0 +1,433 @@
+"""Sinh dữ liệu tổng hợp quy mô lớn (Tiếng Việt)
+
+- Ghi Zeek conn, EVTX-JSON, Sysmon (JSON Lines), auth.log (syslog) và CSV flow đúng định dạng
+  mà các parser đang đọc: <out_dir>/{zeek_conn,windows_evtx,sysmon}.jsonl, auth/auth.log, flows/flows.csv
+- Quy mô tuỳ chỉnh (events, hosts, users, days); host/user/IP đích phân bố lệch (Zipf) như mạng thật
+- Tất định theo seed: cùng tham số -> cùng byte; sinh theo khối SYNTH_CHUNK_ROWS sự kiện, mỗi khối
+  là một đoạn thời gian liên tiếp (file đã sắp theo thời gian, RAM không phụ thuộc tổng số sự kiện)
+- auth.log (syslog) không có năm: parser dùng SYSLOG_DEFAULT_YEAR, nên khoảng thời gian có auth_log
+  không được vắt qua hai năm; năm cần đặt trả về ở "syslog_year"
+- Chèn các mẫu tấn công (brute force, port scan, beaconing, PowerShell mã hoá, exfiltration);
+  ground truth ghi ở <out_dir>/attacks.jsonl (không trùng đuôi *.log / *.csv mà ingest quét)
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+SOURCES = ("zeek_conn", "windows_evtx", "sysmon", "auth_log", "csv_flows")
+OUTPUT_FILES = {
+    "zeek_conn": "zeek_conn.jsonl",
+    "windows_evtx": "windows_evtx.jsonl",
+    "sysmon": "sysmon.jsonl",
+    "auth_log": "auth/auth.log",
+    "csv_flows": "flows/flows.csv",
+}
+DEFAULT_MIX = {"zeek_conn": 0.4, "windows_evtx": 0.2, "sysmon": 0.2, "auth_log": 0.1, "csv_flows": 0.1}
+ATTACK_TYPES = ("brute_force", "port_scan", "beaconing", "encoded_powershell", "exfiltration")
+DEFAULT_START = "2025-10-01T00:00:00Z"
+
+_PORTS = np.array([443, 80, 53, 22, 445, 3389, 8080, 123, 389, 25])
+_PORT_P = np.array([0.45, 0.15, 0.15, 0.04, 0.06, 0.02, 0.05, 0.04, 0.03, 0.01])
+_SERVICE = {443: "ssl", 80: "http", 53: "dns", 22: "ssh", 445: "smb", 3389: "rdp", 8080: "http",
+            123: "ntp", 389: "ldap", 25: "smtp", 4444: "-"}
+_CONN_STATES = np.array(["SF", "S0", "REJ", "RSTO", "OTH"])
+_CONN_P = np.array([0.9, 0.03, 0.02, 0.03, 0.02])
+_PROCESSES = [
+    ("C:\\Windows\\System32\\svchost.exe", "svchost.exe -k netsvcs -p"),
+    ("C:\\Windows\\explorer.exe", "explorer.exe"),
+    ("C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe", "chrome.exe --type=renderer"),
+    ("C:\\Windows\\System32\\cmd.exe", "cmd.exe /c dir"),
+    ("C:\\Program Files\\Microsoft Office\\root\\Office16\\OUTLOOK.EXE", "OUTLOOK.EXE"),
+    ("C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe", "powershell.exe -File C:\\Scripts\\inventory.ps1"),
+    ("C:\\Windows\\System32\\taskhostw.exe", "taskhostw.exe"),
+    ("C:\\Windows\\System32\\winlogon.exe", "winlogon.exe -k"),
+]
+_PROC_P = np.array([0.3, 0.15, 0.2, 0.1, 0.1, 0.03, 0.07, 0.05])
+_POWERSHELL = _PROCESSES[5][0]
+
+
+def _chunk_rows() -> int:
+    return int(os.getenv("SYNTH_CHUNK_ROWS", "500000"))
+
+
+def _zipf_p(n: int, s: float = 1.1) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def _internal_ips(n: int) -> np.ndarray:
+    i = np.arange(n)
+    return np.array([f"10.{a}.{b}.{c}" for a, b, c in zip((i // 64000) % 256, (i // 250) % 256, i % 250 + 1)])
+
+
+def _universe(rng: np.random.Generator, hosts: int, users: int, external: int = 2000) -> Dict[str, np.ndarray]:
+    first = np.setdiff1d(np.arange(11, 224), [100, 127, 169, 172, 192])
+    ext = rng.choice(first, external).astype(str)
+    for _ in range(3):
+        ext = np.char.add(np.char.add(ext, "."), rng.integers(1, 255, external).astype(str))
+    n_servers = max(1, hosts // 20)
+    return {
+        "hosts": np.array([f"host-{i:04d}" for i in range(1, hosts + 1)]),
+        "host_ips": _internal_ips(hosts),
+        "host_p": _zipf_p(hosts, 0.8),
+        "users": np.array([f"user{i:04d}" for i in range(1, users + 1)]),
+        "user_p": _zipf_p(users, 0.8),
+        "servers": np.arange(n_servers),
+        "ext_ips": ext,
+        "ext_p": _zipf_p(external, 1.2),
+    }
+
+
+def _iso(ts: np.ndarray) -> np.ndarray:
+    return np.char.add(np.datetime_as_string(ts.astype("datetime64[ms]"), unit="ms"), "Z")
+
+
+def _frame(ts: np.ndarray, **cols) -> pd.DataFrame:
+    df = pd.DataFrame({"ts": ts.astype("datetime64[ns]"), **cols})
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Sự kiện bình thường: mỗi nguồn một DataFrame "chung" (cột theo nguồn), render ra text ở dưới
+
+
+def _normal_zeek(rng, ts, u) -> pd.DataFrame:
+    n = len(ts)
+    h = rng.choice(len(u["hosts"]), n, p=u["host_p"])
+    internal = rng.random(n) < 0.3
+    resp = np.where(internal, u["host_ips"][rng.choice(u["servers"], n)],
+                    u["ext_ips"][rng.choice(len(u["ext_ips"]), n, p=u["ext_p"])])
+    port = rng.choice(_PORTS, n, p=_PORT_P)
+    return _frame(ts, orig_h=u["host_ips"][h], orig_p=rng.integers(49152, 65536, n), resp_h=resp,
+                  resp_p=port, proto=np.where(np.isin(port, [53, 123]), "udp", "tcp"),
+                  conn_state=rng.choice(_CONN_STATES, n, p=_CONN_P))
+
+
+def _normal_evtx(rng, ts, u) -> pd.DataFrame:
+    n = len(ts)
+    h = rng.choice(len(u["hosts"]), n, p=u["host_p"])
+    eid = rng.choice([4624, 4634, 4688, 4672, 4625], n, p=[0.45, 0.25, 0.17, 0.1, 0.03])
+    proc = rng.choice(len(_PROCESSES), n, p=_PROC_P)
+    return _frame(ts, host=u["hosts"][h], user=u["users"][rng.choice(len(u["users"]), n, p=u["user_p"])],
+                  event_id=eid, ip=u["host_ips"][rng.choice(len(u["hosts"]), n, p=u["host_p"])],
+                  logon_type=rng.choice(["2", "3", "10"], n, p=[0.5, 0.45, 0.05]),
+                  status=np.where(eid == 4625, "Failure", "Success"),
+                  process=np.array([p[0] for p in _PROCESSES])[proc],
+                  cmd=np.array([p[1] for p in _PROCESSES])[proc])
+
+
+def _normal_sysmon(rng, ts, u) -> pd.DataFrame:
+    n = len(ts)
+    h = rng.choice(len(u["hosts"]), n, p=u["host_p"])
+    eid = rng.choice([1, 3], n, p=[0.55, 0.45])
+    proc = rng.choice(len(_PROCESSES), n, p=_PROC_P)
+    port = rng.choice(_PORTS, n, p=_PORT_P)
+    net = eid == 3
+    return _frame(ts, host=u["hosts"][h], user=u["users"][rng.choice(len(u["users"]), n, p=u["user_p"])],
+                  event_id=eid, image=np.array([p[0] for p in _PROCESSES])[proc],
+                  cmd=np.array([p[1] for p in _PROCESSES])[proc],
+                  src_ip=np.where(net, u["host_ips"][h], ""),
+                  dst_ip=np.where(net, u["ext_ips"][rng.choice(len(u["ext_ips"]), n, p=u["ext_p"])], ""),
+                  src_port=np.where(net, rng.integers(49152, 65536, n), 0),
+                  dst_port=np.where(net, port, 0),
+                  proto=np.where(net, np.where(np.isin(port, [53, 123]), "udp", "tcp"), ""))
+
+
+def _normal_auth(rng, ts, u) -> pd.DataFrame:
+    n = len(ts)
+    h = rng.choice(len(u["hosts"]), n, p=u["host_p"])
+    return _frame(ts, host=u["hosts"][h], user=u["users"][rng.choice(len(u["users"]), n, p=u["user_p"])],
+                  ok=rng.random(n) >= 0.03,
+                  ip=u["host_ips"][rng.choice(len(u["hosts"]), n, p=u["host_p"])],
+                  port=rng.integers(32768, 61000, n), pid=rng.integers(1000, 65000, n))
+
+
+def _normal_csv(rng, ts, u) -> pd.DataFrame:
+    n = len(ts)
+    h = rng.choice(len(u["hosts"]), n, p=u["host_p"])
+    port = rng.choice(_PORTS, n, p=_PORT_P)
+    return _frame(ts, host=u["hosts"][h], user=u["users"][rng.choice(len(u["users"]), n, p=u["user_p"])],
+                  src_ip=u["host_ips"][h],
+                  dst_ip=u["ext_ips"][rng.choice(len(u["ext_ips"]), n, p=u["ext_p"])],
+                  src_port=rng.integers(49152, 65536, n), dst_port=port,
+                  proto=np.where(np.isin(port, [53, 123]), "UDP", "TCP"),
+                  fwd=rng.lognormal(7, 1.5, n).astype(np.int64), bwd=rng.lognormal(9, 2, n).astype(np.int64),
+                  label="BENIGN")
+
+
+_NORMAL = {"zeek_conn": _normal_zeek, "windows_evtx": _normal_evtx, "sysmon": _normal_sysmon,
+           "auth_log": _normal_auth, "csv_flows": _normal_csv}
+
+
+# ---------------------------------------------------------------------------
+# Tấn công: lập kế hoạch một lần (vài trăm sự kiện mỗi cuộc), trộn vào khối theo thời gian
+
+
+def _spread(t0: np.datetime64, seconds: float, n: int, rng) -> np.ndarray:
+    return t0 + np.sort(rng.random(n) * seconds * 1e9).astype("timedelta64[ns]")
+
+
+def _plan_attacks(rng, u, start: np.datetime64, span_ns: int, count: int):
+    """-> (danh sách ground truth, {source: DataFrame sự kiện tấn công đã sắp theo thời gian})."""
+    truth: List[Dict] = []
+    frames: Dict[str, List[pd.DataFrame]] = {s: [] for s in SOURCES}
+    margin = int(3 * 3600 * 1e9)
+    for i in range(count):
+        kind = ATTACK_TYPES[i % len(ATTACK_TYPES)]
+        t0 = start + np.timedelta64(int(rng.integers(0, max(1, span_ns - margin))), "ns")
+        h = int(rng.integers(len(u["hosts"])))
+        host, host_ip = u["hosts"][h], u["host_ips"][h]
+        user = u["users"][int(rng.integers(len(u["users"])))]
+        ext = f"203.0.113.{int(rng.integers(1, 255))}"  # TEST-NET-3: không trùng IP ngoài bình thường
+        emitted: Dict[str, int] = {}
+
+        def _add(source: str, df: pd.DataFrame) -> None:
+            frames[source].append(df)
+            emitted[source] = emitted.get(source, 0) + len(df)
+
+        if kind == "brute_force":
+            n = 200
+            ts = _spread(t0, 300, n, rng)
+            ok = np.zeros(n, dtype=bool)
+            ok[-1] = True
+            _add("windows_evtx", _frame(ts, host=host, user=user, event_id=np.where(ok, 4624, 4625), ip=ext,
+                                        logon_type="3", status=np.where(ok, "Success", "Failure"),
+                                        process=_PROCESSES[7][0], cmd=_PROCESSES[7][1]))
+            _add("auth_log", _frame(ts, host=host, user=user, ok=ok, ip=ext,
+                                    port=rng.integers(32768, 61000, n), pid=rng.integers(1000, 65000, n)))
+            src, dst, end = ext, host_ip, ts[-1]
+        elif kind == "port_scan":
+            n = 1024
+            ts = _spread(t0, 60, n, rng)
+            target = u["host_ips"][int(rng.choice(u["servers"]))]
+            ports = rng.permutation(np.arange(1, n + 1))
+            _add("zeek_conn", _frame(ts, orig_h=host_ip, orig_p=rng.integers(49152, 65536, n), resp_h=target,
+                                     resp_p=ports, proto="tcp",
+                                     conn_state=rng.choice(["S0", "REJ"], n, p=[0.6, 0.4])))
+            _add("csv_flows", _frame(ts, host=host, user=user, src_ip=host_ip, dst_ip=target,
+                                     src_port=rng.integers(49152, 65536, n), dst_port=ports, proto="TCP",
+                                     fwd=np.full(n, 60), bwd=np.zeros(n, dtype=np.int64), label="PortScan"))
+            src, dst, end = host_ip, target, ts[-1]
+        elif kind == "beaconing":
+            n = 120
+            jitter = rng.normal(0, 2e9, n).astype(np.int64)
+            ts = t0 + (np.arange(n, dtype=np.int64) * int(60e9) + jitter).astype("timedelta64[ns]")
+            ts = np.sort(ts)
+            _add("zeek_conn", _frame(ts, orig_h=host_ip, orig_p=rng.integers(49152, 65536, n), resp_h=ext,
+                                     resp_p=4444, proto="tcp", conn_state="SF"))
+            _add("sysmon", _frame(ts, host=host, user=user, event_id=3, image=_POWERSHELL,
+                                  cmd="powershell.exe -NoP -W Hidden", src_ip=host_ip, dst_ip=ext,
+                                  src_port=rng.integers(49152, 65536, n), dst_port=4444, proto="tcp"))
+            src, dst, end = host_ip, ext, ts[-1]
+        elif kind == "encoded_powershell":
+            n = 20
+            ts = _spread(t0, 600, n, rng)
+            alphabet = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"))
+            cmds = np.array(["powershell.exe -NoP -W Hidden -enc " + "".join(rng.choice(alphabet, 160))
+                             for _ in range(n)])
+            _add("sysmon", _frame(ts, host=host, user=user, event_id=1, image=_POWERSHELL, cmd=cmds,
+                                  src_ip="", dst_ip="", src_port=0, dst_port=0, proto=""))
+            _add("windows_evtx", _frame(ts, host=host, user=user, event_id=4688, ip=host_ip, logon_type="2",
+                                        status="Success", process=_POWERSHELL, cmd=cmds))
+            src, dst, end = host_ip, None, ts[-1]
+        else:  # exfiltration
+            n = 50
+            ts = _spread(t0, 600, n, rng)
+            _add("csv_flows", _frame(ts, host=host, user=user, src_ip=host_ip, dst_ip=ext,
+                                     src_port=rng.integers(49152, 65536, n), dst_port=443, proto="TCP",
+                                     fwd=rng.integers(20_000_000, 80_000_000, n), bwd=rng.integers(1_000, 10_000, n),
+                                     label="Exfiltration"))
+            _add("zeek_conn", _frame(ts, orig_h=host_ip, orig_p=rng.integers(49152, 65536, n), resp_h=ext,
+                                     resp_p=443, proto="tcp", conn_state="SF"))
+            src, dst, end = host_ip, ext, ts[-1]
+
+        truth.append({"attack_id": i, "type": kind, "start": str(_iso(np.array([t0]))[0]),
+                      "end": str(_iso(np.array([end]))[0]), "host": str(host), "user": str(user),
+                      "src_ip": src, "dst_ip": dst, "events": emitted})
+
+    merged = {}
+    for s, parts in frames.items():
+        merged[s] = (pd.concat(parts, ignore_index=True).sort_values("ts", kind="stable").reset_index(drop=True)
+                     if parts else None)
+    return truth, merged
+
+
+# ---------------------------------------------------------------------------
+# Render từng nguồn ra text (vector hoá, không lặp theo dòng)
+
+
+def _lines(df: pd.DataFrame) -> str:
+    text = df.to_json(orient="records", lines=True)
+    return text if text.endswith("\n") else text + "\n"
+
+
+def _render_zeek(df: pd.DataFrame, uid0: int) -> str:
+    uid = "C" + pd.Series(np.arange(uid0, uid0 + len(df)), dtype=np.int64).map("{:012x}".format)
+    return _lines(pd.DataFrame({
+        "ts": _iso(df["ts"].to_numpy()), "id.orig_h": df["orig_h"].to_numpy(),
+        "id.orig_p": df["orig_p"].to_numpy(), "id.resp_h": df["resp_h"].to_numpy(),
+        "id.resp_p": df["resp_p"].to_numpy(), "proto": df["proto"].to_numpy(),
+        "service": df["resp_p"].map(_SERVICE).fillna("-").to_numpy(),
+        "conn_state": df["conn_state"].to_numpy(), "uid": uid.to_numpy(), "local_orig": True,
+    }))
+
+
+def _q(s: pd.Series) -> pd.Series:
+    """Chuỗi JSON (có dấu nháy, đã escape) cho từng giá trị; giá trị lặp lại chỉ encode một lần."""
+    uniq = pd.unique(s)
+    return s.map(dict(zip(uniq, (json.dumps(str(v)) for v in uniq))))
+
+
+def _render_evtx(df: pd.DataFrame) -> str:
+    ts = pd.Series(_iso(df["ts"].to_numpy()))
+    s = ('{"Event":{"System":{"Computer":' + _q(df["host"]) + ',"EventID":' + df["event_id"].astype(str)
+         + '},"EventData":{"TargetUserName":' + _q(df["user"]) + ',"IpAddress":' + _q(df["ip"])
+         + ',"SubjectUserName":"SYSTEM","LogonType":' + _q(df["logon_type"]) + ',"Status":' + _q(df["status"])
+         + ',"ProcessName":' + _q(df["process"]) + ',"CommandLine":' + _q(df["cmd"])
+         + '}},"@timestamp":"' + ts + '"}')
+    return "\n".join(s) + "\n"
+
+
+def _render_sysmon(df: pd.DataFrame) -> str:
+    net = df["event_id"].to_numpy() == 3
+    out = pd.DataFrame({
+        "UtcTime": _iso(df["ts"].to_numpy()), "Computer": df["host"].to_numpy(),
+        "EventID": df["event_id"].to_numpy(), "Image": df["image"].to_numpy(),
+        "CommandLine": df["cmd"].to_numpy(), "User": ("CORP\\" + df["user"]).to_numpy(),
+        "SourceIp": np.where(net, df["src_ip"], None), "DestinationIp": np.where(net, df["dst_ip"], None),
+        "SourcePort": np.where(net, df["src_port"], None), "DestinationPort": np.where(net, df["dst_port"], None),
+        "Protocol": np.where(net, df["proto"], None),
+    })
+    return _lines(out)
+
+
+_MONTHS = np.array(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])
+
+
+def _render_auth(df: pd.DataFrame) -> str:
+    ts = pd.Series(np.datetime_as_string(df["ts"].to_numpy().astype("datetime64[s]"), unit="s"))
+    stamp = (pd.Series(_MONTHS[ts.str.slice(5, 7).astype(int).to_numpy() - 1]) + " "
+             + ts.str.slice(8, 10).str.lstrip("0").str.rjust(2) + " " + ts.str.slice(11, 19))
+    msg = np.where(df["ok"].to_numpy(), "Accepted password for ", "Failed password for ")
+    s = (stamp + " " + df["host"] + " sshd[" + df["pid"].astype(str) + "]: " + msg + df["user"]
+         + " from " + df["ip"] + " port " + df["port"].astype(str) + " ssh2")
+    return "\n".join(s) + "\n"
+
+
+def _render_csv(df: pd.DataFrame, header: bool) -> str:
+    # dd/mm/YYYY HH:MM:SS như các bộ flow CIC-IDS (csv_parser đọc với dayfirst=True)
+    iso = pd.Series(np.datetime_as_string(df["ts"].to_numpy().astype("datetime64[s]"), unit="s"))
+    stamp = (iso.str.slice(8, 10) + "/" + iso.str.slice(5, 7) + "/" + iso.str.slice(0, 4) + " "
+             + iso.str.slice(11, 19))
+    return pd.DataFrame({
+        "timestamp": stamp.to_numpy(), "src_ip": df["src_ip"].to_numpy(), "dst_ip": df["dst_ip"].to_numpy(),
+        "src_port": df["src_port"].to_numpy(), "dst_port": df["dst_port"].to_numpy(),
+        "protocol": df["proto"].to_numpy(), "tot_fwd_bytes": df["fwd"].to_numpy(),
+        "tot_bwd_bytes": df["bwd"].to_numpy(), "label": df["label"].to_numpy(),
+        "host": df["host"].to_numpy(), "user": df["user"].to_numpy(),
+    }).to_csv(index=False, header=header)
+
+
+# ---------------------------------------------------------------------------
+
+
+def generate(
+    out_dir: Path,
+    events: int = 1_000_000,
+    hosts: int = 200,
+    users: int = 500,
+    days: float = 7.0,
+    seed: int = 42,
+    attacks: Optional[int] = None,
+    start: str = DEFAULT_START,
+    mix: Optional[Dict[str, float]] = None,
+) -> Dict:
+    """
+    Sinh khoảng `events` sự kiện bình thường (chia theo mix) cộng các sự kiện tấn công vào out_dir.
+    attacks: số cuộc tấn công (mặc định max(5, events // 200k)). Trả về thống kê kèm đường dẫn file.
+    Có auth_log mà khoảng [start, start + days) vắt qua hai năm (UTC) -> ValueError.
+    """
+    out_dir = Path(out_dir)
+    mix = {s: float(w) for s, w in (mix or DEFAULT_MIX).items() if s in SOURCES and w > 0}
+    if not mix:
+        raise ValueError(f"mix must weight at least one of {SOURCES}")
+    total_w = sum(mix.values())
+    per_source = {s: int(round(events * w / total_w)) for s, w in mix.items()}
+    attacks = max(5, events // 200_000) if attacks is None else attacks
+
+    rng = np.random.default_rng(seed)
+    u = _universe(rng, hosts, users)
+    t_start = np.datetime64(pd.Timestamp(start).tz_convert("UTC").tz_localize(None), "ns")
+    span_ns = int(days * 86400 * 1e9)
+    t_end = t_start + np.timedelta64(max(0, span_ns - 1), "ns")
+    years = {int(str(t)[:4]) for t in (t_start, t_end)}
+    if "auth_log" in mix and len(years) > 1:
+        raise ValueError(f"auth.log has no year and is parsed with a single SYSLOG_DEFAULT_YEAR; "
+                         f"span {start} + {days} day(s) crosses a year boundary (drop auth_log from mix or "
+                         f"shorten/move the span)")
+    truth, attack_frames = _plan_attacks(rng, u, t_start, span_ns, attacks)
+
+    n_chunks = max(1, -(-events // max(1, _chunk_rows())))
+    files = {s: out_dir / OUTPUT_FILES[s] for s in mix}
+    for p in files.values():
+        p.parent.mkdir(parents=True, exist_ok=True)
+    handles = {s: open(p, "w", encoding="utf-8", newline="") for s, p in files.items()}
+    written = {s: 0 for s in mix}
+    try:
+        for c in range(n_chunks):
+            c0 = t_start + np.timedelta64(span_ns * c // n_chunks, "ns")
+            c1 = t_start + np.timedelta64(span_ns * (c + 1) // n_chunks, "ns")
+            for si, s in enumerate(SOURCES):
+                if s not in mix:
+                    continue
+                n = per_source[s] * (c + 1) // n_chunks - per_source[s] * c // n_chunks
+                crng = np.random.default_rng([seed, c, si])
+                ts = c0 + np.sort(crng.random(n) * (c1 - c0).astype(np.int64)).astype("timedelta64[ns]")
+                df = _NORMAL[s](crng, ts, u)
+                atk = attack_frames.get(s)
+                if atk is not None:
+                    lo, hi = np.searchsorted(atk["ts"].to_numpy(), [c0, c1])
+                    if c == n_chunks - 1:
+                        hi = len(atk)
+                    if hi > lo:
+                        df = pd.concat([df, atk.iloc[lo:hi]], ignore_index=True)
+                        df = df.sort_values("ts", kind="stable").reset_index(drop=True)
+                if df.empty:
+                    continue
+                if s == "zeek_conn":
+                    text = _render_zeek(df, written[s])
+                elif s == "windows_evtx":
+                    text = _render_evtx(df)
+                elif s == "sysmon":
+                    text = _render_sysmon(df)
+                elif s == "auth_log":
+                    text = _render_auth(df)
+                else:
+                    text = _render_csv(df, header=written[s] == 0)
+                handles[s].write(text)
+                written[s] += len(df)
+            print(f"[synth] chunk {c + 1}/{n_chunks}: {sum(written.values()):,} events")
+    finally:
+        for f in handles.values():
+            f.close()
+
+    with open(out_dir / "attacks.jsonl", "w", encoding="utf-8") as f:
+        for t in truth:
+            f.write(json.dumps(t) + "\n")
+    return {
+        "events": int(sum(written.values())),
+        "per_source": written,
+        "attacks": len(truth),
+        "files": {s: str(p) for s, p in files.items()},
+        "bytes": int(sum(p.stat().st_size for p in files.values())),
+        "syslog_year": min(years) if "auth_log" in mix else None,
+        "params": {"events": events, "hosts": hosts, "users": users, "days": days, "seed": seed,
+                   "attacks": attacks, "start": start, "mix": mix},
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+    }
@@ -0,0 +1,26 @@
+import pandas as pd
+import pyarrow.parquet as pq
+
+from parsers.base_reader import ParquetBatchWriter, write_partitioned_parquet
+
+
+def _events(n: int) -> pd.DataFrame:
+    ts = pd.date_range("2025-10-01", periods=n, freq="s", tz="UTC")
+    return pd.DataFrame({"@timestamp": ts, "host.name": "h1", "dt": ts.strftime("%Y-%m-%d")})
+
+
+def test_batch_writer_honours_row_group_rows(tmp_path, monkeypatch):
+    monkeypatch.setenv("ECS_ROW_GROUP_ROWS", "1000")
+    monkeypatch.setenv("PIPELINE_METRICS", "0")
+    ParquetBatchWriter(tmp_path, "custom_csv").write(_events(10_000))
+    files = list((tmp_path / "custom_csv").glob("dt=*/*.parquet"))
+    assert files
+    assert all(pq.ParquetFile(f).num_row_groups > 1 for f in files)
+
+
+def test_partitioned_writer_honours_row_group_rows(tmp_path, monkeypatch):
+    monkeypatch.setenv("ECS_ROW_GROUP_ROWS", "1000")
+    monkeypatch.setenv("PIPELINE_METRICS", "0")
+    write_partitioned_parquet(_events(10_000).drop(columns=["dt"]), tmp_path, "sysmon")
+    f = tmp_path / "sysmon" / "dt=2025-10-01" / "part.parquet"
+    assert pq.ParquetFile(f).num_row_groups == 10
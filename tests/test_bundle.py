@@ -0,0 +1,34 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from pipeline.bundle import _jsonl_chunks
+
+
+def _rows(df, batch_rows=2):
+    return [json.loads(line) for chunk in _jsonl_chunks(df, batch_rows) for line in chunk.decode().splitlines()]
+
+
+def test_jsonl_drops_nulls_and_keeps_precision():
+    df = pd.DataFrame({
+        "@timestamp": pd.to_datetime(["2025-10-01T00:00:00Z", None, "2025-10-01T00:00:02Z"], utc=True),
+        "anom.score": [0.1 + 0.2, np.nan, 1 / 3],
+        "destination.port": pd.array([443, None, 22], dtype="Int64"),
+        "user.name": ["alice", None, 'quote "null"'],
+    })
+    rows = _rows(df)
+    assert rows[0] == {"@timestamp": "2025-10-01 00:00:00+00:00", "anom.score": 0.1 + 0.2,
+                       "destination.port": 443, "user.name": "alice"}
+    assert rows[1] == {}
+    assert rows[2]["anom.score"] == 1 / 3
+    assert rows[2]["user.name"] == 'quote "null"'
+
+
+def test_alert_key_matches_ui_normalized_row():
+    from pipeline.incidents import alert_key
+
+    raw = pd.Series({"@timestamp": "2025-10-01T00:00:01.5Z", "host.name": "h1", "user.name": None})
+    ui = pd.Series({"@timestamp": pd.Timestamp("2025-10-01 00:00:01.5", tz="UTC"), "host.name": "h1",
+                    "user.name": "unknown"})
+    assert alert_key(raw) == alert_key(ui) == "2025-10-01T00:00:01.500000+00:00|h1|unknown"
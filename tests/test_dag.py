@@ -0,0 +1,36 @@
+import pytest
+
+from pipeline import dag
+from pipeline.dag import Stage, run_dag
+
+
+def _fail():
+    raise OSError("source unreadable")
+
+
+def _stage(name, func, deps=(), optional=False):
+    return Stage(name, func, lambda: [], lambda: [], deps=list(deps), optional=optional)
+
+
+@pytest.fixture(autouse=True)
+def _state(tmp_path, monkeypatch):
+    monkeypatch.setattr(dag, "_state_path", lambda: tmp_path / "dag_state.json")
+
+
+def test_optional_failure_does_not_block_dependents():
+    ran = []
+    stages = [
+        _stage("ingest:a", _fail, optional=True),
+        _stage("ingest:b", lambda: ran.append("b"), optional=True),
+        _stage("featurize", lambda: ran.append("featurize"), deps=["ingest:a", "ingest:b"]),
+    ]
+    result = run_dag(stages)
+    assert result == {"ingest:a": "failed", "ingest:b": "ran", "featurize": "ran"}
+    assert dag.load_state()["ingest:a"]["status"] == "failed"
+    assert sorted(ran) == ["b", "featurize"]
+
+
+def test_required_failure_blocks_and_raises():
+    stages = [_stage("train", _fail), _stage("score", lambda: None, deps=["train"])]
+    with pytest.raises(RuntimeError):
+        run_dag(stages)
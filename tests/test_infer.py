@@ -0,0 +1,51 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from models import infer
+from models.infer import SCORE_COL, _score_partition_impl
+
+
+class _Model:
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def decision_function(self, X):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("boom")
+        return -X[:, 0]
+
+
+def _parts(tmp_path):
+    ts = pd.date_range("2025-10-01", periods=4, freq="s", tz="UTC")
+    # file đầu: host.name toàn null (kiểu null), login_failed int; file sau: host.name dictionary, login_failed float
+    a = pa.table({"@timestamp": ts[:2], "host.name": pa.nulls(2), "login_failed": pa.array([1, 0])})
+    b = pa.table({"@timestamp": ts[2:], "host.name": pa.array(["h1", "h2"]).dictionary_encode(),
+                  "login_failed": pa.array([0.5, None])})
+    paths = [str(tmp_path / "a.parquet"), str(tmp_path / "b.parquet")]
+    pq.write_table(a, paths[0])
+    pq.write_table(b, paths[1])
+    return paths
+
+
+def test_partition_schema_is_fixed_across_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(infer, "_WORKER_MODEL", (_Model(), None, ["login_failed"]))
+    out = tmp_path / "dt=2025-10-01" / "part.parquet"
+    stat = _score_partition_impl(_parts(tmp_path), str(out), 1, {})
+    assert stat["rows"] == 4
+    table = pq.read_table(out)
+    assert table.schema.field("host.name").type == pa.string()
+    assert table.schema.field("login_failed").type == pa.float64()
+    assert table.column("host.name").to_pylist() == [None, None, "h1", "h2"]
+    assert table.column(SCORE_COL).to_pylist() == [1.0, 0.0, 0.5, 0.0]
+
+
+def test_failed_partition_leaves_no_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(infer, "_WORKER_MODEL", (_Model(fail_after=2), None, ["login_failed"]))
+    out = tmp_path / "dt=2025-10-01" / "part.parquet"
+    with pytest.raises(RuntimeError):
+        _score_partition_impl(_parts(tmp_path), str(out), 1, {})
+    assert list(out.parent.iterdir()) == []
@@ -0,0 +1,45 @@
+import numpy as np
+
+from explain.path_attribution import path_attributions, top_feature_names
+from models.flat_forest import FlatForest
+
+
+def _tree() -> FlatForest:
+    #        0: x0 > 0
+    #      /            \\
+    #  1: x0 > -1      2: x1 > 0
+    #   /     \\        /     \\
+    #  3       4      5       6
+    left = np.array([1, 3, 5, 3, 4, 5, 6])
+    right = np.array([2, 4, 6, 3, 4, 5, 6])
+    return FlatForest({
+        "feature": np.array([0, 0, 1, 0, 0, 0, 0], dtype=np.int32),
+        "threshold": np.array([0.0, -1.0, 0.0, np.inf, np.inf, np.inf, np.inf]),
+        "children": np.stack([left, right], axis=1).ravel().astype(np.int32),
+        "value": np.zeros(7),
+        "roots": np.array([0], dtype=np.int32),
+        "n_levels": np.int64(2),
+        "n_features": np.int64(3),
+        "denominator": np.float64(1.0),
+        "offset": np.float64(0.0),
+    })
+
+
+def test_every_split_on_the_path_is_credited():
+    X = np.array([[-0.5, 5.0, 0.0], [-2.0, 0.0, 0.0], [1.0, 1.0, 0.0]])
+    contrib = path_attributions(_tree(), X)
+    # x0 tách ở độ sâu 0 và 1: 1 + 1/2; dòng bên phải: x0 ở gốc, x1 ở độ sâu 1
+    np.testing.assert_allclose(contrib, [[1.5, 0.0, 0.0], [1.5, 0.0, 0.0], [1.0, 0.5, 0.0]])
+
+
+def test_credit_is_averaged_over_trees():
+    one = _tree()
+    two = FlatForest({**one.arrays,
+                      "feature": np.concatenate([one.feature, one.feature]),
+                      "threshold": np.concatenate([one.threshold, one.threshold]),
+                      "children": np.concatenate([one.children, one.children + 7]).astype(np.int32),
+                      "value": np.zeros(14),
+                      "roots": np.array([0, 7], dtype=np.int32)})
+    X = np.array([[1.0, 1.0, 0.0]])
+    np.testing.assert_allclose(path_attributions(two, X), path_attributions(one, X))
+    assert top_feature_names(two, X, ["a", "b", "c"]) == ["a,b"]
@@ -0,0 +1,29 @@
+import json
+import multiprocessing as mp
+
+import pytest
+
+from pipeline import profiling
+from pipeline.profiling import record
+
+
+def _work(i):
+    with record("score.partition", partition=str(i)) as m:
+        m.rows_in = i
+    return i
+
+
+@pytest.mark.skipif("fork" not in mp.get_all_start_methods(), reason="needs fork")
+def test_forked_workers_share_run_id(tmp_path, monkeypatch):
+    monkeypatch.setenv("PIPELINE_RUN_ID", "")  # restored after the test; record() sets a fresh id
+    monkeypatch.delenv("PIPELINE_RUN_ID")
+    monkeypatch.setenv("PIPELINE_METRICS", "1")
+    monkeypatch.setattr(profiling, "metrics_dir", lambda: tmp_path)
+    with record("score"):
+        with mp.get_context("fork").Pool(2) as pool:
+            assert pool.map(_work, range(4)) == list(range(4))
+    files = list(tmp_path.glob("*.jsonl"))
+    assert len(files) == 1
+    recs = [json.loads(line) for line in files[0].read_text().splitlines()]
+    assert sorted(r["stage"] for r in recs) == ["score"] + ["score.partition"] * 4
+    assert len({r["run_id"] for r in recs}) == 1
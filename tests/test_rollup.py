@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from pipeline.rollup import aggregate, downsample_peaks
+
+
+def _series(start: str, end: str, n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range(start, end, periods=n, tz="UTC")
+    return pd.DataFrame({"@timestamp": ts, "max": rng.normal(size=n)})
+
+
+def test_downsample_peaks_multi_year_span():
+    df = _series("2014-03-12", "2017-04-24", 200_000)
+    peak = df["max"].idxmax()
+    trough = df["max"].idxmin()
+    out = downsample_peaks(df, max_points=1500)
+    assert 1400 <= len(out) <= 1500
+    assert peak in out.index and trough in out.index
+    assert out["@timestamp"].is_monotonic_increasing
+
+
+def test_downsample_peaks_keeps_extremes_of_every_bin():
+    df = _series("2025-10-01", "2025-10-02", 10_000, seed=1)
+    out = downsample_peaks(df, max_points=100, value="max")
+    assert len(out) <= 100
+    assert out["max"].max() == df["max"].max()
+    assert out["max"].min() == df["max"].min()
+
+
+def test_aggregate_matches_groupby():
+    df = _series("2025-10-01", "2025-10-01 06:00", 5_000, seed=2).rename(columns={"max": "anom.score"})
+    df["host.name"] = np.where(np.arange(len(df)) % 3 == 0, "h1", None)
+    roll = aggregate(df, ["1h"])
+    glob = roll[roll["host.name"] == "*"].set_index("@timestamp").sort_index()
+    g = df.groupby(df["@timestamp"].dt.floor("1h"))["anom.score"]
+    assert np.array_equal(glob["count"].to_numpy(), g.count().to_numpy())
+    assert np.allclose(glob["max"].to_numpy(), g.max().to_numpy())
+    assert np.allclose(glob["p95"].to_numpy(), g.quantile(0.95).to_numpy())
+    assert np.allclose(glob["mean"].to_numpy(), g.mean().to_numpy())
+    assert set(roll["host.name"]) == {"*", "h1", "unknown"}
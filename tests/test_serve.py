@@ -0,0 +1,45 @@
+import numpy as np
+
+from models.serve import MicroBatcher, score_request
+
+COL = "login_failed_count_15m"
+
+
+class _Passthrough:
+    # điểm = giá trị feature duy nhất
+    def decision_function(self, X):
+        return -X[:, 0]
+
+
+def _batcher(monkeypatch):
+    b = MicroBatcher(max_wait_ms=1.0)
+    monkeypatch.setattr(b, "model", lambda: (_Passthrough(), None, [COL], "fp"))
+    return b
+
+
+def _failed(ts, user="u1"):
+    return {"@timestamp": ts, "host.name": "h1", "user.name": user, "event.code": "4625"}
+
+
+def test_window_counts_carry_across_requests(monkeypatch):
+    b = _batcher(monkeypatch)
+    first = score_request(b, {"events": [_failed("2025-10-01T00:00:00Z"), _failed("2025-10-01T00:01:00Z")]})
+    second = score_request(b, {"events": [_failed("2025-10-01T00:02:00Z"), {"host.name": "h1"}]})
+    assert first == {"scores": [1.0, 2.0], "model": "fp"}
+    assert second == {"scores": [3.0, None], "model": "fp"}
+
+
+def test_window_counts_are_per_entity_and_expire(monkeypatch):
+    b = _batcher(monkeypatch)
+    score_request(b, {"events": [_failed("2025-10-01T00:00:00Z")]})
+    other = score_request(b, {"events": [_failed("2025-10-01T00:00:30Z", user="u2")]})
+    later = score_request(b, {"events": [_failed("2025-10-01T00:30:00Z")]})
+    # cột của user.name ghi đè cột của host.name (như featurize_ecs)
+    assert other["scores"] == [1.0]
+    assert later["scores"] == [1.0]
+
+
+def test_feature_rows_keep_order(monkeypatch):
+    b = _batcher(monkeypatch)
+    out = score_request(b, {"features": [{COL: 3}, {COL: 1}, {}]})
+    assert np.allclose(out["scores"], [3.0, 1.0, 0.0])
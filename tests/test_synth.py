@@ -0,0 +1,16 @@
+import pytest
+
+from pipeline.synth import generate
+
+
+def test_auth_span_across_year_boundary_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="SYSLOG_DEFAULT_YEAR"):
+        generate(tmp_path, events=1000, hosts=5, users=5, days=3, start="2025-12-30T00:00:00Z")
+
+
+def test_syslog_year_reported(tmp_path):
+    res = generate(tmp_path, events=1000, hosts=5, users=5, days=2, start="2025-12-30T00:00:00Z")
+    assert res["syslog_year"] == 2025
+    mix = {"zeek_conn": 1.0}
+    res = generate(tmp_path, events=1000, hosts=5, users=5, days=3, start="2025-12-30T00:00:00Z", mix=mix)
+    assert res["syslog_year"] is None
@@ -0,0 +1,40 @@
+import numpy as np
+
+from explain.thresholding import ScoreSketch, SketchSet, _WIDTH
+
+
+def _bimodal(n_low: int, n_high: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    low = rng.normal(-0.5, 0.02, n_low)
+    high = rng.normal(0.5, 0.05, n_high)
+    return np.clip(np.r_[low, high], -1.0, 1.0)
+
+
+def test_quantile_never_above_exact_on_sparse_bimodal_data():
+    for seed in range(20):
+        x = _bimodal(97, 7 + seed, seed)
+        sk = ScoreSketch().add(x)
+        xs = np.sort(x)
+        for q in (0.5, 0.9, 0.93, 0.95, 0.975, 0.99):
+            approx, exact = sk.quantile(q), float(np.quantile(x, q))
+            assert approx <= exact + 1e-12, (seed, q, approx, exact)
+            assert approx >= xs[int(np.floor(q * (len(x) - 1)))] - _WIDTH
+
+
+def test_quantile_of_merged_partitions_matches_single_sketch():
+    x = _bimodal(5000, 300, 1)
+    whole = ScoreSketch().add(x)
+    merged = ScoreSketch()
+    for part in np.array_split(x, 7):
+        merged.merge(ScoreSketch().add(part))
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_entity_quantiles_never_above_exact():
+    x = _bimodal(400, 25, 2)
+    hosts = np.where(np.arange(len(x)) % 3 == 0, "noisy", "quiet")
+    sk = SketchSet.from_dict(SketchSet().add(x, {"host.name": hosts}).to_dict())
+    for host in ("noisy", "quiet"):
+        exact = float(np.quantile(x[hosts == host], 0.95))
+        assert sk.entities["host.name"][host].quantile(0.95) <= exact + 1e-12
@@ -0,0 +1,247 @@
+"""Lớp dữ liệu dùng chung cho các trang Streamlit (Tiếng Việt)
+
+- Mọi lần đọc được cache bằng st.cache_data / st.cache_resource với khoá gồm (mtime_ns, size) của
+  file nguồn: rerun và các session khác dùng lại kết quả, file được ghi lại thì khoá đổi và tự đọc lại
+- Chỉ đọc các cột trang cần (projection); @timestamp chuẩn hoá UTC và host/user rỗng = "unknown"
+  một lần lúc nạp, không làm lại ở mỗi lần tương tác
+- Alert (select_alerts), SHAP của alert, model và ngữ cảnh ECS ±phút được cache theo
+  điểm / model / file lake tương ứng: đổi alert hay host đang chọn chỉ là tra cache
+- Bundle của alert: incident_{i}.zip theo incidents.json của pipeline, alert_{i}.zip nếu tạo theo yêu cầu
+- Timeline đọc rollup (pipeline.rollup) hợp với khoảng đang xem, cache theo các file rollup_*.parquet
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+
+from models.utils import get_paths
+
+SCORE_COL = "anom.score"
+FILL_UNKNOWN = ["host.name", "user.name"]
+OVERVIEW_COLS = ("@timestamp", SCORE_COL)
+HOST_COLS = ("@timestamp", "host.name", "user.name", "source.ip", "destination.ip", SCORE_COL)
+ALERT_COLS = ["@timestamp", "host.name", "user.name", "source.ip", "destination.ip"]
+
+Stamp = Tuple[int, int]
+
+
+def file_stamp(path: Path) -> Stamp:
+    """(mtime_ns, size) của file; (0, 0) nếu chưa có."""
+    try:
+        s = Path(path).stat()
+    except OSError:
+        return 0, 0
+    return s.st_mtime_ns, s.st_size
+
+
+def scores_file() -> Path:
+    return Path(get_paths()["scores_dir"]) / "scores.parquet"
+
+
+def scores_stamp() -> Tuple[Stamp, Stamp, Stamp]:
+    # build_score_index ghi lại cả ba file mỗi khi có partition được chấm lại
+    root = scores_file().parent
+    return file_stamp(root / "scores.parquet"), file_stamp(root / "scores_topk.parquet"), file_stamp(root / "sketch.json")
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    if "@timestamp" in df.columns:
+        df["@timestamp"] = pd.to_datetime(df["@timestamp"], utc=True, errors="coerce")
+    for col in FILL_UNKNOWN:
+        if col in df.columns:
+            df[col] = df[col].astype(object).where(df[col].notna(), "unknown")
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _read_scores(path: str, stamp: Stamp, columns: Tuple[str, ...]) -> pd.DataFrame:
+    present = set(pq.read_schema(path).names)
+    df = pd.read_parquet(path, columns=[c for c in columns if c in present])
+    for c in columns:
+        if c not in df.columns:
+            df[c] = None
+    df = _normalize(df)
+    if "@timestamp" in df.columns:
+        df = df.sort_values("@timestamp", kind="stable").reset_index(drop=True)
+    return df
+
+
+def load_scores(columns: Sequence[str] = OVERVIEW_COLS) -> pd.DataFrame:
+    """Các cột `columns` của scores.parquet, sắp theo @timestamp (rỗng nếu chưa chấm điểm)."""
+    p = scores_file()
+    if not p.exists():
+        return pd.DataFrame(columns=list(columns))
+    return _read_scores(str(p), file_stamp(p), tuple(columns))
+
+
+def rollup_stamp() -> Tuple[Stamp, ...]:
+    # build_rollups ghi lại rollup_1h / rollup_1d mỗi khi có partition được tính lại
+    root = scores_file().parent
+    return tuple(file_stamp(root / f"rollup_{res}.parquet") for res in ("1min", "1h", "1d"))
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _rollup_info(stamp: Tuple) -> Optional[Tuple[pd.Timestamp, pd.Timestamp, int]]:
+    from pipeline.rollup import GLOBAL_KEY, HOST_COL, merged_path, rollup_extent
+
+    extent = rollup_extent()
+    if extent is None:
+        return None
+    day = pd.read_parquet(merged_path(scores_file().parent, "1d"), columns=[HOST_COL, "count"],
+                          filters=[(HOST_COL, "=", GLOBAL_KEY)])
+    return extent[0], extent[1], int(day["count"].sum())
+
+
+def rollup_info() -> Optional[Tuple[pd.Timestamp, pd.Timestamp, int]]:
+    """(đầu, cuối, tổng số sự kiện) theo rollup; None nếu chưa chạy rollup."""
+    return _rollup_info(rollup_stamp())
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _timeline(stamp: Tuple, start, end, host: Optional[str], max_points: int) -> Tuple[pd.DataFrame, str]:
+    from pipeline.rollup import query_rollup
+
+    df = query_rollup(start, end, host=host, max_points=max_points)
+    return df, df.attrs.get("resolution", "")
+
+
+def load_timeline(start=None, end=None, host: Optional[str] = None,
+                  max_points: Optional[int] = None) -> Tuple[pd.DataFrame, str]:
+    """(bucket count/max/p95/mean, độ phân giải) của host (None: toàn cục) trong [start, end]."""
+    from pipeline.rollup import MAX_POINTS
+
+    return _timeline(rollup_stamp(), start, end, host, int(max_points or MAX_POINTS))
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _host_list(path: str, stamp: Stamp) -> List[str]:
+    df = _read_scores(path, stamp, HOST_COLS)
+    return sorted(df["host.name"].astype(str).unique().tolist())
+
+
+def host_list() -> List[str]:
+    p = scores_file()
+    return _host_list(str(p), file_stamp(p)) if p.exists() else []
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _host_scores(path: str, stamp: Stamp, host: str) -> pd.DataFrame:
+    df = _read_scores(path, stamp, HOST_COLS)
+    return df[df["host.name"] == host].reset_index(drop=True)
+
+
+def host_scores(host: str) -> pd.DataFrame:
+    """Điểm của một host (cột HOST_COLS), sắp theo thời gian."""
+    p = scores_file()
+    if not p.exists():
+        return pd.DataFrame(columns=list(HOST_COLS))
+    return _host_scores(str(p), file_stamp(p), host)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _sketch_hosts(root: str, stamp: Stamp) -> List[str]:
+    from explain.thresholding import load_sketch
+
+    sketch = load_sketch(Path(root))
+    return sorted(sketch.entities.get("host.name", {})) if sketch is not None else []
+
+
+def sketch_hosts() -> List[str]:
+    """Danh sách host từ sketch.json (không đọc điểm)."""
+    root = scores_file().parent
+    return _sketch_hosts(str(root), file_stamp(root / "sketch.json"))
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _alerts(path: str, stamp: Tuple, start, end, hosts: Tuple[str, ...]) -> Tuple[pd.DataFrame, float]:
+    from pipeline.alerting import select_alerts
+
+    top, thr = select_alerts(path, start=start, end=end, hosts=list(hosts) or None)
+    if not top.empty:
+        for col in ALERT_COLS:
+            if col not in top.columns:
+                top[col] = None
+        top = _normalize(top.reset_index(drop=True))
+    return top, thr
+
+
+def load_alerts(start=None, end=None, hosts: Optional[Iterable[str]] = None) -> Tuple[pd.DataFrame, float]:
+    """(top alert, ngưỡng) như select_alerts, cache theo scores + bộ lọc."""
+    return _alerts(str(scores_file()), scores_stamp(), start, end, tuple(sorted(hosts or ())))
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _model(fingerprint: str) -> Dict:
+    from models.model_store import load_model_payload
+
+    return load_model_payload()
+
+
+def load_model() -> Tuple[Dict, str]:
+    """(payload, fingerprint) của model hiện tại; chỉ nạp lại khi file model đổi."""
+    from models.model_store import model_fingerprint
+
+    fp = model_fingerprint()
+    return _model(fp), fp
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _explain(path: str, stamp: Tuple, start, end, hosts: Tuple[str, ...], fingerprint: str,
+             top_k: int) -> List[Dict]:
+    from explain.shap_explain import explain_rows
+
+    top, _ = _alerts(path, stamp, start, end, hosts)
+    payload = _model(fingerprint)
+    return explain_rows(top, top_k=top_k, payload=payload, fingerprint=fingerprint)
+
+
+def explain_alerts(start=None, end=None, hosts: Optional[Iterable[str]] = None, top_k: int = 5) -> List[Dict]:
+    """Giải thích của load_alerts(start, end, hosts) theo thứ tự dòng; tính lại khi điểm hoặc model đổi."""
+    _, fp = load_model()
+    return _explain(str(scores_file()), scores_stamp(), start, end, tuple(sorted(hosts or ())), fp, top_k)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _incident_index(path: str, stamp: Stamp) -> Dict[str, str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("alerts", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def alert_bundle(alert: pd.Series, idx: int) -> Optional[Path]:
+    """
+    Bundle của alert: incident_{i}.zip chứa alert (theo incidents.json do pipeline ghi),
+    không có thì alert_{idx}.zip tạo theo yêu cầu từ trang Alerts; None nếu chưa có bundle nào.
+    """
+    from pipeline.bundle import INCIDENT_INDEX
+    from pipeline.incidents import alert_key
+
+    root = Path(get_paths()["bundles_dir"])
+    name = _incident_index(str(root / INCIDENT_INDEX), file_stamp(root / INCIDENT_INDEX)).get(alert_key(alert))
+    for p in ([root / name] if name else []) + [root / f"alert_{idx}.zip"]:
+        if p.exists():
+            return p
+    return None
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _context(t0: pd.Timestamp, minutes: float, limit: Optional[int], stamps: Tuple) -> pd.DataFrame:
+    from pipeline.context import context_window
+
+    return context_window(t0, minutes=minutes, limit=limit)
+
+
+def load_context(t0, minutes: float = 5, limit: Optional[int] = 200) -> pd.DataFrame:
+    """Ngữ cảnh ECS ±minutes quanh t0; cache theo các file lake giao cửa sổ."""
+    from pipeline.context import context_files
+
+    t0 = pd.Timestamp(t0)
+    w = pd.Timedelta(minutes=minutes)
+    files = context_files(t0 - w, t0 + w)
+    return _context(t0, minutes, limit, tuple((str(p), file_stamp(p)) for p in files))
@@ -7,19 +7,15 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 import os
-import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
 from pathlib import Path
 from datetime import datetime
 
-from models.utils import get_paths
+from ui.data import OVERVIEW_COLS, load_scores, load_timeline, rollup_info, scores_file
 
 st.title("Overview")
 
-paths = get_paths()
-
-scores_path = Path(paths["scores_dir"]) / "scores.parquet"
+scores_path = scores_file()
 
 colA, colB = st.columns(2)
 with colA:
@@ -33,13 +29,32 @@ with colB:
 if not scores_path.exists():
     st.warning("Scores not found. Run the demo pipeline first.")
 else:
-    df = pd.read_parquet(scores_path)
-    st.metric("Events processed", len(df))
+    # timeline đọc rollup hợp với khoảng đang xem: số điểm vẽ theo độ rộng biểu đồ, không theo số dòng
+    info = rollup_info()
+    if info is None:
+        from pipeline.rollup import downsample_peaks
+
+        df = load_scores(OVERVIEW_COLS)
+        st.metric("Events processed", len(df))
+        st.caption("Chưa có rollup (python -m cli.anom_score rollup): vẽ từ scores.parquet.")
+        series, res = downsample_peaks(df, value="anom.score").rename(columns={"anom.score": "max"}), "raw"
+    else:
+        lo, hi, total = info
+        st.metric("Events processed", total)
+        start, end = st.slider("Time range (UTC)", min_value=lo.tz_localize(None).to_pydatetime(),
+                               max_value=hi.tz_localize(None).to_pydatetime(),
+                               value=(lo.tz_localize(None).to_pydatetime(), hi.tz_localize(None).to_pydatetime()))
+        series, res = load_timeline(start, end)
+
+    import matplotlib.pyplot as plt  # chỉ nạp khi có dữ liệu để vẽ
 
     fig, ax = plt.subplots(figsize=(10, 3))
-    df_sorted = df.sort_values("@timestamp")
-    ax.plot(pd.to_datetime(df_sorted["@timestamp"]), df_sorted["anom.score"], marker='o', linestyle='-')
-    ax.set_title("Anomaly Score Timeline")
+    ax.plot(series["@timestamp"], series["max"], linewidth=1, label="max")
+    for col in ("p95", "mean"):
+        if col in series.columns:
+            ax.plot(series["@timestamp"], series[col], linewidth=1, label=col)
+    ax.legend(loc="upper right")
+    ax.set_title(f"Anomaly Score Timeline ({res})")
     ax.set_ylabel("Score")
     ax.set_xlabel("Time")
     st.pyplot(fig)
@@ -7,17 +7,14 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 import os
-import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
 from datetime import datetime
 
-from models.utils import get_paths
+from ui.data import host_list, host_scores, load_timeline, rollup_info, scores_file
 
 st.title("Hosts")
-paths = get_paths()
 
-scores_path = Path(paths["scores_dir"]) / "scores.parquet"
+scores_path = scores_file()
 colA, colB = st.columns(2)
 with colA:
     if st.button("Reload data"):
@@ -30,21 +27,34 @@ with colB:
 if not scores_path.exists():
     st.warning("Scores not found. Run the demo pipeline first.")
 else:
-    df = pd.read_parquet(scores_path)
-    # NEW: chuẩn hóa thời gian + điền host/user rỗng = "unknown"
-    df["@timestamp"] = pd.to_datetime(df["@timestamp"], utc=True, errors="coerce")
-    df["host.name"] = df.get("host.name").fillna("unknown")
-    df["user.name"] = df.get("user.name").fillna("unknown")
-
-    hosts = sorted(df["host.name"].unique().tolist())
+    # thời gian đã chuẩn hóa UTC, host/user rỗng = "unknown" (ui.data, cache theo mtime)
+    hosts = host_list()
     host = st.selectbox("Select host", hosts or ["unknown"])
 
     if hosts:
-        dff = df[df["host.name"] == host].sort_values("@timestamp")
-        if not dff.empty:
+        dff = host_scores(host)
+        # timeline đọc rollup theo host hợp với khoảng đang xem (chưa có rollup: mẫu scores.parquet)
+        info = rollup_info()
+        if info is None:
+            from pipeline.rollup import downsample_peaks
+
+            series, res = downsample_peaks(dff, value="anom.score").rename(columns={"anom.score": "max"}), "raw"
+        else:
+            lo, hi, _ = info
+            start, end = st.slider("Time range (UTC)", min_value=lo.tz_localize(None).to_pydatetime(),
+                                   max_value=hi.tz_localize(None).to_pydatetime(),
+                                   value=(lo.tz_localize(None).to_pydatetime(), hi.tz_localize(None).to_pydatetime()))
+            series, res = load_timeline(start, end, host=host)
+        if not series.empty:
+            import matplotlib.pyplot as plt  # chỉ nạp khi có dữ liệu để vẽ
+
             fig, ax = plt.subplots(figsize=(10, 3))
-            ax.plot(pd.to_datetime(dff["@timestamp"]), dff["anom.score"], marker='o', linestyle='-')
-            ax.set_title(f"Anomaly Scores for {host}")
+            ax.plot(series["@timestamp"], series["max"], linewidth=1, label="max")
+            for col in ("p95", "mean"):
+                if col in series.columns:
+                    ax.plot(series["@timestamp"], series[col], linewidth=1, label=col)
+            ax.legend(loc="upper right")
+            ax.set_title(f"Anomaly Scores for {host} ({res})")
             ax.set_ylabel("Score")
             ax.set_xlabel("Time")
             st.pyplot(fig)
@@ -9,16 +9,11 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 import os
-import joblib
-import matplotlib.pyplot as plt
-import pandas as pd
 import streamlit as st
 from datetime import datetime
 
 from models.utils import get_paths
-from pipeline.alerting import select_alerts
-from pipeline.bundle import build_bundle_for_alert
-from explain.shap_explain import top_shap_for_rows
+from ui.data import alert_bundle, explain_alerts, load_alerts, load_context, scores_file, sketch_hosts
 
 st.title("Alerts")
 paths = get_paths()
@@ -40,7 +35,7 @@ def _load_ai_from_bundle(bundle_zip: Path):
         st.warning(f"Không đọc được bundle: {e}")
     return data, md
 
-scores_path = Path(paths["scores_dir"]) / "scores.parquet"
+scores_path = scores_file()
 colA, colB = st.columns(2)
 with colA:
     if st.button("Reload data"):
@@ -54,22 +49,20 @@ if not scores_path.exists():
     st.warning("Chưa có điểm bất thường. Chạy pipeline trước (ingest/featurize/train/score).")
     st.stop()
 
-# Chọn các alert
+# Bộ lọc: khoảng ngày + host (danh sách host lấy từ sketch, không đọc điểm)
+with st.expander("Bộ lọc"):
+    use_range = st.checkbox("Lọc theo ngày", value=False)
+    date_range = st.date_input("Khoảng ngày", value=()) if use_range else ()
+    hosts = st.multiselect("Host", sketch_hosts())
+start, end = (date_range[0], date_range[-1]) if len(date_range) else (None, None)
+
+# Chọn các alert (cache theo scores + bộ lọc; thời gian UTC, host/user trống = 'unknown')
 try:
-    top, thr = select_alerts(str(scores_path))
+    top, thr = load_alerts(start, end, hosts)
 except Exception as e:
     st.error(f"Lỗi chọn alerts: {e}")
     st.stop()
 
-# NEW: chuẩn hóa thời gian + điền host/user trống = 'unknown'
-if not top.empty:
-    top["@timestamp"] = pd.to_datetime(top["@timestamp"], utc=True, errors="coerce")
-    for col in ["host.name", "user.name", "source.ip", "destination.ip"]:
-        if col not in top.columns:
-            top[col] = None
-    top["host.name"] = top["host.name"].fillna("unknown")
-    top["user.name"] = top["user.name"].fillna("unknown")
-
 st.caption(f"Threshold: {thr:.4f}")
 if top.empty:
     st.info("Chưa có alert vượt ngưỡng.")
@@ -86,14 +79,11 @@ row = top.iloc[int(idx)]
 # SHAP top features
 st.subheader("Top SHAP Features")
 names, vals = [], []
+shap_all = None
 try:
-    payload = joblib.load(Path(paths["models_dir"]) / "isolation_forest.joblib")
-    model = payload["model"] if isinstance(payload, dict) and "model" in payload else payload
-    feature_cols = payload.get("feature_cols") if isinstance(payload, dict) else None
-    if not feature_cols:
-        feature_cols = [c for c in row.index if isinstance(row[c], (int, float))]
-    X = row[feature_cols].fillna(0.0).to_frame().T
-    shap_info = top_shap_for_rows(model, X.values, feature_cols, top_k=5)[0]
+    # một lần gọi explainer cho toàn bộ alert; tính lại khi model hoặc danh sách alert đổi
+    shap_all = explain_alerts(start, end, hosts)
+    shap_info = shap_all[int(idx)]
     feats = shap_info.get("top_features", [])
     names = [f.get("feature", "") for f in feats]
     vals = [f.get("value", 0.0) for f in feats]
@@ -101,6 +91,8 @@ except Exception as e:
     st.caption(f"Không tính được SHAP: {e}")
 
 if names:
+    import matplotlib.pyplot as plt  # chỉ nạp khi có dữ liệu để vẽ
+
     fig, ax = plt.subplots(figsize=(6, 3))
     ax.bar(names, vals)
     ax.set_ylabel("SHAP value")
@@ -111,18 +103,12 @@ else:
 
 # Ngữ cảnh thô ±5 phút quanh alert
 st.subheader("Raw context (±5 phút)")
-ecs_dir = Path(paths["ecs_parquet_dir"])
-parts = list(ecs_dir.rglob("*.parquet"))
 try:
-    if parts:
-        ecs_df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
-        ecs_df["@timestamp"] = pd.to_datetime(ecs_df["@timestamp"], utc=True, errors="coerce")
-        t0 = pd.to_datetime(row["@timestamp"], utc=True)
-        mask = (ecs_df["@timestamp"] >= t0 - pd.Timedelta(minutes=5)) & (ecs_df["@timestamp"] <= t0 + pd.Timedelta(minutes=5))
-        ctx = ecs_df.loc[mask].sort_values("@timestamp").head(200)
+    ctx = load_context(row["@timestamp"], minutes=5, limit=200)
+    if not ctx.empty:
         st.dataframe(ctx, use_container_width=True)
     else:
-        st.caption("Không tìm thấy dữ liệu ECS.")
+        st.caption("Không tìm thấy dữ liệu ECS trong cửa sổ.")
 except Exception as e:
     st.warning(f"Không tải được ngữ cảnh: {e}")
 
@@ -130,13 +116,18 @@ except Exception as e:
 st.subheader("Forensic Bundle")
 if st.button("Tạo bundle cho alert đang chọn"):
     try:
-        bundle_path = build_bundle_for_alert(row, int(idx) + 1, thr)
+        from pipeline.bundle import build_bundle_for_alert
+
+        bundle_path = build_bundle_for_alert(row, int(idx) + 1, thr, shap_top=shap_all[int(idx)] if shap_all else None)
         st.success(f"Bundle created: {bundle_path}")
     except Exception as e:
         st.error(f"Lỗi tạo bundle: {e}")
 
-bundle_candidate = Path(paths["bundles_dir"]) / f"alert_{int(idx) + 1}.zip"
-if bundle_candidate.exists():
+# bundle của incident chứa alert (pipeline), nếu không có thì bundle tạo theo yêu cầu ở trên
+bundle_candidate = alert_bundle(row, int(idx) + 1)
+if bundle_candidate is not None:
+    if bundle_candidate.name.startswith("incident_"):
+        st.caption(f"Alert thuộc incident trong {bundle_candidate.name}")
     with open(bundle_candidate, "rb") as f:
         st.download_button("Tải bundle", data=f, file_name=bundle_candidate.name, mime="application/zip")
     st.divider()